@@ -0,0 +1,109 @@
+"""
+Compare the native TextChunker with LangChain's RecursiveCharacterTextSplitter.
+
+Splits the same text with both at the same size and overlap, and reports
+throughput (MB/s of input text), chunk count and mean chunk length, plus the
+native/LangChain chunk-count ratio as a parity check. The default corpus is
+synthetic prose (sentences, line breaks and paragraphs); pass --text-file or
+--pdf to split real documents (PDFs are split page by page, as at ingest).
+With --unit tokens both split by cl100k_base tokens, which needs tiktoken and
+its encoding file.
+
+Usage (from backend/):
+    python -m benchmarks.chunker_throughput --mb 8 --size 1000 --overlap 200
+    python -m benchmarks.chunker_throughput --pdf manual.pdf
+    python -m benchmarks.chunker_throughput --unit tokens --size 256 --overlap 32
+"""
+
+import argparse
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from services.embedding_scheduler import get_encoder
+from services.pdf_service import PDFService
+from services.text_chunker import TextChunker
+
+
+def _synthetic_corpus(megabytes: float, seed: int = 0) -> List[str]:
+    """Pages of random prose with sentences, line breaks and paragraphs."""
+    rng = np.random.default_rng(seed)
+    vocabulary = [
+        "".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz"), size=length))
+        for length in rng.integers(2, 11, 5000)
+    ]
+    pages, page, size = [], [], 0
+    while size < megabytes * 1e6:
+        sentence = " ".join(rng.choice(vocabulary, size=rng.integers(5, 25))).capitalize()
+        sentence += rng.choice([". ", ". ", ". ", "? ", ".\n", ".\n\n"])
+        page.append(sentence)
+        size += len(sentence)
+        if len(page) == 40:
+            pages.append("".join(page))
+            page = []
+    if page:
+        pages.append("".join(page))
+    return pages
+
+
+def _measure(split: Callable[[str], List[str]], pages: List[str], repeat: int):
+    """(MB/s, chunk count, mean chunk characters) over the best of ``repeat`` runs."""
+    megabytes = sum(len(page.encode("utf-8")) for page in pages) / 1e6
+    best, chunks = float("inf"), []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [chunk for page in pages for chunk in split(page)]
+        best = min(best, time.perf_counter() - start)
+    mean = sum(len(chunk) for chunk in chunks) / max(len(chunks), 1)
+    return megabytes / best, len(chunks), mean
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=float, default=8.0)
+    parser.add_argument("--text-file", default=None)
+    parser.add_argument("--pdf", default=None)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--unit", choices=["chars", "tokens"], default="chars")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pages = [text for _, text in PDFService.iter_pages(f)]
+    elif args.text_file:
+        with open(args.text_file, "r", encoding="utf-8") as f:
+            pages = [f.read()]
+    else:
+        pages = _synthetic_corpus(args.mb)
+
+    if args.unit == "tokens":
+        if get_encoder() is None:
+            sys.exit("--unit tokens needs tiktoken and the cl100k_base encoding")
+        langchain = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name="cl100k_base", chunk_size=args.size, chunk_overlap=args.overlap
+        )
+    else:
+        langchain = RecursiveCharacterTextSplitter(
+            chunk_size=args.size, chunk_overlap=args.overlap
+        )
+    native = TextChunker(args.size, args.overlap, unit=args.unit)
+
+    results = {
+        "langchain": _measure(langchain.split_text, pages, args.repeat),
+        "native": _measure(native.split_text, pages, args.repeat),
+    }
+    print(f"{'splitter':<10} {'MB/s':>8} {'chunks':>8} {'mean chars':>11}")
+    for name, (throughput, count, mean) in results.items():
+        print(f"{name:<10} {throughput:>8.2f} {count:>8} {mean:>11.1f}")
+    speedup = results["native"][0] / results["langchain"][0]
+    parity = results["native"][1] / max(results["langchain"][1], 1)
+    print(f"speed-up x{speedup:.1f}, chunk-count ratio {parity:.3f}")
+
+
+if __name__ == "__main__":
+    main()
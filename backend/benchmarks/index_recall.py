@@ -0,0 +1,66 @@
+"""
+Compare FAISS index types against the exact flat baseline.
+
+Reports recall@k, on-disk size and query latency for each index type on a
+synthetic corpus shaped like text-embedding-3-large output.
+
+Usage (from backend/):
+    python -m benchmarks.index_recall --vectors 20000 --dim 3072 --k 10
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from vector_store.index_factory import INDEX_TYPES, build_index, choose_index_type, recall_at_k
+
+
+def _synthetic_corpus(num_vectors: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered, L2-normalised vectors — closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, num_vectors // 50), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), num_vectors)
+    vectors = centers[assignments] + 0.3 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = _synthetic_corpus(args.vectors, args.dim)
+    queries = vectors[: args.queries] + 0.05 * np.random.default_rng(1).standard_normal(
+        (args.queries, args.dim)
+    ).astype(np.float32)
+
+    print(f"{'type':<8} {'recall@k':>9} {'size MB':>9} {'build s':>8} {'query ms':>9}")
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.index")
+            faiss.write_index(index, path)
+            size_mb = os.path.getsize(path) / 1e6
+
+        start = time.perf_counter()
+        index.search(queries, args.k)
+        query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recall = recall_at_k(vectors, queries, index, args.k)
+        label = choose_index_type(len(vectors), index_type)
+        print(f"{label:<8} {recall:>9.3f} {size_mb:>9.1f} {build_seconds:>8.2f} {query_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
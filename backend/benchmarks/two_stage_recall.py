@@ -0,0 +1,88 @@
+"""
+Compare two-stage (truncated first stage + full rerank) search with full-vector search.
+
+For each first-stage dimension, reports recall@k against the exact full-vector
+top-k, first-stage index size and per-query latency, with and without the
+rerank. The synthetic corpus concentrates energy in the leading dimensions
+the way Matryoshka-trained embeddings do; pass --vectors-file with real
+text-embedding-3-large output (an (n, 3072) .npy array) for a faithful check.
+
+Usage (from backend/):
+    python -m benchmarks.two_stage_recall --vectors 20000 --dims 256 512 --k 10
+    python -m benchmarks.two_stage_recall --vectors-file embeddings.npy
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from core.config import settings
+from vector_store.faiss_index import FAISSIndex
+
+
+def _matryoshka_corpus(num_vectors: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered, L2-normalised vectors whose per-dimension scale decays with position."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, num_vectors // 50), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), num_vectors)
+    vectors = centers[assignments] + 0.3 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    vectors *= (1.0 / np.sqrt(np.arange(1, dim + 1, dtype=np.float32)))[None, :]
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _run(vectors: np.ndarray, queries: np.ndarray, k: int, first_stage_dim: int, oversample: int):
+    """Index ``vectors`` with the given settings; return (ids, index MB, query ms)."""
+    settings.FAISS_FIRST_STAGE_DIM = first_stage_dim
+    settings.FAISS_RERANK_OVERSAMPLE = oversample
+    with tempfile.TemporaryDirectory() as tmp:
+        index = FAISSIndex(index_dir=tmp, dimension=vectors.shape[1], search_url="")
+        index.add_embeddings("bench", vectors, [{} for _ in range(len(vectors))])
+        size_mb = os.path.getsize(index._index_path("bench")) / 1e6
+
+        index.search_batch("bench", queries[:1], k)  # load into the cache
+        start = time.perf_counter()
+        batch = index.search_batch("bench", queries, k)
+        query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return [[r["chunk_id"] for r in results] for results in batch], size_mb, query_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--vectors-file", default=None)
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 512])
+    parser.add_argument("--oversample", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file).astype(np.float32)
+    else:
+        vectors = _matryoshka_corpus(args.vectors, args.dim)
+    queries = vectors[: args.queries] + 0.05 * np.random.default_rng(1).standard_normal(
+        (args.queries, vectors.shape[1])
+    ).astype(np.float32)
+
+    settings.FAISS_INDEX_TYPE = "flat"
+    expected, full_mb, full_ms = _run(vectors, queries, args.k, 0, 1)
+
+    def recall(actual):
+        hits = sum(len(set(e) & set(a)) for e, a in zip(expected, actual))
+        return hits / float(sum(len(e) for e in expected))
+
+    print(f"{'stage 1':<12} {'rerank':>7} {'recall@k':>9} {'index MB':>9} {'query ms':>9}")
+    print(f"{vectors.shape[1]:<12} {'-':>7} {1.0:>9.3f} {full_mb:>9.1f} {full_ms:>9.3f}")
+    for dim in args.dims:
+        for oversample, label in ((1, "no"), (args.oversample, f"x{args.oversample}")):
+            actual, size_mb, query_ms = _run(vectors, queries, args.k, dim, oversample)
+            print(f"{dim:<12} {label:>7} {recall(actual):>9.3f} {size_mb:>9.1f} {query_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
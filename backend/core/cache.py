@@ -75,6 +75,32 @@ class CacheService:
         async with self._lock:
             self._memory_cache[key] = (time.time() + ttl_seconds, payload)
 
+    async def delete(self, key: str) -> None:
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                await redis.delete(key)
+            except Exception:
+                pass
+
+        async with self._lock:
+            self._memory_cache.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        """Delete every key starting with ``prefix`` (which must not contain glob characters)."""
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                keys = [key async for key in redis.scan_iter(match=f"{prefix}*", count=500)]
+                if keys:
+                    await redis.delete(*keys)
+            except Exception:
+                pass
+
+        async with self._lock:
+            for key in [key for key in self._memory_cache if key.startswith(prefix)]:
+                self._memory_cache.pop(key, None)
+
     async def clear(self) -> None:
         async with self._lock:
             self._memory_cache.clear()
@@ -18,6 +18,8 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str = "minioadmin"
     MINIO_BUCKET: str = "kagaz-files"
     MINIO_USE_SSL: bool = False
+    STORAGE_SPOOL_MAX_BYTES: int = 64 * 1024 * 1024  # downloads larger than this spill to disk
+    EXTRACTED_TEXT_PREFIX: str = "extracted-text"  # PDF text kept at ingest
 
     # Azure OpenAI - Chat
     AZURE_OPENAI_API_KEY: str = ""
@@ -32,6 +34,12 @@ class Settings(BaseSettings):
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT: str = "text-embedding-3-large"
     AZURE_OPENAI_EMBEDDING_API_VERSION: str = "2024-12-01-preview"
 
+    # Embedding provider: "azure_openai", "sentence_transformers" (local CPU) or "hashing"
+    EMBEDDING_PROVIDER: str = "azure_openai"
+    # Output size for azure_openai (text-embedding-3 only) and hashing; 0 = default
+    EMBEDDING_DIMENSIONS: int = 0
+    LOCAL_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+
     # Legacy (kept for transcription service)
     OPENAI_API_KEY: str = ""
 
@@ -44,6 +52,39 @@ class Settings(BaseSettings):
     CACHE_TTL_SUMMARY_SECONDS: int = 1800
     CACHE_TTL_SEARCH_SECONDS: int = 600
 
+    # Embedding cache (chunk vectors by content hash)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./embedding_cache"
+    EMBEDDING_CACHE_DTYPE: str = "float16"  # float16 | float32
+    EMBEDDING_CACHE_TTL_SECONDS: int = 30 * 24 * 3600  # Redis tier only
+    QUERY_EMBED_CACHE_MAX_ENTRIES: int = 2048
+    QUERY_EMBED_CACHE_TTL_SECONDS: int = 24 * 3600
+
+    # Ingest embedding requests
+    EMBEDDING_BATCH_MAX_TOKENS: int = 64_000
+    EMBEDDING_BATCH_MAX_ITEMS: int = 2048
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_TOKENS_PER_MINUTE: int = 350_000  # the deployment's TPM quota
+    EMBEDDING_MAX_ATTEMPTS: int = 6
+
+    # Chunking
+    TEXT_SPLITTER: str = "langchain"  # langchain (RecursiveCharacterTextSplitter) | native
+    CHUNK_SIZE: int = 1000
+    CHUNK_OVERLAP: int = 200
+    CHUNK_UNIT: str = "chars"  # chars | tokens (the embedding model's tokenizer; native only)
+
+    # Search
+    SEARCH_BATCH_MAX_QUERIES: int = 64
+    SEARCH_HYBRID: bool = False  # fuse BM25 keyword and vector results (score becomes RRF)
+    SEARCH_HYBRID_CANDIDATES: int = 20
+    SEARCH_RRF_K: int = 60
+    SEARCH_EMBED_TIMEOUT_SECONDS: float = 5.0
+    SEARCH_MMR_LAMBDA: float = 0.5  # 1.0 = relevance only, lower = more diverse
+    SEARCH_MMR_OVERSAMPLE: int = 4
+    CHAT_MMR_ENABLED: bool = True
+    SEARCH_MAX_NEIGHBORS: int = 3
+    CHAT_CONTEXT_NEIGHBORS: int = 1  # chunks added on each side of a chat hit
+
     # API key auth (machine-to-machine access)
     API_KEYS: List[str] = []
 
@@ -65,10 +106,44 @@ class Settings(BaseSettings):
 
     # FAISS
     FAISS_INDEX_PATH: str = "./faiss_indices"
+    FAISS_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    FAISS_CACHE_MAX_ENTRIES: int = 128
+    FAISS_MMAP: bool = True
+    FAISS_INDEX_TYPE: str = "auto"  # auto | flat | fp16 | sq8 | ivfpq
+    FAISS_FLAT_MAX_VECTORS: int = 2000
+    FAISS_QUANTIZED_INDEX_TYPE: str = "sq8"
+    FAISS_PQ_M: int = 64
+    FAISS_IVF_NPROBE: int = 16
+    FAISS_SEARCH_WORKERS: int = 8
+    FAISS_SHARD_TIMEOUT_SECONDS: float = 2.0
+    FAISS_LAYOUT: str = "per_file"  # per_file | user_shard
+    FAISS_SHARD_COMPACT_RATIO: float = 0.2
+    FAISS_FIRST_STAGE_DIM: int = 0  # 0 = full vectors; 256 / 512 = two-stage search
+    FAISS_RERANK_OVERSAMPLE: int = 4
+    RETRIEVAL_EXECUTOR_WORKERS: int = 4
+    FAISS_PREWARM_ON_STARTUP: bool = True
+    FAISS_PREWARM_MAX_BYTES: int = 256 * 1024 * 1024
+    FAISS_WARM_ON_OPEN: bool = True
+
+    # FAISS object-storage tier (MinIO as source of truth, local dir as cache)
+    FAISS_REMOTE_TIER: bool = False
+    FAISS_REMOTE_PREFIX: str = "faiss-indices"
+    FAISS_LOCAL_DISK_MAX_BYTES: int = 10 * 1024 * 1024 * 1024
+    FAISS_REMOTE_REVALIDATE_SECONDS: float = 30.0
+
+    # Vector-search sidecar ("" = search in-process)
+    VECTOR_SEARCH_URL: str = ""  # http://127.0.0.1:8765 or unix:///path/to.sock
+    VECTOR_SEARCH_TIMEOUT_SECONDS: float = 5.0
 
     # Celery
     CELERY_BROKER_URL: str = "redis://redis:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://redis:6379/1"
+    # PDFs with more pages are ingested as page ranges of this size on many workers (0 = never)
+    PDF_PARTITION_PAGES: int = 200
+    INGEST_PARTITION_PREFIX: str = "ingest-partitions"
+    INGEST_PROGRESS_TTL_SECONDS: int = 24 * 3600
+    # A new PDF version re-ingests only its changed pages, unless more than this share changed
+    PDF_REINGEST_MAX_CHANGED_RATIO: float = 0.5
 
     class Config:
         env_file = ".env"
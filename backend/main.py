@@ -3,6 +3,7 @@ DocWise Backend — FastAPI Application
 AI-Powered Document & Multimedia Q&A
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -13,6 +14,8 @@ from fastapi.responses import JSONResponse
 from core.config import settings
 from models.database import engine, Base
 from routers import files, chat, search, users, notes
+from vector_store.faiss_index import faiss_index
+from vector_store.index_factory import EmbeddingModelMismatch
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +26,15 @@ async def lifespan(app: FastAPI):
     # Create database tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Load the hottest FAISS indices in the background; requests are served meanwhile
+    prewarm = None
+    if settings.FAISS_PREWARM_ON_STARTUP:
+        prewarm = asyncio.create_task(asyncio.to_thread(faiss_index.prewarm))
     yield
-    # Shutdown: dispose engine
+    # Shutdown: remember which indices were used, dispose engine
+    if prewarm is not None:
+        prewarm.cancel()
+    faiss_index.usage.save()
     await engine.dispose()
 
 
@@ -52,6 +62,12 @@ app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(notes.router, prefix="/api/notes", tags=["Notes"])
 
 
+@app.exception_handler(EmbeddingModelMismatch)
+async def embedding_model_mismatch_handler(request: Request, exc: EmbeddingModelMismatch):
+    """A file indexed with another embedding model cannot be searched until re-processed."""
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Catch unhandled exceptions so CORS headers are still returned."""
@@ -0,0 +1,55 @@
+"""
+Move existing per-file FAISS indices into per-user shards.
+
+Run from backend/ before (or after) switching FAISS_LAYOUT to user_shard:
+    python migrate_to_user_shards.py [--dry-run]
+
+Vectors are copied as stored, so files indexed with a quantized type are
+migrated with their decoded (approximate) vectors. Chunks keep their chunk
+IDs, which the file's keyword (.bm25) postings refer to.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import select
+
+from models.database import async_session
+from models.file import File
+from vector_store.faiss_index import faiss_index
+
+
+async def migrate(dry_run: bool):
+    async with async_session() as s:
+        result = await s.execute(select(File.file_id, File.created_by))
+        files = result.all()
+
+    migrated = 0
+    for file_id, owner in files:
+        file_id = str(file_id)
+        if not owner or not faiss_index.index_exists(file_id):
+            continue
+
+        vectors, rows = faiss_index.export_file(file_id)
+        print(f'  {file_id} -> shard of {owner} ({len(rows)} chunks)')
+        if dry_run:
+            continue
+
+        faiss_index.shards.add_file(
+            owner,
+            file_id,
+            vectors,
+            rows,
+            embedding_model=faiss_index.embedding_model(file_id),
+            chunk_ids=[row["chunk_id"] for row in rows],
+        )
+        faiss_index.delete_file_index(file_id)
+        migrated += 1
+
+    print(f'\n✓ Migrated {migrated} file indices.')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate per-file FAISS indices to per-user shards.")
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(migrate(parser.parse_args().dry_run))
@@ -1,5 +1,6 @@
 """Chat router — AI-powered Q&A with streaming and summarization."""
 
+import asyncio
 import uuid
 import json
 
@@ -19,6 +20,7 @@ from services.ai_service import ai_service
 from services.embedding_service import embedding_service
 from services.storage_service import storage_service
 from services.pdf_service import pdf_service
+from services.text_store import TextWriter, text_store
 
 router = APIRouter()
 
@@ -39,6 +41,7 @@ async def chat_ask(
     body: ChatRequest,
     _: None = Depends(rate_limit("chat")),
     user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Ask a question about a file. Uses RAG: search similar chunks → LLM answer.
@@ -61,11 +64,16 @@ async def chat_ask(
             },
         )
 
-    # Search for relevant context
-    context_chunks = embedding_service.search_similar(
+    # Search for relevant context; the owner's shard is named by the file's created_by
+    stmt = select(FileModel.created_by).where(FileModel.file_id == uuid.UUID(body.file_id))
+    owner = (await db.execute(stmt)).scalar_one_or_none()
+    context_chunks = await embedding_service.asearch_similar(
         file_id=body.file_id,
         query=body.question,
         top_k=5,
+        owner=owner,
+        diversify=settings.CHAT_MMR_ENABLED,
+        neighbors=settings.CHAT_CONTEXT_NEIGHBORS,
     )
 
     async def event_generator():
@@ -111,6 +119,18 @@ async def chat_ask(
     )
 
 
+def _load_pdf_text(file_id: str, storage_key: str, limit: int) -> str:
+    """Text extracted at ingest; PDFs ingested before it was kept are parsed once and backfilled."""
+    text = text_store.read_text(file_id, limit=limit)
+    if text is not None:
+        return text
+    writer = TextWriter()
+    with storage_service.open_stream(storage_key) as pdf_stream:
+        text = " ".join(page for _, page in writer.pages(pdf_service.iter_pages(pdf_stream)))
+    text_store.save(file_id, writer)
+    return text[:limit]
+
+
 @router.post("/summarize")
 async def summarize_file(
     body: SummarizeRequest,
@@ -120,7 +140,7 @@ async def summarize_file(
 ):
     """
     Summarize a file's content. Streams the summary via SSE.
-    For PDFs: downloads and extracts text.
+    For PDFs: reads the text extracted at ingest.
     For audio/video: uses stored transcript.
     """
     stmt = select(FileModel).where(FileModel.file_id == uuid.UUID(body.file_id))
@@ -130,21 +150,6 @@ async def summarize_file(
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Get text content
-    if file_record.file_type == "pdf":
-        file_bytes = storage_service.download_file(file_record.storage_key)
-        text = pdf_service.extract_full_text(file_bytes)
-    else:
-        text = file_record.transcript or ""
-
-    if not text.strip():
-        raise HTTPException(status_code=400, detail="No content available to summarize")
-
-    # Truncate if very long (to stay within LLM context limits)
-    max_chars = 50000
-    if len(text) > max_chars:
-        text = text[:max_chars] + "\n\n[Content truncated due to length...]"
-
     cache_key = f"chat:summarize:{body.file_id}"
     cached_summary = await cache_service.get_json(cache_key)
 
@@ -162,6 +167,23 @@ async def summarize_file(
             },
         )
 
+    # Truncate if very long (to stay within LLM context limits)
+    max_chars = 50000
+
+    # Get text content
+    if file_record.file_type == "pdf":
+        text = await asyncio.to_thread(
+            _load_pdf_text, body.file_id, file_record.storage_key, max_chars + 1
+        )
+    else:
+        text = file_record.transcript or ""
+
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="No content available to summarize")
+
+    if len(text) > max_chars:
+        text = text[:max_chars] + "\n\n[Content truncated due to length...]"
+
     async def event_generator():
         summary_parts = []
         try:
@@ -1,21 +1,30 @@
-"""Files router — upload, retrieve, list, and delete files."""
+"""Files router — upload, replace, retrieve, list, and delete files."""
 
+import asyncio
+import logging
 import uuid
-from typing import Optional
+from typing import Dict, Optional
 
 from fastapi import APIRouter, Depends, File, Form, UploadFile, HTTPException, status
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.authz import assert_file_owner
+from core.cache import cache_service
+from core.config import settings
 from core.rate_limit import rate_limit
 from core.security import get_current_user
 from models.database import get_db
 from models.file import File as FileModel
 from models.timestamp import MediaTimestamp
 from services.storage_service import storage_service
-from tasks.celery_worker import process_pdf, process_media
+from tasks.celery_worker import compact_user_shard, process_pdf, process_media
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# In-flight background warms, by file_id (also keeps the tasks referenced).
+_warming: Dict[str, asyncio.Task] = {}
 
 # Allowed MIME types
 PDF_TYPES = {"application/pdf"}
@@ -23,6 +32,16 @@ AUDIO_TYPES = {"audio/mpeg", "audio/wav", "audio/mp4", "audio/x-m4a", "audio/web
 VIDEO_TYPES = {"video/mp4", "video/webm", "video/quicktime", "video/x-msvideo", "video/ogg"}
 
 
+async def _warm_index(file_id: str, owner: Optional[str]) -> None:
+    """Load a file's index into memory so the user's first question hits a warm cache."""
+    from vector_store.faiss_index import faiss_index
+
+    try:
+        await asyncio.to_thread(faiss_index.warm, file_id, owner)
+    except Exception as exc:
+        logger.warning("Could not warm index %s: %s", file_id, exc)
+
+
 def _classify_file(content_type: str) -> str:
     """Classify uploaded file as pdf, audio, or video."""
     if content_type in PDF_TYPES:
@@ -90,6 +109,58 @@ async def upload_file(
     }
 
 
+@router.put("/{file_id}")
+async def replace_file(
+    file_id: str,
+    file: UploadFile = File(...),
+    _: None = Depends(rate_limit("upload")),
+    user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Upload a new version of a PDF, keeping its file ID.
+    The worker re-ingests only the pages whose text changed.
+    """
+    stmt = select(FileModel).where(FileModel.file_id == uuid.UUID(file_id))
+    result = await db.execute(stmt)
+    file_record = result.scalar_one_or_none()
+
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found")
+    assert_file_owner(file_record, user)
+
+    content_type = file.content_type or "application/octet-stream"
+    if file_record.file_type != "pdf" or content_type not in PDF_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDFs can be replaced with a new version",
+        )
+
+    file_bytes = await file.read()
+    file_name = file.filename or file_record.file_name
+    storage_key = f"pdf/{file_id}/{file_name}"
+    storage_service.upload_file(file_bytes, storage_key, content_type)
+    if storage_key != file_record.storage_key:
+        storage_service.delete_file(file_record.storage_key)
+
+    file_record.file_name = file_name
+    file_record.storage_key = storage_key
+    file_record.status = "processing"
+    await db.flush()
+    # Summaries and search hits of the old version must not be served again
+    await cache_service.delete(f"chat:summarize:{file_id}")
+    await cache_service.delete_prefix(f"search:{file_id}:")
+
+    process_pdf.delay(file_id, storage_key)
+
+    return {
+        "fileId": file_id,
+        "fileName": file_name,
+        "fileType": "pdf",
+        "status": "processing",
+    }
+
+
 @router.get("/{file_id}")
 async def get_file(
     file_id: str,
@@ -105,6 +176,11 @@ async def get_file(
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
 
+    if settings.FAISS_WARM_ON_OPEN and file_record.status == "ready" and file_id not in _warming:
+        task = asyncio.create_task(_warm_index(file_id, file_record.created_by))
+        _warming[file_id] = task
+        task.add_done_callback(lambda _: _warming.pop(file_id, None))
+
     file_url = storage_service.get_presigned_url(file_record.storage_key)
 
     # Get timestamps if media file
@@ -125,12 +201,19 @@ async def get_file(
             for ts in ts_result.scalars().all()
         ]
 
+    # Per-partition progress while a large PDF is ingested on several workers
+    progress = None
+    if file_record.file_type == "pdf" and file_record.status == "processing":
+        from services.ingest_partitions import ingest_progress
+        progress = await asyncio.to_thread(ingest_progress.get, file_id)
+
     return {
         "fileId": str(file_record.file_id),
         "fileName": file_record.file_name,
         "fileType": file_record.file_type,
         "fileUrl": file_url,
         "status": file_record.status,
+        "progress": progress,
         "transcript": file_record.transcript,
         "durationSeconds": file_record.duration_seconds,
         "timestamps": timestamps,
@@ -189,10 +272,15 @@ async def delete_file(
 
     # Delete from MinIO
     storage_service.delete_file(file_record.storage_key)
+    if file_record.file_type == "pdf":
+        from services.text_store import text_store
+        text_store.delete(file_id)
 
     # Delete FAISS index
     from vector_store.faiss_index import faiss_index
-    faiss_index.delete_index(file_id)
+    faiss_index.delete_index(file_id, owner=file_record.created_by)
+    if faiss_index.needs_compaction(file_record.created_by):
+        compact_user_shard.delay(file_record.created_by)
 
     # Delete timestamps
     ts_stmt = select(MediaTimestamp).where(MediaTimestamp.file_id == uuid.UUID(file_id))
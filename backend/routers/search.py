@@ -1,12 +1,20 @@
 """Search router — vector similarity search across file embeddings."""
 
-from fastapi import APIRouter, Depends
+import hashlib
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.cache import cache_service
 from core.config import settings
 from core.rate_limit import rate_limit
 from core.security import get_current_user
+from models.database import get_db
+from models.file import File as FileModel
 from services.embedding_service import embedding_service
 
 router = APIRouter()
@@ -16,6 +24,54 @@ class SearchRequest(BaseModel):
     query: str
     file_id: str
     top_k: int = 5
+    start_time: Optional[float] = None  # seconds; restricts media search to a window
+    end_time: Optional[float] = None
+    neighbors: int = 0  # adjacent chunks to merge into each hit, up to SEARCH_MAX_NEIGHBORS
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    file_id: str
+    top_k: int = 5
+
+
+class LibrarySearchRequest(BaseModel):
+    query: str
+    file_ids: Optional[List[str]] = None  # None = all files owned by the caller
+    top_k: int = 5
+
+
+def _cache_key(file_id: str, top_k: int, mode: str, query: str, window: str = "") -> str:
+    """
+    Search cache key. ``mode`` keeps hybrid (RRF scores, higher is better)
+    and vector-only (L2 distances, lower is better) results apart.
+    """
+    return f"search:{file_id}:{top_k}:{mode}:{window}{query.strip().lower()}"
+
+
+async def _file_owner(db: AsyncSession, file_id: str) -> Optional[str]:
+    """
+    The file's created_by, which names its shard in the user_shard layout.
+    It can differ from the caller's email (API-key callers have none, and
+    uploads may fall back to the user_email form field).
+    """
+    stmt = select(FileModel.created_by).where(FileModel.file_id == uuid.UUID(file_id))
+    result = await db.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+def _format_results(results: List[dict]) -> List[dict]:
+    return [
+        {
+            "text": r.get("text", ""),
+            "score": r.get("score", 0.0),
+            "startTime": r.get("start_time"),
+            "endTime": r.get("end_time"),
+            "fileId": r.get("file_id"),
+            "page": r.get("page"),
+        }
+        for r in results
+    ]
 
 
 @router.post("")
@@ -23,35 +79,146 @@ async def search_documents(
     body: SearchRequest,
     _: None = Depends(rate_limit("search")),
     user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Search for similar chunks in a file's vector index.
+    For audio/video, start_time/end_time limit the search to chunks in that window.
+    neighbors widens each hit with that many adjacent chunks on either side.
     Returns ranked results with text, score, and optional timestamps.
     """
     if not body.query.strip():
         return []
+    if not 0 <= body.neighbors <= settings.SEARCH_MAX_NEIGHBORS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"neighbors must be between 0 and {settings.SEARCH_MAX_NEIGHBORS}",
+        )
 
-    cache_key = f"search:{body.file_id}:{body.top_k}:{body.query.strip().lower()}"
+    window = ""
+    if body.start_time is not None or body.end_time is not None:
+        window = f"{body.start_time}-{body.end_time}:"
+    if body.neighbors:
+        window += f"n{body.neighbors}:"
+    mode = "hybrid" if settings.SEARCH_HYBRID else "vector"
+    cache_key = _cache_key(body.file_id, body.top_k, mode, body.query, window)
     cached = await cache_service.get_json(cache_key)
     if cached is not None:
         return cached
 
-    results = embedding_service.search_similar(
+    results = await embedding_service.asearch_similar(
         file_id=body.file_id,
         query=body.query,
         top_k=body.top_k,
+        owner=await _file_owner(db, body.file_id),
+        start_time=body.start_time,
+        end_time=body.end_time,
+        neighbors=body.neighbors,
     )
 
-    response = [
-        {
-            "text": r.get("text", ""),
-            "score": r.get("score", 0.0),
-            "startTime": r.get("start_time"),
-            "endTime": r.get("end_time"),
-            "fileId": r.get("file_id"),
-        }
-        for r in results
-    ]
+    response = _format_results(results)
+
+    await cache_service.set_json(
+        cache_key,
+        response,
+        ttl_seconds=settings.CACHE_TTL_SEARCH_SECONDS,
+    )
+    return response
+
+
+@router.post("/batch")
+async def search_batch(
+    body: BatchSearchRequest,
+    _: None = Depends(rate_limit("search")),
+    user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Run many queries against one file's vector index (vector-only, never hybrid).
+    Uncached queries are embedded in a single request and searched together.
+    Returns one result list per query, in request order.
+    """
+    if len(body.queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch",
+        )
+
+    responses: List[Optional[List[dict]]] = [None] * len(body.queries)
+    pending = {}
+    for i, query in enumerate(body.queries):
+        if not query.strip():
+            responses[i] = []
+            continue
+        cache_key = _cache_key(body.file_id, body.top_k, "vector", query)
+        cached = await cache_service.get_json(cache_key)
+        if cached is not None:
+            responses[i] = cached
+        else:
+            pending.setdefault(cache_key, (query, []))[1].append(i)
+
+    if pending:
+        batch = await embedding_service.asearch_batch(
+            file_id=body.file_id,
+            queries=[query for query, _ in pending.values()],
+            top_k=body.top_k,
+            owner=await _file_owner(db, body.file_id),
+        )
+        for (cache_key, (_, positions)), results in zip(pending.items(), batch):
+            response = _format_results(results)
+            for i in positions:
+                responses[i] = response
+            await cache_service.set_json(
+                cache_key,
+                response,
+                ttl_seconds=settings.CACHE_TTL_SEARCH_SECONDS,
+            )
+
+    return responses
+
+
+@router.post("/library")
+async def search_library(
+    body: LibrarySearchRequest,
+    _: None = Depends(rate_limit("search")),
+    user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Search across many files at once and return the global top-k.
+    Searches the given file_ids, or every file the caller owns when omitted.
+    Only files owned by the caller are searched.
+    """
+    if not body.query.strip():
+        return []
+
+    stmt = select(FileModel.file_id).where(FileModel.created_by == user["email"])
+    if body.file_ids is not None:
+        try:
+            requested = [uuid.UUID(file_id) for file_id in body.file_ids]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid file_id")
+        stmt = stmt.where(FileModel.file_id.in_(requested))
+    result = await db.execute(stmt)
+    file_ids = sorted(str(file_id) for file_id in result.scalars().all())
+
+    if not file_ids:
+        return []
+
+    scope = hashlib.sha1(",".join(file_ids).encode("utf-8")).hexdigest()
+    cache_key = f"search:library:{scope}:{body.top_k}:{body.query.strip().lower()}"
+    cached = await cache_service.get_json(cache_key)
+    if cached is not None:
+        return cached
+
+    # Every file searched has created_by == the caller's email, so that is their shard owner.
+    results = await embedding_service.asearch_library(
+        file_ids=file_ids,
+        query=body.query,
+        top_k=body.top_k,
+        owner=user["email"],
+    )
+    response = _format_results(results)
 
     await cache_service.set_json(
         cache_key,
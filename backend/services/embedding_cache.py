@@ -0,0 +1,309 @@
+"""Embedding caches: persistent chunk vectors and hot query vectors.
+
+EmbeddingCache — persistent, content-addressed cache of chunk embeddings.
+
+Entries are keyed by sha256(model deployment, dimensions, chunk text), so the
+same text embedded by the same model is only paid for once — across users
+uploading the same document, re-processing after a failed task, or
+re-ingesting an edited file.
+
+Two tiers:
+
+* local disk — a SQLite file under EMBEDDING_CACHE_PATH (one row per vector,
+  safe to share between processes on a node);
+* Redis — shared between nodes, entries expire after
+  EMBEDDING_CACHE_TTL_SECONDS. Hits there are copied to local disk.
+
+Vectors are stored as raw float16 (default) or float32 bytes.
+
+QueryEmbeddingCache — query vectors keyed by normalized query text, in an
+in-process LRU backed by CacheService (Redis), with concurrent identical
+queries coalesced into one embedding call.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from redis import Redis
+
+from core.cache import cache_service
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_REDIS_PREFIX = "emb:"
+# SQLite's default limit on host parameters is 999.
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """Looks up and stores chunk embeddings by content hash."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        dtype: Optional[str] = None,
+        redis_url: Optional[str] = None,
+    ):
+        self.path = path or os.path.join(settings.EMBEDDING_CACHE_PATH, "embeddings.sqlite")
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_CACHE_DTYPE)
+        if redis_url is None:
+            redis_url = settings.REDIS_URL if settings.CACHE_ENABLED else ""
+        self._redis_url = redis_url
+        self._redis: Optional[Redis] = None
+        self._local = threading.local()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """Cache key of ``text`` embedded by ``model`` (deployment plus dimensions)."""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, dtype TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _get_redis(self) -> Optional[Redis]:
+        if not self._redis_url:
+            return None
+        if self._redis is None:
+            try:
+                redis = Redis.from_url(self._redis_url, socket_timeout=2, socket_connect_timeout=2)
+                redis.ping()
+                self._redis = redis
+            except Exception as exc:
+                logger.info("Embedding cache running without Redis tier: %s", exc)
+                self._redis_url = ""
+                return None
+        return self._redis
+
+    def _redis_key(self, key: str) -> str:
+        # The dtype is part of the key so nodes configured differently never mix blobs.
+        return f"{_REDIS_PREFIX}{self.dtype.name}:{key}"
+
+    def _encode(self, vector: Sequence[float]) -> bytes:
+        return np.asarray(vector, dtype=self.dtype).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes, dtype: str) -> np.ndarray:
+        return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors (float32) for whichever of ``keys`` are known."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, np.ndarray] = {}
+        db = self._db()
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = db.execute(
+                f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, dtype, blob in rows:
+                found[key] = self._decode(blob, dtype)
+
+        missing = [key for key in keys if key not in found]
+        redis = self._get_redis() if missing else None
+        if redis is not None:
+            try:
+                blobs = redis.mget([self._redis_key(key) for key in missing])
+            except Exception as exc:
+                logger.warning("Embedding cache Redis lookup failed: %s", exc)
+                blobs = []
+            shared = {key: blob for key, blob in zip(missing, blobs) if blob is not None}
+            if shared:
+                self._write_local(shared)
+                for key, blob in shared.items():
+                    found[key] = self._decode(blob, self.dtype.str)
+        return found
+
+    def put_many(self, vectors: Dict[str, Sequence[float]]) -> None:
+        """Store vectors in both tiers."""
+        if not vectors:
+            return
+        blobs = {key: self._encode(vector) for key, vector in vectors.items()}
+        self._write_local(blobs)
+
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                pipeline = redis.pipeline(transaction=False)
+                for key, blob in blobs.items():
+                    pipeline.set(
+                        self._redis_key(key), blob, ex=settings.EMBEDDING_CACHE_TTL_SECONDS
+                    )
+                pipeline.execute()
+            except Exception as exc:
+                logger.warning("Embedding cache Redis write failed: %s", exc)
+
+    def _write_local(self, blobs: Dict[str, bytes]) -> None:
+        db = self._db()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, vector) VALUES (?, ?, ?)",
+                [(key, self.dtype.str, blob) for key, blob in blobs.items()],
+            )
+
+
+class QueryEmbeddingCache:
+    """
+    Query vectors keyed by (model, normalized query text).
+
+    Lookups go to an in-process LRU of QUERY_EMBED_CACHE_MAX_ENTRIES vectors,
+    then to CacheService. On a miss, concurrent requests for the same key
+    share one embedding call (singleflight): the first starts it, the rest
+    await the same task. A caller giving up (e.g. a timeout) does not cancel
+    the call for the others.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = settings.QUERY_EMBED_CACHE_MAX_ENTRIES
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @classmethod
+    def key(cls, model: str, query: str) -> str:
+        return hashlib.sha256(f"{model}\0{cls.normalize(query)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key: str, vector: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get_or_embed(
+        self, model: str, query: str, embed: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        """Cached vector for ``query``, calling ``embed(query)`` at most once per key."""
+        key = self.key(model, query)
+        vector = self.get(key)
+        if vector is not None:
+            return vector
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, query, embed))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def get_or_embed_many(
+        self,
+        model: str,
+        queries: List[str],
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        """
+        Cached vectors for ``queries``, in order. Misses in the LRU and in
+        CacheService are embedded with one ``embed_many`` call and stored;
+        queries already being embedded by another request are awaited.
+        """
+        keys = [self.key(model, query) for query in queries]
+        vectors: Dict[str, List[float]] = {}
+        pending: Dict[str, asyncio.Future] = {}
+        todo: Dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            if key in vectors or key in pending or key in todo:
+                continue
+            vector = self.get(key)
+            if vector is not None:
+                vectors[key] = vector
+            elif key in self._inflight:
+                pending[key] = self._inflight[key]
+            else:
+                todo[key] = query
+
+        if todo:
+            batch = asyncio.ensure_future(self._load_many(todo, embed_many))
+            for key in todo:
+                task = asyncio.ensure_future(self._pick(batch, key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+                pending[key] = task
+        if pending:
+            loaded = await asyncio.gather(*(asyncio.shield(task) for task in pending.values()))
+            vectors.update(zip(pending, loaded))
+        return [vectors[key] for key in keys]
+
+    @staticmethod
+    async def _pick(batch: asyncio.Future, key: str) -> List[float]:
+        return (await batch)[key]
+
+    @staticmethod
+    async def _read_shared(key: str) -> Optional[List[float]]:
+        payload = await cache_service.get_json(f"qemb:{key}")
+        if payload is None:
+            return None
+        return np.frombuffer(base64.b64decode(payload), dtype=np.float32).tolist()
+
+    @staticmethod
+    async def _write_shared(key: str, vector: List[float]) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        await cache_service.set_json(
+            f"qemb:{key}",
+            base64.b64encode(blob).decode("ascii"),
+            ttl_seconds=settings.QUERY_EMBED_CACHE_TTL_SECONDS,
+        )
+
+    async def _load(
+        self, key: str, query: str, embed: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        vector = await self._read_shared(key)
+        if vector is None:
+            vector = list(await embed(query))
+            await self._write_shared(key, vector)
+        self.put(key, vector)
+        return vector
+
+    async def _load_many(
+        self,
+        todo: Dict[str, str],
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> Dict[str, List[float]]:
+        found = {}
+        for key in todo:
+            vector = await self._read_shared(key)
+            if vector is not None:
+                found[key] = vector
+        missing = [key for key in todo if key not in found]
+        if missing:
+            embedded = await embed_many([todo[key] for key in missing])
+            for key, vector in zip(missing, embedded):
+                found[key] = list(vector)
+                await self._write_shared(key, found[key])
+        for key, vector in found.items():
+            self.put(key, vector)
+        return found
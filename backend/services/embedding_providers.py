@@ -0,0 +1,140 @@
+"""Embedding providers, selected by EMBEDDING_PROVIDER.
+
+* ``azure_openai`` (default) — the AZURE_OPENAI_EMBEDDING_DEPLOYMENT model;
+* ``sentence_transformers`` — LOCAL_EMBEDDING_MODEL run on the CPU, for
+  on-prem deployments (needs the optional ``sentence-transformers`` package);
+* ``hashing`` — a deterministic feature-hashing embedder with no model and no
+  network, for offline benchmarking, tests and latency-sensitive tenants.
+
+A provider wraps a LangChain ``Embeddings`` and names the model behind it.
+EmbeddingService combines that name with the model's output dimensions into
+the ID of the vector space, which keys the embedding caches and is stored
+with every index, so vectors from different providers, models or dimensions
+are never compared with each other.
+"""
+
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from core.config import settings
+
+PROVIDERS = ("azure_openai", "sentence_transformers", "hashing")
+
+_HASHING_DIMENSIONS = 768
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class EmbeddingProvider:
+    """An embeddings model plus the name that identifies it."""
+
+    def __init__(
+        self,
+        name: str,
+        model: Embeddings,
+        model_name: str,
+        remote: bool,
+        scheduled_model: Optional[Embeddings] = None,
+    ):
+        self.name = name
+        self.model = model
+        self.model_name = model_name
+        # Remote providers are rate limited and billed per token; local ones
+        # are neither, so ingest skips the request scheduler for them.
+        self.remote = remote
+        # The same model configured for the ingest scheduler, which does its
+        # own retrying (see services/embedding_scheduler.py).
+        self.scheduled_model = scheduled_model or model
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Feature hashing over words and word bigrams. Each feature adds
+    ±(1 + log count) to the coordinate its blake2b hash selects (stable across
+    processes, unlike ``hash()``) and vectors are L2-normalized, so texts
+    sharing words score close. Lexical similarity only, but instant.
+    """
+
+    def __init__(self, dimensions: int = _HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, count in features.items():
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest, "little")
+            sign = 1.0 if bucket >> 63 else -1.0
+            vector[bucket % self.dimensions] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def build_provider(name: Optional[str] = None) -> EmbeddingProvider:
+    """Create the configured provider (EMBEDDING_PROVIDER unless ``name`` is given)."""
+    name = (name or settings.EMBEDDING_PROVIDER).lower()
+    dimensions = settings.EMBEDDING_DIMENSIONS or None
+
+    if name == "azure_openai":
+        from langchain_openai import AzureOpenAIEmbeddings
+
+        def azure(**kwargs) -> Embeddings:
+            return AzureOpenAIEmbeddings(
+                azure_deployment=settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+                azure_endpoint=settings.AZURE_OPENAI_EMBEDDING_ENDPOINT,
+                api_key=settings.AZURE_OPENAI_EMBEDDING_API_KEY,
+                api_version=settings.AZURE_OPENAI_EMBEDDING_API_VERSION,
+                dimensions=dimensions,
+                **kwargs,
+            )
+
+        # Queries keep the SDK's retries. On the ingest client, 429s go
+        # straight to the scheduler, which backs off for every sender; SDK
+        # retries would hide them and stampede the quota.
+        # Named by the bare deployment, as before providers existed, so
+        # cached vectors and existing index tags stay valid.
+        return EmbeddingProvider(
+            name,
+            azure(),
+            settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+            remote=True,
+            scheduled_model=azure(max_retries=0),
+        )
+
+    if name == "sentence_transformers":
+        try:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+
+            model = HuggingFaceEmbeddings(
+                model_name=settings.LOCAL_EMBEDDING_MODEL,
+                model_kwargs={"device": "cpu"},
+                encode_kwargs={"normalize_embeddings": True},
+            )
+        except ImportError as exc:
+            raise RuntimeError(
+                "EMBEDDING_PROVIDER=sentence_transformers needs the sentence-transformers "
+                "package (pip install sentence-transformers)"
+            ) from exc
+        return EmbeddingProvider(
+            name, model, f"st:{settings.LOCAL_EMBEDDING_MODEL}", remote=False
+        )
+
+    if name == "hashing":
+        model = HashingEmbeddings(dimensions or _HASHING_DIMENSIONS)
+        return EmbeddingProvider(name, model, "hashing-v1", remote=False)
+
+    raise ValueError(f"Unknown embedding provider: {name} (expected one of {', '.join(PROVIDERS)})")
@@ -0,0 +1,219 @@
+"""Token-aware, rate-limited scheduling of embedding requests for ingest.
+
+Chunks are packed into requests of at most EMBEDDING_BATCH_MAX_TOKENS tokens
+(counted with tiktoken, or estimated when it is unavailable) and
+EMBEDDING_BATCH_MAX_ITEMS inputs. Up to EMBEDDING_CONCURRENCY requests are in
+flight at once, and each first draws its tokens from a shared token bucket
+refilled at the deployment's tokens-per-minute quota.
+
+The bucket adapts to the service: a 429 pauses every sender for the
+Retry-After the service asked for and halves the refill rate, and each
+successful request wins back a little of the rate (AIMD), so a large
+document runs close to the quota instead of stampeding into retries.
+
+There is one bucket per embedding model per process (``shared_bucket``), so
+the rate learned from 429s carries over from one document, or ingest
+partition, to the next, and concurrent ingests in a process share the quota.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_ENCODING = "cl100k_base"  # text-embedding-3-* tokenizer
+_encoder = None
+_encoder_failed = False
+
+# Never slow down below this fraction of the configured quota.
+_MIN_RATE_FRACTION = 0.05
+# Fraction of the configured quota regained after each successful request.
+_RECOVERY_FRACTION = 0.05
+_DEFAULT_RETRY_AFTER_SECONDS = 5.0
+
+_buckets: Dict[str, "AdaptiveTokenBucket"] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_encoder():
+    """The embedding model's tiktoken encoding, or None if it cannot be loaded."""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding(_ENCODING)
+        except Exception as exc:
+            logger.warning("tiktoken unavailable (%s); estimating token counts", exc)
+            _encoder_failed = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Token count of ``text``; about 4 characters per token if tiktoken cannot load."""
+    encoder = get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def batch_by_tokens(
+    token_counts: Sequence[int], max_tokens: int, max_items: int
+) -> List[List[int]]:
+    """
+    Split positions 0..n-1 into consecutive batches within both limits.
+    A single input larger than ``max_tokens`` gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for position, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(position)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Seconds to back off if ``exc`` is a rate-limit (HTTP 429) error, else None.
+    Honours the retry-after-ms / Retry-After headers Azure sends.
+    """
+    if getattr(exc, "status_code", None) != 429:
+        return None
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return _DEFAULT_RETRY_AFTER_SECONDS
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate backs off on 429s and recovers on success."""
+
+    def __init__(self, tokens_per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.max_rate = tokens_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = float(tokens_per_minute)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until ``tokens`` can be spent (requests larger than the bucket wait for a full one)."""
+        tokens = min(tokens, self.capacity)
+        # Celery runs each task in a fresh event loop, and an asyncio.Lock
+        # cannot be shared between loops; the bucket's state outlives them.
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            while True:
+                pause = self._paused_until - self._clock()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def throttle(self, retry_after: float) -> None:
+        """Back off after a 429: pause all senders and halve the rate."""
+        self._refill()
+        self._paused_until = max(self._paused_until, self._clock() + retry_after)
+        self.rate = max(self.rate / 2, self.max_rate * _MIN_RATE_FRACTION)
+        self._tokens = 0.0
+
+    def recover(self) -> None:
+        """Regain part of the rate after a successful request."""
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate * _RECOVERY_FRACTION)
+
+
+def shared_bucket(key: str, tokens_per_minute: Optional[int] = None) -> AdaptiveTokenBucket:
+    """
+    The process-wide bucket for ``key`` (an embedding model ID), created
+    with EMBEDDING_TOKENS_PER_MINUTE unless ``tokens_per_minute`` is given.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = AdaptiveTokenBucket(tokens_per_minute or settings.EMBEDDING_TOKENS_PER_MINUTE)
+            _buckets[key] = bucket
+        return bucket
+
+
+async def embed_in_batches(
+    texts: Sequence[str],
+    embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+    bucket: AdaptiveTokenBucket,
+    concurrency: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+) -> List[List[float]]:
+    """
+    Embed ``texts`` with token-sized batches sent concurrently through
+    ``bucket``. Rate-limited batches are retried after the requested delay,
+    up to ``max_attempts`` times; other errors propagate. Returns vectors in
+    input order.
+    """
+    concurrency = concurrency or settings.EMBEDDING_CONCURRENCY
+    max_attempts = max_attempts or settings.EMBEDDING_MAX_ATTEMPTS
+    token_counts = [count_tokens(text) for text in texts]
+    batches = batch_by_tokens(
+        token_counts, settings.EMBEDDING_BATCH_MAX_TOKENS, settings.EMBEDDING_BATCH_MAX_ITEMS
+    )
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(batch: List[int]) -> None:
+        tokens = sum(token_counts[position] for position in batch)
+        async with semaphore:
+            for attempt in range(1, max_attempts + 1):
+                await bucket.acquire(tokens)
+                try:
+                    embedded = await embed_batch([texts[position] for position in batch])
+                except Exception as exc:
+                    delay = retry_after_seconds(exc)
+                    if delay is None or attempt == max_attempts:
+                        raise
+                    logger.warning("Embedding rate-limited; backing off %.1fs", delay)
+                    bucket.throttle(delay)
+                    continue
+                bucket.recover()
+                for position, vector in zip(batch, embedded):
+                    vectors[position] = vector
+                return
+
+    logger.info("Embedding %d chunks in %d batches", len(texts), len(batches))
+    tasks = [asyncio.ensure_future(run(batch)) for batch in batches]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return vectors
@@ -1,37 +1,166 @@
-"""Embedding service — generates embeddings using Azure OpenAI."""
+"""Embedding service — embeds with the configured provider and stores vectors in FAISS."""
 
-from typing import List
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional
 
-from langchain_openai import AzureOpenAIEmbeddings
+import numpy as np
 
 from core.config import settings
+from services.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from services.embedding_providers import build_provider
+from services.embedding_scheduler import embed_in_batches, shared_bucket
 from vector_store.faiss_index import faiss_index
+from vector_store.index_factory import EmbeddingModelMismatch
+from vector_store.lexical_index import reciprocal_rank_fusion
+from vector_store.mmr import maximal_marginal_relevance
+
+logger = logging.getLogger(__name__)
 
 
 class EmbeddingService:
     """Generates embeddings and stores them in FAISS."""
 
     def __init__(self):
-        self.embeddings_model = AzureOpenAIEmbeddings(
-            azure_deployment=settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
-            azure_endpoint=settings.AZURE_OPENAI_EMBEDDING_ENDPOINT,
-            api_key=settings.AZURE_OPENAI_EMBEDDING_API_KEY,
-            api_version=settings.AZURE_OPENAI_EMBEDDING_API_VERSION,
-        )
+        self.provider = build_provider()
+        self.embeddings_model = self.provider.model
+        self.scheduled_model = self.provider.scheduled_model
+        self._retrieval_pool: Optional[ThreadPoolExecutor] = None
+        self._cache: Optional[EmbeddingCache] = None
+        self.query_cache = QueryEmbeddingCache()
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the embedding space: provider model plus requested dimensions."""
+        dimensions = getattr(self.embeddings_model, "dimensions", None) or "native"
+        return f"{self.provider.model_name}:{dimensions}"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        if self._cache is None:
+            self._cache = EmbeddingCache()
+        return self._cache
 
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of text chunks."""
-        return self.embeddings_model.embed_documents(texts)
+        """
+        Generate embeddings for a list of text chunks.
+
+        With EMBEDDING_CACHE_ENABLED, chunks embedded before (by any user or
+        node) are served from the embedding cache and only the rest are sent
+        to the model, each distinct text once.
+        """
+        if not settings.EMBEDDING_CACHE_ENABLED or not texts:
+            return self.embeddings_model.embed_documents(texts)
+
+        keys, vectors, missing = self._lookup_cached(texts)
+        if missing:
+            embedded = self.embeddings_model.embed_documents(list(missing.values()))
+            vectors.update(self._store_cached(missing, embedded))
+        logger.info(
+            "Embedded %d of %d chunks; the rest came from the cache", len(missing), len(texts)
+        )
+        return [list(map(float, vectors[key])) for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async counterpart of embed_texts for ingest: cache misses are split
+        into token-sized batches and sent concurrently under an adaptive rate
+        limit (see services/embedding_scheduler.py). Local providers embed
+        them on a worker thread instead.
+        """
+        if not texts:
+            return []
+        if settings.EMBEDDING_CACHE_ENABLED:
+            keys, vectors, missing = await asyncio.to_thread(self._lookup_cached, texts)
+        else:
+            keys, vectors, missing = list(range(len(texts))), {}, dict(enumerate(texts))
+
+        if missing:
+            pending = list(missing.values())
+            if self.provider.remote:
+                bucket = shared_bucket(self.model_id)
+                embedded = await embed_in_batches(
+                    pending, self.scheduled_model.aembed_documents, bucket
+                )
+            else:
+                embedded = await asyncio.to_thread(self.embeddings_model.embed_documents, pending)
+            if settings.EMBEDDING_CACHE_ENABLED:
+                embedded = await asyncio.to_thread(self._store_cached, missing, embedded)
+            else:
+                embedded = dict(zip(missing, embedded))
+            vectors.update(embedded)
+        logger.info(
+            "Embedded %d of %d chunks; the rest came from the cache", len(missing), len(texts)
+        )
+        return [list(map(float, vectors[key])) for key in keys]
+
+    def _lookup_cached(self, texts: List[str]):
+        """(cache keys, cached vectors by key, {key: text} still to embed)."""
+        keys = [EmbeddingCache.key(self.model_id, text) for text in texts]
+        try:
+            vectors = self.cache.get_many(keys)
+        except Exception as exc:
+            logger.warning("Embedding cache lookup failed (%r); embedding everything", exc)
+            vectors = {}
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        return keys, vectors, missing
+
+    def _store_cached(self, missing: dict, embedded: List[List[float]]) -> dict:
+        fresh = dict(zip(missing, embedded))
+        try:
+            self.cache.put_many(fresh)
+        except Exception as exc:
+            logger.warning("Could not store embeddings in cache: %r", exc)
+        return fresh
 
     def embed_query(self, query: str) -> List[float]:
-        """Generate an embedding for a single query."""
-        return self.embeddings_model.embed_query(query)
+        """Generate an embedding for a single query (served from the query LRU when seen)."""
+        key = QueryEmbeddingCache.key(self.model_id, query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.embeddings_model.embed_query(query)
+            self.query_cache.put(key, vector)
+        return vector
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeddings for several queries, without blocking. Cached vectors are
+        reused as in aembed_query; the rest are embedded in one request.
+        """
+        return await self.query_cache.get_or_embed_many(
+            self.model_id, queries, self.embeddings_model.aembed_documents
+        )
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """
+        Generate an embedding for a single query without blocking the event loop.
+
+        Vectors are cached by normalized query text (in-process LRU, then
+        Redis), and concurrent identical queries share one embedding call.
+        """
+        return await self.query_cache.get_or_embed(
+            self.model_id, query, self.embeddings_model.aembed_query
+        )
+
+    async def _run_retrieval(self, func, *args, **kwargs):
+        """Run blocking FAISS work on the bounded retrieval thread pool."""
+        if self._retrieval_pool is None:
+            self._retrieval_pool = ThreadPoolExecutor(
+                max_workers=settings.RETRIEVAL_EXECUTOR_WORKERS,
+                thread_name_prefix="retrieval",
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._retrieval_pool, partial(func, *args, **kwargs))
 
     def ingest_document(
         self,
         file_id: str,
         chunks: List[str],
         timestamps: List[dict] = None,
+        owner: Optional[str] = None,
+        positions: List[dict] = None,
     ) -> None:
         """
         Embed all chunks and store in FAISS with metadata.
@@ -40,30 +169,379 @@ class EmbeddingService:
             file_id: UUID of the file
             chunks: list of text chunks
             timestamps: optional list of dicts with start_time/end_time per chunk
+            owner: file owner (selects the user's shard in the user_shard layout)
+            positions: optional list of dicts with page/char_start/char_end per chunk
         """
         if not chunks:
             return
 
         embeddings = self.embed_texts(chunks)
+        self.store_embeddings(file_id, chunks, embeddings, timestamps, owner, positions)
+
+    async def aingest_document(
+        self,
+        file_id: str,
+        chunks: List[str],
+        timestamps: List[dict] = None,
+        owner: Optional[str] = None,
+        positions: List[dict] = None,
+    ) -> None:
+        """Async variant of ingest_document, embedding through aembed_documents."""
+        if not chunks:
+            return
+
+        embeddings = await self.aembed_documents(chunks)
+        await asyncio.to_thread(
+            self.store_embeddings, file_id, chunks, embeddings, timestamps, owner, positions
+        )
+
+    def store_embeddings(
+        self,
+        file_id: str,
+        chunks: List[str],
+        embeddings: List[List[float]],
+        timestamps: List[dict] = None,
+        owner: Optional[str] = None,
+        positions: List[dict] = None,
+    ) -> None:
+        """Build the file's index from chunks embedded elsewhere (e.g. by ingest partitions)."""
+        metadata = self._build_metadata(file_id, chunks, timestamps, positions)
+        faiss_index.add_embeddings(
+            file_id, embeddings, metadata, owner=owner, embedding_model=self.model_id
+        )
+
+    def append_document(
+        self,
+        file_id: str,
+        chunks: List[str],
+        timestamps: List[dict] = None,
+        owner: Optional[str] = None,
+        positions: List[dict] = None,
+    ) -> List[int]:
+        """
+        Embed only the given new chunks and append them to the file's index.
+        Returns the chunk IDs assigned to them.
+        """
+        if not chunks:
+            return []
+
+        embeddings = self.embed_texts(chunks)
+        metadata = self._build_metadata(file_id, chunks, timestamps, positions)
+        return faiss_index.append_embeddings(
+            file_id, embeddings, metadata, owner=owner, embedding_model=self.model_id
+        )
+
+    async def aappend_document(
+        self,
+        file_id: str,
+        chunks: List[str],
+        timestamps: List[dict] = None,
+        owner: Optional[str] = None,
+        positions: List[dict] = None,
+    ) -> List[int]:
+        """Async variant of append_document, embedding through aembed_documents."""
+        if not chunks:
+            return []
+
+        embeddings = await self.aembed_documents(chunks)
+        metadata = self._build_metadata(file_id, chunks, timestamps, positions)
+        return await asyncio.to_thread(
+            faiss_index.append_embeddings,
+            file_id,
+            embeddings,
+            metadata,
+            owner=owner,
+            embedding_model=self.model_id,
+        )
 
+    def remove_chunks(
+        self, file_id: str, chunk_ids: List[int], owner: Optional[str] = None
+    ) -> int:
+        """Drop chunks from the file's index by their chunk IDs."""
+        return faiss_index.remove_chunks(file_id, chunk_ids, owner=owner)
+
+    @staticmethod
+    def _build_metadata(
+        file_id: str,
+        chunks: List[str],
+        timestamps: List[dict] = None,
+        positions: List[dict] = None,
+    ) -> List[dict]:
         metadata = []
         for i, chunk in enumerate(chunks):
             meta = {"text": chunk, "file_id": file_id}
             if timestamps and i < len(timestamps):
                 meta["start_time"] = timestamps[i].get("start_time")
                 meta["end_time"] = timestamps[i].get("end_time")
+            if positions and i < len(positions):
+                meta["page"] = positions[i].get("page")
+                meta["char_start"] = positions[i].get("char_start")
+                meta["char_end"] = positions[i].get("char_end")
             metadata.append(meta)
+        return metadata
+
+    def _check_space(self, file_id: str, owner: Optional[str]) -> None:
+        """Refuse to search a file whose vectors came from another embedding model."""
+        indexed = faiss_index.embedding_model(file_id, owner=owner)
+        if indexed is not None and indexed != self.model_id:
+            raise EmbeddingModelMismatch(file_id, indexed, self.model_id)
 
-        faiss_index.add_embeddings(file_id, embeddings, metadata)
+    def _same_space(self, file_ids: List[str], owner: Optional[str]) -> List[str]:
+        """The files whose vectors can be searched with the current model."""
+        searchable = []
+        for file_id in file_ids:
+            indexed = faiss_index.embedding_model(file_id, owner=owner)
+            if indexed is not None and indexed != self.model_id:
+                logger.warning("Skipping %s: indexed with embedding model %s", file_id, indexed)
+                continue
+            searchable.append(file_id)
+        return searchable
 
     def search_similar(
-        self, file_id: str, query: str, top_k: int = 5
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        owner: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        diversify: bool = False,
+        neighbors: int = 0,
+    ) -> List[dict]:
+        """
+        Embed a query and search for similar chunks in the file's index,
+        optionally only among transcript chunks overlapping [start_time, end_time].
+
+        With SEARCH_HYBRID, BM25 keyword hits are fused in by reciprocal rank
+        fusion, and keyword hits alone are returned if the embedding call fails.
+        With ``diversify``, SEARCH_MMR_OVERSAMPLE times more candidates are
+        fetched and narrowed to top_k by maximal marginal relevance.
+        With ``neighbors``, each hit is widened to the chunks around it and
+        touching hits are merged into one span.
+
+        Raises EmbeddingModelMismatch if the file was indexed with another
+        embedding model.
+        """
+        self._check_space(file_id, owner)
+        results = self._rank_similar(
+            file_id, query, top_k, owner, start_time, end_time, diversify
+        )
+        if neighbors > 0:
+            results = faiss_index.expand_neighbors(file_id, results, neighbors, owner=owner)
+        return results
+
+    def _rank_similar(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int,
+        owner: Optional[str],
+        start_time: Optional[float],
+        end_time: Optional[float],
+        diversify: bool,
+    ) -> List[dict]:
+        lexical = None
+        if settings.SEARCH_HYBRID:
+            lexical = faiss_index.search_lexical(
+                file_id, query, self._candidates(top_k, diversify),
+                owner=owner, start_time=start_time, end_time=end_time,
+            )
+        try:
+            query_embedding = self.embed_query(query)
+        except Exception as exc:
+            if not lexical:
+                raise
+            logger.warning("Query embedding failed (%r); serving keyword results only", exc)
+            query_embedding = None
+        return self._rank(
+            file_id, query_embedding, lexical, top_k, owner, start_time, end_time, diversify
+        )
+
+    @staticmethod
+    def _candidates(top_k: int, diversify: bool) -> int:
+        """Hits fetched from each index in hybrid search."""
+        depth = top_k * settings.SEARCH_MMR_OVERSAMPLE if diversify else top_k
+        return max(depth, settings.SEARCH_HYBRID_CANDIDATES)
+
+    def _rank(
+        self,
+        file_id: str,
+        query_embedding: Optional[List[float]],
+        lexical: Optional[List[dict]],
+        top_k: int,
+        owner: Optional[str],
+        start_time: Optional[float],
+        end_time: Optional[float],
+        diversify: bool,
+    ) -> List[dict]:
+        """
+        Rank a file's chunks for an embedded query; shared by the sync and
+        async search paths. ``lexical`` holds the keyword hits in hybrid
+        search (None for vector-only), and ``query_embedding`` is None when
+        embedding failed and the keyword hits are served on their own.
+        """
+        if query_embedding is None:
+            return reciprocal_rank_fusion([lexical], top_k)
+
+        depth = top_k * settings.SEARCH_MMR_OVERSAMPLE if diversify else top_k
+        window = {"start_time": start_time, "end_time": end_time}
+        if lexical is None:
+            results = faiss_index.search(file_id, query_embedding, depth, owner=owner, **window)
+        else:
+            candidates = self._candidates(top_k, diversify)
+            vector = faiss_index.search(file_id, query_embedding, candidates, owner=owner, **window)
+            results = reciprocal_rank_fusion([vector, lexical], depth)
+        return self._select(file_id, query_embedding, results, top_k, owner, diversify)
+
+    @staticmethod
+    def _select(
+        file_id: str,
+        query_embedding: List[float],
+        results: List[dict],
+        top_k: int,
+        owner: Optional[str],
+        diversify: bool,
+    ) -> List[dict]:
+        """
+        Narrow ranked candidates to top_k, by MMR over their stored vectors when
+        ``diversify`` is set (no extra embedding calls). Falls back to the
+        plain ranking when the vectors cannot be read back from the index.
+        """
+        if not diversify or len(results) <= top_k:
+            return results[:top_k]
+
+        chunk_ids = [result.get("chunk_id") for result in results]
+        vectors = None
+        if None not in chunk_ids:
+            vectors = faiss_index.get_vectors(file_id, chunk_ids, owner=owner)
+        if vectors is None:
+            return results[:top_k]
+
+        order = maximal_marginal_relevance(
+            np.asarray(query_embedding, dtype=np.float32),
+            vectors,
+            top_k,
+            lambda_mult=settings.SEARCH_MMR_LAMBDA,
+        )
+        return [results[i] for i in order]
+
+    def search_library(
+        self,
+        file_ids: List[str],
+        query: str,
+        top_k: int = 5,
+        owner: Optional[str] = None,
     ) -> List[dict]:
         """
-        Embed a query and search for similar chunks in the file's index.
+        Embed a query once and search it across many files' indices,
+        returning the global top-k.
         """
+        file_ids = self._same_space(file_ids, owner)
+        if not file_ids:
+            return []
         query_embedding = self.embed_query(query)
-        return faiss_index.search(file_id, query_embedding, top_k)
+        return faiss_index.search_many(file_ids, query_embedding, top_k, owner=owner)
+
+    async def asearch_similar(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        owner: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        diversify: bool = False,
+        neighbors: int = 0,
+    ) -> List[dict]:
+        """
+        Async variant of search_similar for request handlers.
+
+        The keyword search runs while the query is being embedded; if the
+        embedding takes longer than SEARCH_EMBED_TIMEOUT_SECONDS or fails,
+        the keyword results are served on their own.
+        """
+        await self._run_retrieval(self._check_space, file_id, owner)
+        results = await self._arank_similar(
+            file_id, query, top_k, owner, start_time, end_time, diversify
+        )
+        if neighbors > 0:
+            results = await self._run_retrieval(
+                faiss_index.expand_neighbors, file_id, results, neighbors, owner=owner
+            )
+        return results
+
+    async def _arank_similar(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int,
+        owner: Optional[str],
+        start_time: Optional[float],
+        end_time: Optional[float],
+        diversify: bool,
+    ) -> List[dict]:
+        if not settings.SEARCH_HYBRID:
+            query_embedding = await self.aembed_query(query)
+            return await self._run_retrieval(
+                self._rank, file_id, query_embedding, None, top_k, owner,
+                start_time, end_time, diversify,
+            )
+
+        lexical_task = asyncio.ensure_future(
+            self._run_retrieval(
+                faiss_index.search_lexical, file_id, query, self._candidates(top_k, diversify),
+                owner=owner, start_time=start_time, end_time=end_time,
+            )
+        )
+        try:
+            query_embedding = await asyncio.wait_for(
+                self.aembed_query(query), timeout=settings.SEARCH_EMBED_TIMEOUT_SECONDS
+            )
+        except Exception as exc:
+            if not await lexical_task:
+                raise
+            logger.warning("Query embedding failed (%r); serving keyword results only", exc)
+            query_embedding = None
+        return await self._run_retrieval(
+            self._rank, file_id, query_embedding, await lexical_task, top_k, owner,
+            start_time, end_time, diversify,
+        )
+
+    async def asearch_batch(
+        self,
+        file_id: str,
+        queries: List[str],
+        top_k: int = 5,
+        owner: Optional[str] = None,
+    ) -> List[List[dict]]:
+        """
+        Embed many queries (only those not in the query cache, with a single
+        embedding request) and search them against one file's index in one
+        vectorized FAISS call.
+        """
+        if not queries:
+            return []
+        await self._run_retrieval(self._check_space, file_id, owner)
+        query_embeddings = await self.aembed_queries(queries)
+        return await self._run_retrieval(
+            faiss_index.search_batch, file_id, query_embeddings, top_k, owner=owner
+        )
+
+    async def asearch_library(
+        self,
+        file_ids: List[str],
+        query: str,
+        top_k: int = 5,
+        owner: Optional[str] = None,
+    ) -> List[dict]:
+        """Async variant of search_library for request handlers."""
+        file_ids = await self._run_retrieval(self._same_space, file_ids, owner)
+        if not file_ids:
+            return []
+        query_embedding = await self.aembed_query(query)
+        return await self._run_retrieval(
+            faiss_index.search_many, file_ids, query_embedding, top_k, owner=owner
+        )
 
 
 # Singleton
@@ -0,0 +1,219 @@
+"""Page-range partitions for ingesting very large PDFs on many workers.
+
+A PDF with more than PDF_PARTITION_PAGES pages is split into ranges of that
+many pages. Each range is extracted, chunked and embedded by its own Celery
+task, which leaves its output in object storage under INGEST_PARTITION_PREFIX:
+
+* ``{file_id}/{part}.json.gz`` — the range's page texts and chunks;
+* ``{file_id}/{part}.npy`` — the chunks' vectors (float32).
+
+A final task reads the parts back in page order, builds the file's index
+once, saves its extracted text and deletes the parts.
+
+IngestProgress keeps each partition's state in a Redis hash (or in process
+memory without Redis) so the API can report progress while workers run.
+"""
+
+import gzip
+import io
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from redis import Redis
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PageRange = Tuple[int, int]
+
+
+def page_ranges(page_count: int, size: int) -> List[PageRange]:
+    """Consecutive (first, last) 1-based page ranges of at most ``size`` pages."""
+    if size <= 0:
+        return [(1, page_count)]
+    return [(first, min(first + size - 1, page_count)) for first in range(1, page_count + 1, size)]
+
+
+def page_runs(pages: Iterable[int], size: int) -> List[PageRange]:
+    """
+    The given page numbers as sorted (first, last) runs of consecutive pages,
+    each at most ``size`` pages long (unbounded when ``size`` <= 0).
+    """
+    runs: List[PageRange] = []
+    for page in sorted(set(pages)):
+        if runs and runs[-1][1] == page - 1 and (size <= 0 or page - runs[-1][0] < size):
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+
+class PartitionStore:
+    """Per-partition ingest output in object storage."""
+
+    def __init__(self, storage=None, prefix: Optional[str] = None):
+        self._storage = storage
+        self.prefix = prefix or settings.INGEST_PARTITION_PREFIX
+
+    @property
+    def storage(self):
+        if self._storage is not None:
+            return self._storage
+        from services.storage_service import storage_service
+
+        return storage_service
+
+    def _keys(self, file_id: str, part: int) -> Tuple[str, str]:
+        base = f"{self.prefix}/{file_id}/{part:05d}"
+        return f"{base}.json.gz", f"{base}.npy"
+
+    def save(
+        self,
+        file_id: str,
+        part: int,
+        pages: List[Tuple[int, str]],
+        chunks: List[Dict[str, Any]],
+        vectors: Sequence[Sequence[float]],
+    ) -> None:
+        data_key, vectors_key = self._keys(file_id, part)
+        payload = gzip.compress(json.dumps({"pages": pages, "chunks": chunks}).encode("utf-8"))
+        self.storage.upload_file(payload, data_key, "application/gzip")
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(vectors, dtype=np.float32))
+        self.storage.upload_file(buffer.getvalue(), vectors_key, "application/octet-stream")
+
+    def load(
+        self, file_id: str, part: int
+    ) -> Tuple[List[Tuple[int, str]], List[Dict[str, Any]], np.ndarray]:
+        """(pages, chunks, vectors) saved for one partition."""
+        data_key, vectors_key = self._keys(file_id, part)
+        bodies = [self.storage.read_stream(key) for key in (data_key, vectors_key)]
+        if None in bodies:
+            raise FileNotFoundError(f"Ingest partition {part} of {file_id} is missing")
+        try:
+            data = json.loads(gzip.decompress(bodies[0].read()))
+            vectors = np.load(io.BytesIO(bodies[1].read()), allow_pickle=False)
+        finally:
+            for body in bodies:
+                body.close()
+        pages = [(page, text) for page, text in data["pages"]]
+        return pages, data["chunks"], vectors
+
+    def delete(self, file_id: str, parts: int) -> None:
+        for part in range(parts):
+            for key in self._keys(file_id, part):
+                self.storage.delete_file(key)
+
+
+class IngestProgress:
+    """Per-partition state of a fanned-out ingest, shared between workers and the API."""
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self._redis_url = settings.REDIS_URL if redis_url is None else redis_url
+        self._redis: Optional[Redis] = None
+        self._memory: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _get_redis(self) -> Optional[Redis]:
+        if not self._redis_url:
+            return None
+        if self._redis is None:
+            try:
+                redis = Redis.from_url(
+                    self._redis_url, socket_timeout=2, socket_connect_timeout=2,
+                    decode_responses=True,
+                )
+                redis.ping()
+                self._redis = redis
+            except Exception as exc:
+                logger.info("Ingest progress kept in process memory: %s", exc)
+                self._redis_url = ""
+                return None
+        return self._redis
+
+    @staticmethod
+    def _key(file_id: str) -> str:
+        return f"ingest:progress:{file_id}"
+
+    def _write(self, file_id: str, fields: Dict[str, str]) -> None:
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                pipeline = redis.pipeline(transaction=False)
+                pipeline.hset(self._key(file_id), mapping=fields)
+                pipeline.expire(self._key(file_id), settings.INGEST_PROGRESS_TTL_SECONDS)
+                pipeline.execute()
+                return
+            except Exception as exc:
+                logger.warning("Ingest progress write failed: %s", exc)
+        with self._lock:
+            self._memory.setdefault(file_id, {}).update(fields)
+
+    def start(self, file_id: str, ranges: List[PageRange]) -> None:
+        fields = {"pages": str(ranges[-1][1])}
+        for part, (first, last) in enumerate(ranges):
+            fields[str(part)] = json.dumps({"first": first, "last": last, "state": "queued"})
+        self._write(file_id, fields)
+
+    def update(
+        self, file_id: str, part: int, first: int, last: int, state: str,
+        chunks: Optional[int] = None,
+    ) -> None:
+        """Record one partition's state: queued, running, done or failed."""
+        entry = {"first": first, "last": last, "state": state}
+        if chunks is not None:
+            entry["chunks"] = chunks
+        self._write(file_id, {str(part): json.dumps(entry)})
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of a fanned-out ingest, or None if there is none under way."""
+        fields = None
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                fields = redis.hgetall(self._key(file_id))
+            except Exception as exc:
+                logger.warning("Ingest progress read failed: %s", exc)
+        if fields is None:
+            with self._lock:
+                fields = dict(self._memory.get(file_id, {}))
+        if not fields:
+            return None
+        pages = int(fields.pop("pages", 0))
+        partitions = []
+        for part in sorted(fields, key=int):
+            entry = json.loads(fields[part])
+            partitions.append(
+                {
+                    "firstPage": entry["first"],
+                    "lastPage": entry["last"],
+                    "state": entry["state"],
+                    "chunks": entry.get("chunks"),
+                }
+            )
+        done = sum(1 for entry in partitions if entry["state"] == "done")
+        return {
+            "pages": pages,
+            "partitionsDone": done,
+            "partitionsTotal": len(partitions),
+            "partitions": partitions,
+        }
+
+    def clear(self, file_id: str) -> None:
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                redis.delete(self._key(file_id))
+            except Exception as exc:
+                logger.warning("Ingest progress delete failed: %s", exc)
+        with self._lock:
+            self._memory.pop(file_id, None)
+
+
+# Singletons
+partition_store = PartitionStore()
+ingest_progress = IngestProgress(redis_url=settings.REDIS_URL if settings.CACHE_ENABLED else "")
@@ -1,56 +1,111 @@
-"""PDF parsing service — extract text and split into chunks."""
+"""PDF parsing service — extract text and split into chunks.
 
-from typing import List
+Pages are read with pypdf straight from the PDF bytes or a file-like object
+(e.g. the spooled download from ``storage_service.open_stream``) and split
+one page at a time, so no temp file is written and only the current page's
+text is held besides the chunks produced so far. Pages are split by
+LangChain's RecursiveCharacterTextSplitter unless TEXT_SPLITTER=native
+selects the TextChunker.
+"""
+
+import io
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import tempfile
-import os
+from pypdf import PdfReader
+
+from core.config import settings
+from services.text_chunker import TextChunker
+
+PDFSource = Union[bytes, BinaryIO]
 
 
 class PDFService:
     """Handles PDF text extraction and chunking."""
 
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-        )
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+        splitter: Optional[str] = None,
+    ):
+        chunk_size = chunk_size or settings.CHUNK_SIZE
+        chunk_overlap = settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        if (splitter or settings.TEXT_SPLITTER) == "native":
+            self.splitter = TextChunker(chunk_size, chunk_overlap)
+        else:
+            self.splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                add_start_index=True,
+            )
+
+    def _split(self, text: str) -> List[Dict[str, Any]]:
+        """Chunks of one page: dicts with text and char_start/char_end."""
+        if isinstance(self.splitter, TextChunker):
+            return self.splitter.chunks(text)
+        chunks = []
+        for doc in self.splitter.create_documents([text]):
+            start = doc.metadata.get("start_index", -1)
+            chunks.append(
+                {
+                    "text": doc.page_content,
+                    "char_start": start if start >= 0 else None,
+                    "char_end": start + len(doc.page_content) if start >= 0 else None,
+                }
+            )
+        return chunks
+
+    @staticmethod
+    def _reader(source: PDFSource) -> PdfReader:
+        stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        return PdfReader(stream)
+
+    @classmethod
+    def page_count(cls, source: PDFSource) -> int:
+        """Number of pages, read from the page tree without extracting any text."""
+        return len(cls._reader(source).pages)
 
-    def extract_and_chunk(self, pdf_bytes: bytes) -> List[str]:
+    @classmethod
+    def iter_pages(
+        cls, source: PDFSource, first: int = 1, last: Optional[int] = None
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page number, 1-based; page text) for pages ``first``..``last``
+        (default: to the end), parsing pages lazily.
+        """
+        pages = cls._reader(source).pages
+        last = len(pages) if last is None else min(last, len(pages))
+        for number in range(first, last + 1):
+            yield number, pages[number - 1].extract_text() or ""
+
+    def extract_and_chunk(self, source: PDFSource) -> List[str]:
         """
         Extract text from a PDF and split into chunks.
         Returns a list of text chunks ready for embedding.
         """
-        # Write PDF bytes to a temporary file for PyPDFLoader
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            tmp.write(pdf_bytes)
-            tmp_path = tmp.name
+        return [chunk["text"] for chunk in self.extract_chunks(source)]
 
-        try:
-            loader = PyPDFLoader(tmp_path)
-            documents = loader.load()
-
-            split_docs = self.splitter.split_documents(documents)
-            chunks = [doc.page_content for doc in split_docs]
+    def extract_chunks(self, source: PDFSource) -> List[Dict[str, Any]]:
+        """
+        Extract and split a PDF, keeping where each chunk came from.
+        Returns dicts with text, page (1-based) and char_start/char_end
+        (offsets within that page's text).
+        """
+        return self.split_pages(self.iter_pages(source))
 
-            return chunks
-        finally:
-            os.unlink(tmp_path)
+    def split_pages(self, pages: Iterable[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        """Split (page number, text) pairs as they arrive; see extract_chunks."""
+        chunks = []
+        for page, text in pages:
+            for chunk in self._split(text):
+                chunk["page"] = page
+                chunks.append(chunk)
+        return chunks
 
-    def extract_full_text(self, pdf_bytes: bytes) -> str:
+    def extract_full_text(self, source: PDFSource) -> str:
         """Extract full text from a PDF (used for summarization)."""
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            tmp.write(pdf_bytes)
-            tmp_path = tmp.name
-
-        try:
-            loader = PyPDFLoader(tmp_path)
-            documents = loader.load()
-            full_text = " ".join([doc.page_content for doc in documents])
-            return full_text
-        finally:
-            os.unlink(tmp_path)
+        return " ".join(text for _, text in self.iter_pages(source))
 
 
 # Singleton
@@ -1,7 +1,8 @@
 """MinIO object storage service — S3-compatible file storage."""
 
 import io
-from typing import Optional
+import tempfile
+from typing import BinaryIO, Optional
 
 import boto3
 from botocore.client import Config
@@ -90,6 +91,64 @@ class StorageService:
         response = self.client.get_object(Bucket=self.bucket, Key=key)
         return response["Body"].read()
 
+    def open_stream(self, key: str) -> tempfile.SpooledTemporaryFile:
+        """
+        Download an object into a seekable stream, positioned at the start.
+        It stays in memory up to STORAGE_SPOOL_MAX_BYTES and spills to a
+        temp file beyond that; close it when done.
+        """
+        self._ensure_bucket()
+        stream = tempfile.SpooledTemporaryFile(max_size=settings.STORAGE_SPOOL_MAX_BYTES)
+        try:
+            self.client.download_fileobj(self.bucket, key, stream)
+        except Exception:
+            stream.close()
+            raise
+        stream.seek(0)
+        return stream
+
+    def upload_stream(self, stream: BinaryIO, key: str, content_type: str) -> str:
+        """Upload a file-like object (multipart for large ones) and return the object key."""
+        self._ensure_bucket()
+        self.client.upload_fileobj(
+            stream, self.bucket, key, ExtraArgs={"ContentType": content_type}
+        )
+        return key
+
+    def read_stream(self, key: str) -> Optional[BinaryIO]:
+        """Open an object for sequential reading (None if it does not exist); close it when done."""
+        self._ensure_bucket()
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return response["Body"]
+
+    def upload_path(self, local_path: str, key: str) -> str:
+        """Upload a local file (multipart for large files) and return the object key."""
+        self._ensure_bucket()
+        self.client.upload_file(local_path, self.bucket, key)
+        return key
+
+    def download_to_path(self, key: str, local_path: str) -> None:
+        """Stream an object to a local file without holding it in memory."""
+        self._ensure_bucket()
+        self.client.download_file(self.bucket, key, local_path)
+
+    def get_object_info(self, key: str) -> Optional[dict]:
+        """Return {"size", "modified"} (epoch seconds) for an object, or None if missing."""
+        self._ensure_bucket()
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError:
+            return None
+        return {
+            "size": response["ContentLength"],
+            "modified": response["LastModified"].timestamp(),
+        }
+
     def delete_file(self, key: str) -> None:
         """Delete a file from MinIO."""
         self._ensure_bucket()
@@ -0,0 +1,165 @@
+"""Native text chunker: paragraph/sentence/word-aware splitting in one pass.
+
+Each chunk is grown to at most ``chunk_size`` units (characters, or tokens of
+the embedding model's tokenizer) and then cut at the coarsest boundary in
+that window: a blank line, then a line break, then a sentence end, then any
+whitespace. Only when a window has no whitespace at all is it cut mid-word.
+This matches where RecursiveCharacterTextSplitter (separators
+``["\\n\\n", "\\n", " ", ""]``) puts its cuts, but the boundaries are found with
+reverse substring scans over each window instead of splitting the whole text
+into pieces and merging them back, so the cost is linear in the text length.
+
+The next chunk starts at the first word within ``chunk_overlap`` units of
+the previous chunk's end that follows a boundary as coarse as the one cut at,
+so (as with LangChain) a chunk cut at a paragraph break only repeats whole
+paragraphs, and its own cut must lie past the previous chunk's end. Chunks
+never start or end with whitespace, and each carries its character offsets
+in the source text.
+"""
+
+import bisect
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core.config import settings
+
+# Boundary levels, coarsest first: (separator, offset of the whitespace in it).
+_LEVELS: Tuple[Tuple[Tuple[str, int], ...], ...] = (
+    (("\n\n", 0),),
+    (("\n", 0),),
+    ((". ", 1), ("! ", 1), ("? ", 1)),
+    ((" ", 0), ("\t", 0)),
+)
+_NON_SPACE = re.compile(r"\S")
+
+Span = Tuple[int, int]
+
+
+class TextChunker:
+    """Splits text into overlapping chunks with character offsets."""
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+        unit: Optional[str] = None,
+        encoder=None,
+    ):
+        self.chunk_size = chunk_size or settings.CHUNK_SIZE
+        self.chunk_overlap = settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        self.unit = unit or settings.CHUNK_UNIT
+        if self.unit not in ("chars", "tokens"):
+            raise ValueError(f"Unknown chunk unit: {self.unit!r}")
+        if not 0 <= self.chunk_overlap < self.chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self._encoder = encoder
+
+    def _token_offsets(self, text: str) -> Sequence[int]:
+        """Character offset at which each token of ``text`` starts."""
+        encoder = self._encoder
+        if encoder is None:
+            from services.embedding_scheduler import get_encoder
+
+            encoder = get_encoder()
+        if encoder is None:
+            # Same estimate as embedding_scheduler.count_tokens: ~4 characters per token.
+            return range(0, len(text), 4)
+        _, offsets = encoder.decode_with_offsets(encoder.encode(text, disallowed_special=()))
+        return offsets
+
+    def split_spans(self, text: str) -> List[Span]:
+        """(start, end) character offsets of each chunk of ``text``."""
+        end_of_text = len(text.rstrip())
+        first = _NON_SPACE.search(text, 0, end_of_text)
+        if first is None:
+            return []
+
+        size, overlap = self.chunk_size, self.chunk_overlap
+        if self.unit == "chars":
+            def units(position: int) -> int:
+                return position
+
+            def position(unit: int) -> int:
+                return unit
+        else:
+            offsets = self._token_offsets(text)
+
+            def units(position: int) -> int:
+                # Index of the token that contains ``position``.
+                return bisect.bisect_right(offsets, position) - 1
+
+            def position(unit: int) -> int:
+                return offsets[unit] if unit < len(offsets) else len(text)
+
+        spans: List[Span] = []
+        start = previous_end = first.start()
+        while True:
+            limit = position(units(start) + size)
+            if limit >= end_of_text:
+                spans.append((start, end_of_text))
+                return spans
+
+            # Cut past the previous chunk, so a chunk is never just the overlap.
+            end, resume, level = self._cut(text, max(start, previous_end), limit)
+            spans.append((start, end))
+            previous_end = end
+
+            if overlap:
+                target = max(position(max(units(end - 1) + 1 - overlap, 0)), start + 1)
+                word = self._overlap_start(text, target, end, level)
+                if word is not None:
+                    resume = min(resume, word)
+            start = resume
+
+    @staticmethod
+    def _cut(text: str, start: int, limit: int) -> Tuple[int, int, int]:
+        """
+        (end of this chunk, start of the next, boundary level) for the window
+        text[start:limit], cutting after ``start``.
+        """
+        for level, separators in enumerate(_LEVELS):
+            cut = -1
+            for separator, offset in separators:
+                found = text.rfind(separator, start + 1, limit + len(separator) - offset)
+                if found >= 0:
+                    cut = max(cut, found + offset)
+            if cut > start:
+                break
+        else:
+            # A single word longer than the whole window.
+            cut = limit
+        end = cut
+        while text[end - 1].isspace():
+            end -= 1
+        return end, _NON_SPACE.search(text, cut).start(), level
+
+    @staticmethod
+    def _overlap_start(text: str, target: int, end: int, level: int) -> Optional[int]:
+        """
+        First word in text[target:end] that follows a boundary of ``level`` or
+        coarser: a chunk cut at a paragraph break only repeats whole paragraphs.
+        """
+        best = None
+        for separators in _LEVELS[: level + 1]:
+            for separator, offset in separators:
+                found = text.find(separator, max(target - len(separator), 0), end)
+                while found >= 0:
+                    word = _NON_SPACE.search(text, found + offset, end)
+                    if word is None:
+                        break
+                    if word.start() >= target:
+                        if best is None or word.start() < best:
+                            best = word.start()
+                        break
+                    found = text.find(separator, found + 1, end)
+        return best
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def chunks(self, text: str) -> List[Dict[str, Any]]:
+        """Dicts with the chunk text and its char_start/char_end in ``text``."""
+        return [
+            {"text": text[start:end], "char_start": start, "char_end": end}
+            for start, end in self.split_spans(text)
+        ]
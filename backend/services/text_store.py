@@ -0,0 +1,156 @@
+"""Extracted PDF text, kept in object storage at ingest so a PDF is parsed only once.
+
+For every PDF the worker stores, under EXTRACTED_TEXT_PREFIX:
+
+* ``{file_id}.txt.gz`` — the pages' text joined by single spaces (exactly what
+  ``pdf_service.extract_full_text`` returns), gzip-compressed;
+* ``{file_id}.pages.json`` — the total length, the character offset at
+  which each page starts in that text, and a hash of each page's
+  whitespace-normalized text (so a new version of the PDF can be compared
+  page by page with the one that was indexed).
+
+Summaries and other consumers read the text from there instead of
+downloading and re-parsing the PDF. Reading a prefix of the text (or an early
+page) only downloads and decompresses that far.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from core.config import settings
+
+
+def page_hash(text: str) -> str:
+    """Hash of a page's text, ignoring differences in whitespace."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def changed_pages(previous: List[str], current: List[str]) -> Set[int]:
+    """1-based numbers of pages whose hash differs, or that exist in only one version."""
+    changed = {
+        number
+        for number, (old, new) in enumerate(zip(previous, current), start=1)
+        if old != new
+    }
+    shorter, longer = sorted((len(previous), len(current)))
+    changed.update(range(shorter + 1, longer + 1))
+    return changed
+
+
+class TextWriter:
+    """Compresses page text as it is extracted (spooled to disk for huge documents)."""
+
+    def __init__(self):
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=settings.STORAGE_SPOOL_MAX_BYTES)
+        self._gzip = gzip.GzipFile(fileobj=self._buffer, mode="wb")
+        self.page_offsets: List[int] = []
+        self.page_hashes: List[str] = []
+        self.length = 0
+
+    def add_page(self, text: str) -> None:
+        if self.page_offsets:
+            self._gzip.write(b" ")
+            self.length += 1
+        self.page_offsets.append(self.length)
+        self.page_hashes.append(page_hash(text))
+        self._gzip.write(text.encode("utf-8"))
+        self.length += len(text)
+
+    def pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """Pass (page number, text) pairs through, recording each page on the way."""
+        for number, text in pages:
+            self.add_page(text)
+            yield number, text
+
+    def finish(self) -> tempfile.SpooledTemporaryFile:
+        """The compressed text, rewound for upload."""
+        self._gzip.close()
+        self._buffer.seek(0)
+        return self._buffer
+
+
+class TextStore:
+    """Reads and writes extracted PDF text in object storage."""
+
+    def __init__(self, storage=None, prefix: Optional[str] = None):
+        self._storage = storage
+        self.prefix = prefix or settings.EXTRACTED_TEXT_PREFIX
+
+    @property
+    def storage(self):
+        if self._storage is not None:
+            return self._storage
+        from services.storage_service import storage_service
+
+        return storage_service
+
+    def _keys(self, file_id: str) -> Tuple[str, str]:
+        base = f"{self.prefix}/{file_id}"
+        return f"{base}.txt.gz", f"{base}.pages.json"
+
+    def save(self, file_id: str, writer: TextWriter) -> None:
+        """Upload a finished document's text and page map."""
+        text_key, pages_key = self._keys(file_id)
+        with writer.finish() as compressed:
+            self.storage.upload_stream(compressed, text_key, "application/gzip")
+        page_map = {
+            "length": writer.length,
+            "page_offsets": writer.page_offsets,
+            "page_hashes": writer.page_hashes,
+        }
+        self.storage.upload_file(
+            json.dumps(page_map).encode("utf-8"), pages_key, "application/json"
+        )
+
+    def read_text(self, file_id: str, limit: Optional[int] = None) -> Optional[str]:
+        """The document's text (its first ``limit`` characters), or None if it was never stored."""
+        body = self.storage.read_stream(self._keys(file_id)[0])
+        if body is None:
+            return None
+        try:
+            with gzip.GzipFile(fileobj=body) as compressed:
+                reader = io.TextIOWrapper(compressed, encoding="utf-8")
+                return reader.read(-1 if limit is None else limit)
+        finally:
+            body.close()
+
+    def _page_map(self, file_id: str) -> Optional[Dict[str, Any]]:
+        body = self.storage.read_stream(self._keys(file_id)[1])
+        if body is None:
+            return None
+        try:
+            return json.loads(body.read())
+        finally:
+            body.close()
+
+    def page_offsets(self, file_id: str) -> Optional[List[int]]:
+        """Character offset of each page in the stored text (page 1 first), or None."""
+        page_map = self._page_map(file_id)
+        return None if page_map is None else page_map["page_offsets"]
+
+    def page_hashes(self, file_id: str) -> Optional[List[str]]:
+        """page_hash of each page (page 1 first), or None if not stored (older ingests)."""
+        page_map = self._page_map(file_id)
+        return None if page_map is None else page_map.get("page_hashes")
+
+    def read_page(self, file_id: str, page: int) -> Optional[str]:
+        """One page's text (1-based), or None if unknown."""
+        offsets = self.page_offsets(file_id)
+        if offsets is None or not 1 <= page <= len(offsets):
+            return None
+        start = offsets[page - 1]
+        end = offsets[page] - 1 if page < len(offsets) else None
+        text = self.read_text(file_id, limit=end)
+        return None if text is None else text[start:end]
+
+    def delete(self, file_id: str) -> None:
+        for key in self._keys(file_id):
+            self.storage.delete_file(key)
+
+
+# Singleton
+text_store = TextStore()
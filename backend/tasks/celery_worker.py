@@ -32,11 +32,43 @@ celery_app.conf.update(
 )
 
 
+async def _get_file_owner(file_id: str):
+    """Return the file's created_by (selects the user's shard in the user_shard layout)."""
+    from models.database import async_session
+    from models.file import File
+    from sqlalchemy import select
+    import uuid as uuid_mod
+
+    async with async_session() as session:
+        stmt = select(File.created_by).where(File.file_id == uuid_mod.UUID(file_id))
+        result = await session.execute(stmt)
+        return result.scalar_one_or_none()
+
+
+async def _set_file_status(file_id: str, status: str):
+    from models.database import async_session
+    from models.file import File
+    from sqlalchemy import select
+    import uuid as uuid_mod
+
+    async with async_session() as session:
+        stmt = select(File).where(File.file_id == uuid_mod.UUID(file_id))
+        result = await session.execute(stmt)
+        file_record = result.scalar_one_or_none()
+        if file_record:
+            file_record.status = status
+            await session.commit()
+
+
 @celery_app.task(name="tasks.process_pdf", bind=True, max_retries=3)
 def process_pdf(self, file_id: str, storage_key: str):
     """
     Background task: Download PDF from MinIO → extract text → chunk → embed in FAISS.
     Updates file status to 'ready' when done.
+
+    PDFs longer than PDF_PARTITION_PAGES pages are fanned out instead: one
+    process_pdf_partition task per page range, then finish_pdf builds the
+    index once they have all finished.
     """
     import asyncio
     asyncio.run(_process_pdf_async(file_id, storage_key))
@@ -50,28 +82,177 @@ async def _process_pdf_async(file_id: str, storage_key: str):
     from services.storage_service import storage_service
     from services.pdf_service import pdf_service
     from services.embedding_service import embedding_service
-    from models.database import async_session
-    from models.file import File
-    from sqlalchemy import select
-    import uuid as uuid_mod
+    from services.text_store import TextWriter, changed_pages, text_store
+    from vector_store.faiss_index import faiss_index
 
-    # Download PDF from MinIO
-    pdf_bytes = storage_service.download_file(storage_key)
+    # A new version of an indexed PDF is compared page by page with the last one
+    # (unless the index was built by another embedding model)
+    owner = await _get_file_owner(file_id)
+    previous = None
+    if faiss_index.index_exists(file_id, owner=owner) and faiss_index.embedding_model(
+        file_id, owner=owner
+    ) in (None, embedding_service.model_id):
+        previous = text_store.page_hashes(file_id)
 
-    # Extract and chunk
-    chunks = pdf_service.extract_and_chunk(pdf_bytes)
+    # Download PDF from MinIO, then extract and chunk it page by page,
+    # keeping the extracted text so it never has to be parsed again
+    writer = TextWriter()
+    with storage_service.open_stream(storage_key) as pdf_stream:
+        page_count = pdf_service.page_count(pdf_stream)
+        pages = writer.pages(pdf_service.iter_pages(pdf_stream))
+        if previous is not None:
+            # One streaming pass that keeps only the pages' hashes (the text is
+            # spooled by the writer), then only the changed pages are parsed again
+            for _ in pages:
+                pass
+            changed = changed_pages(previous, writer.page_hashes)
+            if len(changed) <= settings.PDF_REINGEST_MAX_CHANGED_RATIO * max(page_count, 1):
+                await _reingest_pages(file_id, owner, pdf_stream, page_count, changed)
+                text_store.save(file_id, writer)
+                await _set_file_status(file_id, "ready")
+                return
+            pages = pdf_service.iter_pages(pdf_stream)
+        if 0 < settings.PDF_PARTITION_PAGES < page_count:
+            writer.finish().close()
+            _fan_out_pdf(file_id, storage_key, page_count)
+            return
+        chunks = pdf_service.split_pages(pages)
+    text_store.save(file_id, writer)
 
     # Embed into FAISS
-    embedding_service.ingest_document(file_id, chunks)
+    await embedding_service.aingest_document(
+        file_id, [c["text"] for c in chunks], owner=owner, positions=chunks
+    )
+
+    await _set_file_status(file_id, "ready")
 
-    # Update file status
-    async with async_session() as session:
-        stmt = select(File).where(File.file_id == uuid_mod.UUID(file_id))
-        result = await session.execute(stmt)
-        file_record = result.scalar_one_or_none()
-        if file_record:
-            file_record.status = "ready"
-            await session.commit()
+
+async def _reingest_pages(file_id: str, owner, pdf_stream, page_count: int, changed: set):
+    """
+    Swap the chunks of ``changed`` pages (1-based) in a file's index for
+    chunks of their new text; pages that no longer exist just lose theirs.
+
+    The changed pages are read back from ``pdf_stream`` in runs of at most
+    PDF_PARTITION_PAGES pages, so only one run's text is held at a time.
+    """
+    import asyncio
+    from services.pdf_service import pdf_service
+    from services.embedding_service import embedding_service
+    from services.ingest_partitions import page_runs
+    from vector_store.faiss_index import faiss_index
+
+    if not changed:
+        return
+    stale = await asyncio.to_thread(faiss_index.chunk_ids_on_pages, file_id, changed, owner)
+    # Append before removing, so searches never miss a changed page in between.
+    remaining = (page for page in changed if page <= page_count)
+    for first, last in page_runs(remaining, settings.PDF_PARTITION_PAGES):
+        chunks = pdf_service.split_pages(pdf_service.iter_pages(pdf_stream, first, last))
+        await embedding_service.aappend_document(
+            file_id, [c["text"] for c in chunks], owner=owner, positions=chunks
+        )
+    await asyncio.to_thread(embedding_service.remove_chunks, file_id, stale, owner)
+
+
+def _fan_out_pdf(file_id: str, storage_key: str, page_count: int):
+    """Queue one partition task per page range, with finish_pdf as the chord callback."""
+    from celery import chord
+    from services.ingest_partitions import ingest_progress, page_ranges
+
+    ranges = page_ranges(page_count, settings.PDF_PARTITION_PAGES)
+    ingest_progress.start(file_id, ranges)
+    header = [
+        process_pdf_partition.s(file_id, storage_key, part, first, last)
+        for part, (first, last) in enumerate(ranges)
+    ]
+    chord(header)(finish_pdf.s(file_id, len(ranges)).on_error(fail_pdf.s(file_id, len(ranges))))
+
+
+@celery_app.task(name="tasks.process_pdf_partition", bind=True, max_retries=3)
+def process_pdf_partition(self, file_id: str, storage_key: str, part: int, first: int, last: int):
+    """
+    Background task: extract, chunk and embed pages first..last of a large PDF,
+    leaving the chunks and vectors in MinIO for finish_pdf. Returns the chunk count.
+    """
+    import asyncio
+    return asyncio.run(_process_pdf_partition_async(file_id, storage_key, part, first, last))
+
+
+async def _process_pdf_partition_async(
+    file_id: str, storage_key: str, part: int, first: int, last: int
+) -> int:
+    from services.storage_service import storage_service
+    from services.pdf_service import pdf_service
+    from services.embedding_service import embedding_service
+    from services.ingest_partitions import ingest_progress, partition_store
+
+    ingest_progress.update(file_id, part, first, last, "running")
+    try:
+        with storage_service.open_stream(storage_key) as pdf_stream:
+            pages = list(pdf_service.iter_pages(pdf_stream, first, last))
+        chunks = pdf_service.split_pages(pages)
+        vectors = await embedding_service.aembed_documents([c["text"] for c in chunks])
+        partition_store.save(file_id, part, pages, chunks, vectors)
+    except Exception:
+        ingest_progress.update(file_id, part, first, last, "failed")
+        raise
+    ingest_progress.update(file_id, part, first, last, "done", chunks=len(chunks))
+    return len(chunks)
+
+
+@celery_app.task(name="tasks.finish_pdf")
+def finish_pdf(chunk_counts, file_id: str, parts: int):
+    """
+    Background task (fan-in): assemble a partitioned PDF's chunks in page order,
+    build its FAISS index once and mark the file ready.
+    """
+    import asyncio
+    asyncio.run(_finish_pdf_async(file_id, parts))
+
+
+async def _finish_pdf_async(file_id: str, parts: int):
+    import asyncio
+    import numpy as np
+    from services.embedding_service import embedding_service
+    from services.ingest_partitions import ingest_progress, partition_store
+    from services.text_store import TextWriter, text_store
+
+    writer = TextWriter()
+    chunks, vectors = [], []
+    for part in range(parts):
+        pages, part_chunks, part_vectors = partition_store.load(file_id, part)
+        for _, text in pages:
+            writer.add_page(text)
+        chunks.extend(part_chunks)
+        if part_chunks:
+            vectors.append(part_vectors)
+    text_store.save(file_id, writer)
+
+    if chunks:
+        owner = await _get_file_owner(file_id)
+        await asyncio.to_thread(
+            embedding_service.store_embeddings,
+            file_id,
+            [c["text"] for c in chunks],
+            np.concatenate(vectors),
+            owner=owner,
+            positions=chunks,
+        )
+
+    partition_store.delete(file_id, parts)
+    ingest_progress.clear(file_id)
+    await _set_file_status(file_id, "ready")
+
+
+@celery_app.task(name="tasks.fail_pdf")
+def fail_pdf(request, exc, traceback, file_id: str, parts: int):
+    """Error callback of a partitioned ingest: drop its partial output and mark the file failed."""
+    import asyncio
+    from services.ingest_partitions import ingest_progress, partition_store
+
+    partition_store.delete(file_id, parts)
+    ingest_progress.clear(file_id)
+    asyncio.run(_set_file_status(file_id, "failed"))
 
 
 @celery_app.task(name="tasks.process_media", bind=True, max_retries=3)
@@ -119,7 +300,8 @@ async def _process_media_async(file_id: str, storage_key: str, file_name: str):
     ]
 
     # Embed into FAISS
-    embedding_service.ingest_document(file_id, chunk_texts, timestamp_data)
+    owner = await _get_file_owner(file_id)
+    await embedding_service.aingest_document(file_id, chunk_texts, timestamp_data, owner=owner)
 
     # Extract topic-level timestamps using LLM
     topics = await timestamp_service.extract_topics(segments)
@@ -147,3 +329,14 @@ async def _process_media_async(file_id: str, storage_key: str, file_name: str):
             session.add(ts)
 
         await session.commit()
+
+
+@celery_app.task(name="tasks.compact_user_shard")
+def compact_user_shard(owner: str):
+    """
+    Background task: drop deleted files' vectors from a user's consolidated
+    FAISS shard (user_shard layout only).
+    """
+    from vector_store.faiss_index import faiss_index
+
+    return faiss_index.compact(owner)
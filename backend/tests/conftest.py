@@ -1,6 +1,7 @@
 """Shared pytest fixtures for all backend tests."""
 
 import asyncio
+import io
 import os
 import uuid
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -28,6 +29,7 @@ os.environ["REDIS_URL"] = "redis://localhost:6379/15"
 os.environ["CLERK_JWKS_URL"] = "https://test.clerk.dev/.well-known/jwks.json"
 os.environ["CLERK_ISSUER"] = "https://test.clerk.dev"
 os.environ["FAISS_INDEX_PATH"] = "./test_faiss_indices"
+os.environ["EMBEDDING_CACHE_PATH"] = "./test_embedding_cache"
 os.environ["API_KEYS"] = '["test-api-key"]'
 
 from models.database import Base
@@ -95,6 +97,8 @@ def mock_storage():
     mock.upload_file = MagicMock(return_value="test/key/file.pdf")
     mock.get_presigned_url = MagicMock(return_value="https://minio.local/test-url")
     mock.download_file = MagicMock(return_value=b"fake-file-bytes")
+    mock.open_stream = MagicMock(side_effect=lambda key: io.BytesIO(b"fake-file-bytes"))
+    mock.read_stream = MagicMock(return_value=None)
     mock.delete_file = MagicMock()
     mock.file_exists = MagicMock(return_value=True)
     with patch("services.storage_service.storage_service", mock), \
@@ -120,11 +124,13 @@ def mock_embedding_service():
     mock.embed_texts = MagicMock(return_value=[[0.1] * 768])
     mock.embed_query = MagicMock(return_value=[0.1] * 768)
     mock.ingest_document = MagicMock()
+    mock.aingest_document = AsyncMock()
     mock.search_similar = MagicMock(
         return_value=[
             {"text": "sample text", "score": 0.95, "file_id": "test-id"},
         ]
     )
+    mock.asearch_similar = AsyncMock(return_value=mock.search_similar.return_value)
     with patch("routers.search.embedding_service", mock), \
          patch("routers.chat.embedding_service", mock), \
          patch("services.embedding_service.embedding_service", mock):
@@ -157,6 +163,10 @@ def mock_pdf_service():
         return_value=["chunk 1", "chunk 2", "chunk 3"]
     )
     mock.extract_full_text = MagicMock(return_value="Full text of the PDF document.")
+    mock.page_count = MagicMock(return_value=1)
+    mock.iter_pages = MagicMock(
+        side_effect=lambda source, *args: iter([(1, "Full text of the PDF document.")])
+    )
     with patch("services.pdf_service.pdf_service", mock), \
          patch("routers.chat.pdf_service", mock):
         yield mock
@@ -43,7 +43,7 @@ class TestChat:
         file_id = str(uuid.uuid4())
 
         with patch("routers.chat.embedding_service") as mock_embed:
-            mock_embed.search_similar = MagicMock(
+            mock_embed.asearch_similar = AsyncMock(
                 return_value=[
                     {
                         "text": "segment text",
@@ -110,6 +110,62 @@ class TestSummarize:
         assert response.status_code == 200
         assert response.headers["content-type"].startswith("text/event-stream")
 
+    async def test_summarize_pdf_reads_stored_text(
+        self, client, mock_storage, mock_celery, mock_pdf_service, mock_ai_service
+    ):
+        """Text kept at ingest is used instead of downloading and parsing the PDF."""
+        upload_resp = await client.post(
+            "/api/files/upload",
+            files={"file": ("test.pdf", b"%PDF-1.4 test", "application/pdf")},
+        )
+        file_id = upload_resp.json()["fileId"]
+
+        with patch(
+            "routers.chat.text_store.read_text", return_value="Stored text."
+        ) as read_text:
+            response = await client.post("/api/chat/summarize", json={"file_id": file_id})
+
+        assert response.status_code == 200
+        read_text.assert_called_once_with(file_id, limit=50001)
+        mock_storage.open_stream.assert_not_called()
+        mock_pdf_service.iter_pages.assert_not_called()
+
+    async def test_summarize_backfills_text_for_older_pdfs(
+        self, client, mock_storage, mock_celery, mock_pdf_service, mock_ai_service
+    ):
+        """A PDF ingested before text was stored is parsed once and its text saved."""
+        upload_resp = await client.post(
+            "/api/files/upload",
+            files={"file": ("test.pdf", b"%PDF-1.4 test", "application/pdf")},
+        )
+        file_id = upload_resp.json()["fileId"]
+
+        response = await client.post("/api/chat/summarize", json={"file_id": file_id})
+
+        assert response.status_code == 200
+        mock_pdf_service.iter_pages.assert_called_once()
+        mock_storage.upload_stream.assert_called_once()
+        assert mock_storage.upload_stream.call_args[0][1].endswith(f"{file_id}.txt.gz")
+
+    async def test_cached_summary_skips_text_loading(
+        self, client, mock_storage, mock_celery, mock_pdf_service, mock_ai_service
+    ):
+        """A cached summary is served before any text is read."""
+        from core.cache import cache_service
+
+        upload_resp = await client.post(
+            "/api/files/upload",
+            files={"file": ("test.pdf", b"%PDF-1.4 test", "application/pdf")},
+        )
+        file_id = upload_resp.json()["fileId"]
+        await cache_service.set_json(f"chat:summarize:{file_id}", "Cached summary.", ttl_seconds=60)
+
+        response = await client.post("/api/chat/summarize", json={"file_id": file_id})
+
+        assert "Cached summary." in response.text
+        mock_storage.read_stream.assert_not_called()
+        mock_storage.open_stream.assert_not_called()
+
     async def test_summarize_missing_file_id(self, client):
         """Test summarize without file_id."""
         response = await client.post("/api/chat/summarize", json={})
@@ -0,0 +1,325 @@
+"""Tests for embedding generation and the embedding cache."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+from core.config import settings
+from services.embedding_cache import EmbeddingCache
+from services.embedding_providers import HashingEmbeddings, build_provider
+from services.embedding_scheduler import (
+    AdaptiveTokenBucket,
+    batch_by_tokens,
+    embed_in_batches,
+    retry_after_seconds,
+    shared_bucket,
+)
+from services.embedding_service import EmbeddingService
+
+
+def _fake_embed(texts):
+    return [[float(len(text)), 0.5, -0.25] for text in texts]
+
+
+class TestEmbeddingCache:
+    """Tests for the content-addressed chunk embedding cache."""
+
+    @pytest.fixture(autouse=True)
+    def setup_service(self, tmp_path):
+        self.cache_path = str(tmp_path / "embeddings.sqlite")
+        self.service = EmbeddingService()
+        self.service.embeddings_model = MagicMock()
+        self.service.embeddings_model.dimensions = None
+        self.service.embeddings_model.embed_documents = MagicMock(side_effect=_fake_embed)
+        self.service._cache = EmbeddingCache(path=self.cache_path, redis_url="")
+
+    def test_ingest_embeds_only_misses(self):
+        first = self.service.embed_texts(["alpha", "beta", "alpha"])
+        second = self.service.embed_texts(["beta", "gamma"])
+
+        calls = self.service.embeddings_model.embed_documents.call_args_list
+        assert [call.args[0] for call in calls] == [["alpha", "beta"], ["gamma"]]
+        assert first == [[5.0, 0.5, -0.25], [4.0, 0.5, -0.25], [5.0, 0.5, -0.25]]
+        assert second == [[4.0, 0.5, -0.25], [5.0, 0.5, -0.25]]
+
+    def test_cache_persists_and_is_keyed_by_model(self):
+        self.service.embed_texts(["alpha"])
+
+        other = EmbeddingService()
+        other.embeddings_model = self.service.embeddings_model
+        other._cache = EmbeddingCache(path=self.cache_path, redis_url="")
+        other.embed_texts(["alpha"])
+        assert self.service.embeddings_model.embed_documents.call_count == 1
+
+        self.service.embeddings_model.dimensions = 256
+        other.embed_texts(["alpha"])
+        assert self.service.embeddings_model.embed_documents.call_count == 2
+
+    def test_vectors_stored_as_float16_or_float32(self, tmp_path):
+        vector = np.array([0.1234567, -0.5, 1e-3], dtype=np.float32)
+        for dtype, tolerance in (("float16", 1e-3), ("float32", 0)):
+            cache = EmbeddingCache(path=str(tmp_path / f"{dtype}.sqlite"), dtype=dtype, redis_url="")
+            cache.put_many({"k": vector})
+            (blob,) = cache._db().execute("SELECT vector FROM embeddings").fetchone()
+            assert len(blob) == np.dtype(dtype).itemsize * len(vector)
+            assert np.allclose(cache.get_many(["k", "other"])["k"], vector, atol=tolerance)
+
+    def test_shared_tier_fills_local_disk(self, tmp_path):
+        shared = {}
+        redis = MagicMock()
+        redis.mget = MagicMock(side_effect=lambda keys: [shared.get(key) for key in keys])
+        redis.pipeline.return_value.set = MagicMock(
+            side_effect=lambda key, blob, ex: shared.__setitem__(key, blob)
+        )
+
+        node_a = EmbeddingCache(path=str(tmp_path / "a.sqlite"), redis_url="")
+        node_b = EmbeddingCache(path=str(tmp_path / "b.sqlite"), redis_url="")
+        node_a._get_redis = node_b._get_redis = lambda: redis
+        node_a.put_many({"k": [0.5, 0.25]})
+
+        assert np.allclose(node_b.get_many(["k"])["k"], [0.5, 0.25])
+        redis.mget.reset_mock()
+        assert "k" in node_b.get_many(["k"])
+        redis.mget.assert_not_called()
+
+
+class TestQueryEmbeddingCache:
+    """Tests for the query-vector cache and request coalescing."""
+
+    @pytest.fixture(autouse=True)
+    def setup_service(self):
+        self.service = EmbeddingService()
+        self.service.embeddings_model = MagicMock()
+        self.service.embeddings_model.dimensions = None
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_queries_share_one_call(self):
+        import asyncio
+
+        started = asyncio.Event()
+
+        async def slow_embed(query):
+            started.set()
+            await asyncio.sleep(0.05)
+            return [0.25, 0.5]
+
+        self.service.embeddings_model.aembed_query = AsyncMock(side_effect=slow_embed)
+        queries = ["What is RAG?", "what is  rag?", " WHAT IS RAG? "] * 10
+
+        vectors = await asyncio.gather(*(self.service.aembed_query(q) for q in queries))
+
+        assert vectors == [[0.25, 0.5]] * len(queries)
+        self.service.embeddings_model.aembed_query.assert_awaited_once_with("What is RAG?")
+
+    @pytest.mark.asyncio
+    async def test_vectors_are_shared_through_cache_service(self):
+        self.service.embeddings_model.aembed_query = AsyncMock(return_value=[0.25, 0.5])
+        await self.service.aembed_query("pump pressure")
+
+        other = EmbeddingService()
+        other.embeddings_model = self.service.embeddings_model
+        assert await other.aembed_query("Pump pressure") == [0.25, 0.5]
+        assert self.service.embeddings_model.aembed_query.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_embedding_is_not_cached_and_waiter_timeout_is_isolated(self):
+        import asyncio
+
+        calls = []
+
+        async def flaky(query):
+            calls.append(query)
+            await asyncio.sleep(0.05)
+            if len(calls) == 1:
+                raise RuntimeError("rate limited")
+            return [1.0]
+
+        self.service.embeddings_model.aembed_query = AsyncMock(side_effect=flaky)
+        with pytest.raises(RuntimeError):
+            await self.service.aembed_query("q")
+
+        impatient = asyncio.wait_for(self.service.aembed_query("q"), timeout=0.01)
+        patient = self.service.aembed_query("q")
+        results = await asyncio.gather(impatient, patient, return_exceptions=True)
+
+        assert isinstance(results[0], asyncio.TimeoutError)
+        assert results[1] == [1.0]
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_query_batches_embed_only_uncached_queries(self):
+        self.service.embeddings_model.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+        self.service.embeddings_model.aembed_documents = AsyncMock(
+            side_effect=lambda texts: [[float(len(t)), 1.0] for t in texts]
+        )
+        await self.service.aembed_query("pump")
+
+        vectors = await self.service.aembed_queries(["Pump", "seal", "valve", "SEAL "])
+        again = await self.service.aembed_queries(["seal", "valve"])
+
+        assert vectors == [[1.0, 0.0], [4.0, 1.0], [5.0, 1.0], [4.0, 1.0]]
+        assert again == [[4.0, 1.0], [5.0, 1.0]]
+        self.service.embeddings_model.aembed_documents.assert_awaited_once_with(["seal", "valve"])
+        assert await self.service.aembed_query("valve") == [5.0, 1.0]
+        self.service.embeddings_model.aembed_query.assert_awaited_once()
+
+    def test_sync_queries_use_lru(self):
+        self.service.embeddings_model.embed_query = MagicMock(return_value=[0.5])
+        self.service.query_cache.max_entries = 1
+
+        self.service.embed_query("a")
+        self.service.embed_query("A ")
+        self.service.embed_query("b")
+        self.service.embed_query("a")
+
+        assert [c.args[0] for c in self.service.embeddings_model.embed_query.call_args_list] == [
+            "a", "b", "a"
+        ]
+
+
+class _RateLimited(Exception):
+    """Shaped like openai.RateLimitError."""
+
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__("rate limited")
+        self.response = MagicMock(headers=headers)
+
+
+class TestEmbeddingScheduler:
+    """Tests for token-sized batching and adaptive rate limiting at ingest."""
+
+    def test_batches_respect_token_and_item_limits(self):
+        assert batch_by_tokens([3, 3, 3, 3], max_tokens=6, max_items=10) == [[0, 1], [2, 3]]
+        assert batch_by_tokens([1, 1, 1], max_tokens=100, max_items=2) == [[0, 1], [2]]
+        # An oversized input is sent on its own rather than dropped.
+        assert batch_by_tokens([2, 50, 2], max_tokens=10, max_items=10) == [[0], [1], [2]]
+
+    def test_retry_after_headers(self):
+        assert retry_after_seconds(_RateLimited({"retry-after-ms": "250"})) == 0.25
+        assert retry_after_seconds(_RateLimited({"retry-after": "3"})) == 3.0
+        assert retry_after_seconds(_RateLimited({})) == 5.0
+        assert retry_after_seconds(ValueError("boom")) is None
+
+    def test_bucket_backs_off_and_recovers(self):
+        now = [0.0]
+        bucket = AdaptiveTokenBucket(6000, clock=lambda: now[0])
+
+        bucket.throttle(2.0)
+        assert bucket.rate == 50.0
+        assert bucket._paused_until == 2.0
+        bucket.throttle(1.0)
+        assert bucket.rate == 25.0
+        assert bucket._paused_until == 2.0
+
+        for _ in range(100):
+            bucket.recover()
+        assert bucket.rate == bucket.max_rate == 100.0
+
+    def test_shared_bucket_keeps_learned_rate_across_event_loops(self):
+        bucket = shared_bucket("test-model:64", tokens_per_minute=6000)
+        bucket.throttle(0.0)
+
+        assert shared_bucket("test-model:64") is bucket
+        assert shared_bucket("other-model:64", tokens_per_minute=6000) is not bucket
+        # Each Celery task runs in its own event loop; the bucket works in all of them.
+        for _ in range(2):
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(bucket.acquire(1))
+            finally:
+                loop.close()
+        assert bucket.rate < bucket.max_rate
+
+    @pytest.mark.asyncio
+    async def test_concurrent_batches_keep_order_and_retry_429(self, monkeypatch):
+        monkeypatch.setattr("core.config.settings.EMBEDDING_BATCH_MAX_ITEMS", 2)
+        texts = [f"chunk {i}" for i in range(7)]
+        in_flight, peak, failed = [0], [0], []
+
+        async def embed(batch):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            if batch[0] == "chunk 2" and not failed:
+                failed.append(batch)
+                raise _RateLimited({"retry-after-ms": "10"})
+            return [[float(text.split()[1])] for text in batch]
+
+        bucket = AdaptiveTokenBucket(1_000_000)
+        vectors = await embed_in_batches(texts, embed, bucket, concurrency=2)
+
+        assert vectors == [[float(i)] for i in range(7)]
+        assert failed == [["chunk 2", "chunk 3"]]
+        assert peak[0] == 2
+        assert bucket.rate < bucket.max_rate
+
+    @pytest.mark.asyncio
+    async def test_other_errors_are_not_retried(self):
+        embed = AsyncMock(side_effect=ValueError("bad input"))
+
+        with pytest.raises(ValueError):
+            await embed_in_batches(["a"], embed, AdaptiveTokenBucket(1000), max_attempts=3)
+        assert embed.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_async_ingest_embeds_only_misses(self, tmp_path):
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.dimensions = None
+        service.embeddings_model.aembed_documents = AsyncMock(side_effect=_fake_embed)
+        service.scheduled_model = service.embeddings_model
+        service._cache = EmbeddingCache(path=str(tmp_path / "e.sqlite"), redis_url="")
+
+        await service.aembed_documents(["alpha", "beta"])
+        vectors = await service.aembed_documents(["beta", "gamma", "gamma"])
+
+        calls = service.embeddings_model.aembed_documents.await_args_list
+        assert [call.args[0] for call in calls] == [["alpha", "beta"], ["gamma"]]
+        assert vectors == [[4.0, 0.5, -0.25], [5.0, 0.5, -0.25], [5.0, 0.5, -0.25]]
+
+
+class TestEmbeddingProviders:
+    """Tests for provider selection and the local hashing embedder."""
+
+    def test_hashing_embeddings_are_deterministic_and_normalized(self):
+        model = HashingEmbeddings(dimensions=256)
+        pump, seal, other = model.embed_documents(
+            ["XK-200 pump seal", "the XK-200 pump", "quarterly revenue grew"]
+        )
+
+        assert len(pump) == 256
+        assert np.linalg.norm(pump) == pytest.approx(1.0)
+        assert pump == HashingEmbeddings(dimensions=256).embed_query("XK-200 pump seal")
+        assert np.dot(pump, seal) > np.dot(pump, other)
+
+    def test_provider_names_the_vector_space(self, monkeypatch):
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "hashing")
+        monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 64)
+        service = EmbeddingService()
+
+        assert service.provider.remote is False
+        assert service.model_id == "hashing-v1:64"
+        assert len(service.embed_query("hello")) == 64
+        azure = build_provider("azure_openai")
+        assert azure.model_name == settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+        assert azure.model.max_retries > 0
+        assert azure.scheduled_model.max_retries == 0
+        with pytest.raises(ValueError):
+            build_provider("word2vec")
+
+    @pytest.mark.asyncio
+    async def test_local_provider_ingest_skips_rate_limiter(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "hashing")
+        service = EmbeddingService()
+        service._cache = EmbeddingCache(path=str(tmp_path / "e.sqlite"), redis_url="")
+
+        with patch("services.embedding_service.embed_in_batches") as scheduler:
+            vectors = await service.aembed_documents(["alpha", "beta"])
+
+        scheduler.assert_not_called()
+        assert vectors == service.embeddings_model.embed_documents(["alpha", "beta"])
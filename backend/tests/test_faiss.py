@@ -1,13 +1,28 @@
 """Tests for FAISS vector store."""
 
 import os
+import pickle
 import shutil
 import uuid
+from unittest.mock import patch
 
 import numpy as np
 import pytest
 
+from core.config import settings
 from vector_store.faiss_index import FAISSIndex
+from vector_store.index_factory import (
+    EmbeddingModelMismatch,
+    build_index,
+    choose_index_type,
+    recall_at_k,
+    write_vectors,
+)
+from vector_store.index_cache import IndexCache
+from vector_store.metadata_store import load_metadata, write_metadata
+from vector_store.mmr import maximal_marginal_relevance
+from vector_store.neighbors import expand_hits
+from vector_store.usage_log import UsageLog
 
 
 class TestFAISSIndex:
@@ -122,3 +137,949 @@ class TestFAISSIndex:
         )
         results = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)
         assert isinstance(results[0]["score"], float)
+
+    def test_repeat_search_served_from_cache(self):
+        """Second search on an unchanged index should not reload from disk."""
+        self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "hot"}]
+        )
+        self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)
+        with patch("vector_store.faiss_index.faiss.read_index") as mock_read:
+            results = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)
+
+        mock_read.assert_not_called()
+        assert results[0]["text"] == "hot"
+        stats = self.index.cache_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_cache_invalidated_on_rewrite(self):
+        """Re-ingesting a file must not serve stale cached metadata."""
+        self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "old"}]
+        )
+        self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)
+
+        self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "new"}]
+        )
+        results = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)
+        assert results[0]["text"] == "new"
+
+        self.index.delete_index(self.file_id)
+        assert self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0]) == []
+
+    def test_append_keeps_existing_chunks(self):
+        """Appending adds new chunks with fresh IDs without touching old ones."""
+        ids = self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "first"}]
+        )
+        new_ids = self.index.append_embeddings(
+            self.file_id, [[0.0, 1.0, 0.0, 0.0]], [{"text": "second"}]
+        )
+
+        assert ids == [0]
+        assert new_ids == [1]
+        r1 = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)
+        r2 = self.index.search(self.file_id, [0.0, 1.0, 0.0, 0.0], top_k=1)
+        assert r1[0]["text"] == "first"
+        assert r2[0]["text"] == "second"
+        assert r2[0]["chunk_id"] == 1
+
+    def test_append_creates_missing_index(self):
+        ids = self.index.append_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "only"}]
+        )
+        assert ids == [0]
+        assert self.index.index_exists(self.file_id)
+
+    def test_remove_chunks_by_id(self):
+        """Removed chunks disappear from both the index and metadata."""
+        embeddings = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]]
+        metadata = [{"text": "a"}, {"text": "b"}, {"text": "c"}]
+        self.index.add_embeddings(self.file_id, embeddings, metadata)
+
+        assert self.index.remove_chunks(self.file_id, [1]) == 1
+        results = self.index.search(self.file_id, [0.0, 1.0, 0.0, 0.0], top_k=3)
+
+        assert [r["text"] for r in results if r["text"] == "b"] == []
+        assert len(results) == 2
+        assert self.index.append_embeddings(self.file_id, [[0.0, 0.0, 0.0, 1.0]], [{"text": "d"}]) == [3]
+
+    def test_append_upgrades_legacy_index(self):
+        """Indices written before chunk IDs existed can still be appended to."""
+        import faiss
+
+        legacy = faiss.IndexFlatL2(4)
+        legacy.add(np.array([[1.0, 0.0, 0.0, 0.0]], dtype=np.float32))
+        faiss.write_index(legacy, os.path.join(self.index_dir, f"{self.file_id}.index"))
+        with open(os.path.join(self.index_dir, f"{self.file_id}.meta"), "wb") as f:
+            pickle.dump([{"text": "legacy"}], f)
+
+        assert self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=1)[0]["text"] == "legacy"
+        assert self.index.append_embeddings(
+            self.file_id, [[0.0, 1.0, 0.0, 0.0]], [{"text": "new"}]
+        ) == [1]
+        results = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=2)
+        assert [r["text"] for r in results] == ["legacy", "new"]
+
+    def test_search_many_merges_global_top_k(self):
+        """Results from several files are merged by score into one top-k."""
+        file_id_2 = str(uuid.uuid4())
+        self.index.add_embeddings(
+            self.file_id,
+            [[1.0, 0.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]],
+            [{"text": "exact"}, {"text": "far"}],
+        )
+        self.index.add_embeddings(
+            file_id_2, [[0.9, 0.1, 0.0, 0.0]], [{"text": "close"}]
+        )
+
+        results = self.index.search_many(
+            [self.file_id, file_id_2, "missing"], [1.0, 0.0, 0.0, 0.0], top_k=2
+        )
+
+        assert [r["text"] for r in results] == ["exact", "close"]
+        assert results[1]["file_id"] == file_id_2
+
+    def test_search_many_skips_slow_shards(self):
+        """Shards that miss the timeout are dropped instead of blocking."""
+        import threading
+
+        self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "fast"}]
+        )
+        release = threading.Event()
+        original_search = self.index.search
+
+        def search(file_id, *args, **kwargs):
+            if file_id == "slow":
+                release.wait(5)
+                return [{"text": "slow", "score": 0.0}]
+            return original_search(file_id, *args, **kwargs)
+
+        with patch.object(self.index, "search", side_effect=search):
+            results = self.index.search_many(
+                [self.file_id, "slow"], [1.0, 0.0, 0.0, 0.0], top_k=5, timeout=0.2
+            )
+        release.set()
+
+        assert [r["text"] for r in results] == ["fast"]
+
+    def test_search_many_bounds_the_shard_search(self):
+        """A slow user-shard search is dropped at the deadline like a slow file."""
+        import threading
+
+        self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "fast"}]
+        )
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            self.index.add_embeddings(
+                "sharded", [[1.0, 0.0, 0.0, 0.0]], [{"text": "slow"}], owner="a@example.com"
+            )
+            release = threading.Event()
+            original_search = self.index.shards.search
+
+            def search(*args, **kwargs):
+                release.wait(5)
+                return original_search(*args, **kwargs)
+
+            with patch.object(self.index.shards, "search", side_effect=search):
+                results = self.index.search_many(
+                    [self.file_id, "sharded"], [1.0, 0.0, 0.0, 0.0],
+                    top_k=5, timeout=0.2, owner="a@example.com",
+                )
+            release.set()
+
+        assert [r["text"] for r in results] == ["fast"]
+
+    def test_search_batch_returns_results_per_query(self):
+        """A batch of queries is answered in order with one result list each."""
+        embeddings = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]]
+        self.index.add_embeddings(self.file_id, embeddings, [{"text": "x"}, {"text": "y"}])
+
+        batch = self.index.search_batch(
+            self.file_id, [[0.0, 1.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]], top_k=1
+        )
+
+        assert [[r["text"] for r in results] for results in batch] == [["y"], ["x"]]
+        assert self.index.search_batch("missing", [[1.0, 0.0, 0.0, 0.0]]) == [[]]
+
+    def test_two_stage_search_reranks_on_full_vectors(self):
+        """A truncated first-stage index is reranked exactly from the .vec side file."""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((40, 8)).astype(np.float32)
+        metadata = [{"text": f"chunk {i}"} for i in range(len(vectors))]
+        query = rng.standard_normal(8).astype(np.float32)
+
+        with patch.object(settings, "FAISS_FIRST_STAGE_DIM", 4), \
+             patch.object(settings, "FAISS_RERANK_OVERSAMPLE", 10):
+            self.index.add_embeddings(self.file_id, vectors, metadata)
+            results = self.index.search(self.file_id, query, top_k=3)
+
+        exact = ((vectors - query) ** 2).sum(axis=1)
+        assert os.path.exists(os.path.join(self.index_dir, f"{self.file_id}.vec"))
+        assert self.index._load(self.file_id)[0].d == 4
+        assert [r["chunk_id"] for r in results] == np.argsort(exact)[:3].tolist()
+        assert results[0]["score"] == pytest.approx(exact.min(), rel=1e-5)
+
+    def test_two_stage_index_supports_append_and_remove(self):
+        vectors = np.eye(8, dtype=np.float32)[:4]
+        with patch.object(settings, "FAISS_FIRST_STAGE_DIM", 4):
+            self.index.add_embeddings(self.file_id, vectors[:2], [{"text": "a"}, {"text": "b"}])
+            self.index.append_embeddings(self.file_id, vectors[2:], [{"text": "c"}, {"text": "d"}])
+            self.index.remove_chunks(self.file_id, [0])
+
+            results = self.index.search(self.file_id, vectors[3], top_k=1)
+            exported, rows = self.index.export_file(self.file_id)
+
+        assert results[0]["text"] == "d"
+        assert [row["text"] for row in rows] == ["b", "c", "d"]
+        assert np.allclose(exported, vectors[1:])
+
+    def test_two_stage_cache_counts_and_watches_full_vectors(self):
+        """The .vec side file is part of the cached entry's size and staleness check."""
+        vectors = np.eye(8, dtype=np.float32)[:2]
+        with patch.object(settings, "FAISS_FIRST_STAGE_DIM", 4):
+            self.index.add_embeddings(self.file_id, vectors, [{"text": "a"}, {"text": "b"}])
+            self.index.search(self.file_id, vectors[0], top_k=1)
+            paths = self.index._paths(self.file_id)[:3]
+            assert self.index.cache_stats()["bytes"] >= sum(os.path.getsize(p) for p in paths)
+
+            # Rewrite only the full vectors (as another process would): the entry is stale.
+            swapped = vectors[::-1].copy()
+            write_vectors(swapped, self.index._vectors_path(self.file_id))
+            os.utime(self.index._vectors_path(self.file_id), ns=(0, 1))
+            np.testing.assert_array_equal(self.index._load(self.file_id)[2], swapped)
+
+    def test_lexical_search_matches_exact_terms(self):
+        """BM25 finds part numbers that share no meaning with the query embedding."""
+        embeddings = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]]
+        metadata = [
+            {"text": "Replace the filter every month."},
+            {"text": "Part XK-200 fits the pump housing."},
+            {"text": "The pump housing is aluminium."},
+        ]
+        self.index.add_embeddings(self.file_id, embeddings, metadata)
+
+        results = self.index.search_lexical(self.file_id, "xk-200 housing", top_k=3)
+
+        assert [r["chunk_id"] for r in results] == [1, 2]
+        assert results[0]["score"] > results[1]["score"] > 0
+        assert self.index.search_lexical(self.file_id, "nothing here") == []
+
+    def test_lexical_index_follows_append_remove_and_delete(self):
+        self.index.add_embeddings(self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "alpha"}])
+        self.index.append_embeddings(self.file_id, [[0.0, 1.0, 0.0, 0.0]], [{"text": "beta"}])
+        assert [r["text"] for r in self.index.search_lexical(self.file_id, "beta")] == ["beta"]
+
+        self.index.remove_chunks(self.file_id, [0])
+        assert self.index.search_lexical(self.file_id, "alpha") == []
+        assert [r["chunk_id"] for r in self.index.search_lexical(self.file_id, "beta")] == [1]
+
+        self.index.delete_index(self.file_id)
+        assert not os.path.exists(self.index.lexical.path(self.file_id))
+
+    def _add_transcript(self, owner=None):
+        """Six 60-second chunks; chunk i covers [60*i, 60*i + 60)."""
+        embeddings = [[1.0, 0.1 * i, 0.0, 0.0] for i in range(6)]
+        metadata = [
+            {"text": f"minute {i} pump", "start_time": 60.0 * i, "end_time": 60.0 * i + 60}
+            for i in range(6)
+        ]
+        self.index.add_embeddings(self.file_id, embeddings, metadata, owner=owner)
+
+    def test_time_window_restricts_search(self):
+        """Only chunks overlapping the window are candidates, via an ID selector."""
+        self._add_transcript()
+        assert os.path.exists(os.path.join(self.index_dir, f"{self.file_id}.times"))
+
+        results = self.index.search(
+            self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=5, start_time=250, end_time=360
+        )
+        assert sorted(r["chunk_id"] for r in results) == [4, 5]
+
+        open_ended = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], top_k=5, start_time=290)
+        assert sorted(r["chunk_id"] for r in open_ended) == [4, 5]
+        assert self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], start_time=1000) == []
+
+        lexical = self.index.search_lexical(self.file_id, "pump", top_k=5, end_time=59)
+        assert [r["chunk_id"] for r in lexical] == [0]
+
+    def test_time_window_for_legacy_and_sharded_files(self):
+        self._add_transcript()
+        os.remove(os.path.join(self.index_dir, f"{self.file_id}.times"))
+        results = self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0], start_time=0, end_time=30)
+        assert [r["chunk_id"] for r in results] == [0]
+
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            self._add_transcript(owner="a@example.com")
+            results = self.index.search(
+                self.file_id, [1.0, 0.0, 0.0, 0.0], owner="a@example.com", start_time=130, end_time=170
+            )
+        assert [r["chunk_id"] for r in results] == [2]
+
+    def test_get_vectors_reads_stored_embeddings(self):
+        embeddings = np.eye(4, dtype=np.float32)[:3]
+        self.index.add_embeddings(self.file_id, embeddings, [{"text": t} for t in "abc"])
+
+        assert np.allclose(self.index.get_vectors(self.file_id, [2, 0]), embeddings[[2, 0]])
+        assert self.index.get_vectors(self.file_id, [7]) is None
+
+        with patch.object(settings, "FAISS_FIRST_STAGE_DIM", 2):
+            self.index.add_embeddings(self.file_id, embeddings, [{"text": t} for t in "abc"])
+            assert np.allclose(self.index.get_vectors(self.file_id, [1]), embeddings[[1]])
+
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            self.index.add_embeddings(
+                self.file_id, embeddings, [{"text": t} for t in "abc"], owner="a@example.com"
+            )
+            vectors = self.index.get_vectors(self.file_id, [1, 2], owner="a@example.com")
+        assert np.allclose(vectors, embeddings[[1, 2]])
+
+    def _add_pages(self, owner=None):
+        """Five chunks over two pages; consecutive chunks on a page overlap by 2 chars."""
+        pages = [
+            (1, 0, "alpha be"), (1, 6, "beta gam"), (1, 11, "gamma"),
+            (2, 0, "delta"), (2, 5, " eps"),
+        ]
+        metadata = [
+            {"text": text, "file_id": self.file_id, "page": page,
+             "char_start": start, "char_end": start + len(text)}
+            for page, start, text in pages
+        ]
+        embeddings = np.eye(4, dtype=np.float32)[[0, 1, 2, 3, 3]]
+        self.index.add_embeddings(self.file_id, embeddings, metadata, owner=owner)
+
+    def test_chunks_record_adjacency(self):
+        self._add_pages()
+        self.index.remove_chunks(self.file_id, [2])
+        chunks = self.index.get_chunks(self.file_id, [0, 1, 3, 4])
+
+        assert [(c["prev_chunk_id"], c["next_chunk_id"]) for c in chunks] == [
+            (-1, 1), (0, 3), (1, 4), (3, -1)
+        ]
+
+    def test_expand_neighbors_merges_spans(self):
+        self._add_pages()
+        hits = [{**chunk, "score": 0.5} for chunk in self.index.get_chunks(self.file_id, [4, 0])]
+
+        one = self.index.expand_neighbors(self.file_id, hits, window=1)
+        assert [(r["chunk_ids"], r["text"]) for r in one] == [
+            ([3, 4], "delta eps"),
+            ([0, 1], "alpha beta gam"),
+        ]
+        assert (one[1]["char_start"], one[1]["char_end"]) == (0, 14)
+        assert "prev_chunk_id" not in one[0]
+
+        two = self.index.expand_neighbors(self.file_id, hits, window=2)
+        assert len(two) == 1
+        assert two[0]["chunk_ids"] == [0, 1, 2, 3, 4]
+        assert two[0]["text"] == "alpha beta gamma\ndelta eps"
+        assert (two[0]["page"], two[0]["end_page"]) == (1, 2)
+        assert self.index.expand_neighbors(self.file_id, hits, window=0) == hits
+
+    def test_replaced_page_chunks_keep_reading_order(self):
+        self._add_pages()
+        stale = self.index.chunk_ids_on_pages(self.file_id, [1])
+        new_ids = self.index.append_embeddings(
+            self.file_id,
+            np.eye(4, dtype=np.float32)[[0]],
+            [{"text": "new page one", "file_id": self.file_id, "page": 1,
+              "char_start": 0, "char_end": 12}],
+        )
+        self.index.remove_chunks(self.file_id, stale)
+
+        assert stale == [0, 1, 2] and new_ids == [5]
+        hit = self.index.get_chunks(self.file_id, [5])
+        expanded = self.index.expand_neighbors(self.file_id, hit, window=2)
+        assert expanded[0]["chunk_ids"] == [5, 3, 4]
+        assert expanded[0]["text"] == "new page one\ndelta eps"
+
+    def test_expand_neighbors_in_shard_and_legacy_rows(self):
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            self._add_pages(owner="a@example.com")
+            hit = self.index.get_chunks(self.file_id, [2], owner="a@example.com")
+            expanded = self.index.expand_neighbors(self.file_id, hit, 1, owner="a@example.com")
+        assert expanded[0]["chunk_ids"] == [1, 2, 3]
+
+        # Rows written before adjacency was recorded fall back to chunk_id ± 1.
+        rows = [{"text": t, "chunk_id": i} for i, t in enumerate(["x", "y", "z"])]
+        legacy = expand_hits([rows[2]], 1, lambda ids: [rows[i] for i in ids if i < len(rows)])
+        assert legacy[0]["text"] == "y\nz"
+
+
+    def test_warm_loads_index_into_cache(self):
+        self.index.add_embeddings(self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "a"}])
+
+        assert self.index.warm(self.file_id) > 0
+        entries = self.index.cache_stats()["entries"]
+        self.index.search(self.file_id, [1.0, 0.0, 0.0, 0.0])
+        assert self.index.cache_stats()["entries"] == entries
+        assert self.index.cache_stats()["misses"] == 3  # index, time index, postings
+        assert self.index.warm("missing") == 0
+
+    def test_prewarm_follows_usage_within_budget(self):
+        for file_id in ("cold", "hot", "warm"):
+            self.index.add_embeddings(file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": file_id}])
+        for _ in range(3):
+            self.index.search("hot", [1.0, 0.0, 0.0, 0.0])
+        self.index.search("warm", [1.0, 0.0, 0.0, 0.0])
+        self.index.usage.save()
+
+        restarted = FAISSIndex(index_dir=self.index_dir, dimension=4)
+        assert restarted.prewarm() == ["hot", "warm"]
+        one_file = restarted.warm("hot")
+        assert FAISSIndex(index_dir=self.index_dir, dimension=4).prewarm(one_file) == ["hot"]
+
+        os.remove(os.path.join(self.index_dir, "usage.json"))
+        recent = FAISSIndex(index_dir=self.index_dir, dimension=4).prewarm()
+        assert sorted(recent) == ["cold", "hot", "warm"]
+
+
+    def test_index_is_tagged_with_embedding_model(self):
+        assert self.index.embedding_model(self.file_id) is None
+        self.index.add_embeddings(
+            self.file_id, [[1.0, 0.0, 0.0, 0.0]], [{"text": "a"}], embedding_model="m:native"
+        )
+        assert self.index.embedding_model(self.file_id) == "m:native"
+
+        self.index.append_embeddings(
+            self.file_id, [[0.0, 1.0, 0.0, 0.0]], [{"text": "b"}], embedding_model="m:native"
+        )
+        self.index.remove_chunks(self.file_id, [0])
+        assert self.index.embedding_model(self.file_id) == "m:native"
+
+        with pytest.raises(EmbeddingModelMismatch):
+            self.index.append_embeddings(
+                self.file_id, [[0.0, 0.0, 1.0, 0.0]], [{"text": "c"}], embedding_model="other:x"
+            )
+        # Re-indexing the whole file with another model replaces the tag.
+        self.index.add_embeddings(
+            self.file_id, [[0.0, 0.0, 1.0]], [{"text": "c"}], embedding_model="other:native"
+        )
+        assert self.index.embedding_model(self.file_id) == "other:native"
+
+
+class TestUsageLog:
+    """Tests for the persisted per-file usage scores."""
+
+    def test_processes_merge_their_usage(self, tmp_path):
+        path = str(tmp_path / "usage.json")
+        first, second = UsageLog(path), UsageLog(path)
+        first.record("a", "x@example.com")
+        second.record("b")
+        second.record("b")
+        first.save()
+        second.save()
+
+        assert UsageLog(path).hottest() == [("b", None), ("a", "x@example.com")]
+
+        second.forget("b")
+        second.save()
+        assert UsageLog(path).hottest() == [("a", "x@example.com")]
+
+
+class TestMaximalMarginalRelevance:
+    """Tests for MMR re-ranking."""
+
+    def test_skips_near_duplicates(self):
+        query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+        vectors = np.array(
+            [[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7]], dtype=np.float32
+        )
+
+        assert maximal_marginal_relevance(query, vectors, 2) == [0, 2]
+        assert maximal_marginal_relevance(query, vectors, 2, lambda_mult=1.0) == [0, 1]
+
+    def test_handles_small_pools(self):
+        query = np.ones(4, dtype=np.float32)
+        assert maximal_marginal_relevance(query, np.eye(4)[:2], 5) in ([0, 1], [1, 0])
+        assert maximal_marginal_relevance(query, np.zeros((0, 4)), 3) == []
+
+
+class TestIndexCache:
+    """Tests for the LRU index cache."""
+
+    def test_evicts_least_recently_used(self):
+        cache = IndexCache(max_bytes=100, max_entries=2)
+        cache.put("a", 1, "A", nbytes=10)
+        cache.put("b", 1, "B", nbytes=10)
+        cache.get("a", 1)
+        cache.put("c", 1, "C", nbytes=10)
+
+        assert cache.get("b", 1) is None
+        assert cache.get("a", 1) == "A"
+        assert cache.stats()["evictions"] == 1
+
+    def test_respects_byte_budget(self):
+        cache = IndexCache(max_bytes=25, max_entries=10)
+        cache.put("a", 1, "A", nbytes=10)
+        cache.put("b", 1, "B", nbytes=10)
+        cache.put("c", 1, "C", nbytes=10)
+
+        stats = cache.stats()
+        assert stats["bytes"] <= 25
+        assert stats["entries"] == 2
+
+    def test_signature_mismatch_is_miss(self):
+        cache = IndexCache(max_bytes=100, max_entries=10)
+        cache.put("a", (1, 1), "A", nbytes=10)
+
+        assert cache.get("a", (2, 1)) is None
+        assert cache.stats()["entries"] == 0
+
+
+class TestMetadataStore:
+    """Tests for the columnar metadata layout."""
+
+    def test_round_trip_mixed_columns(self, tmp_path):
+        path = str(tmp_path / "f.meta")
+        rows = [
+            {"text": "héllo wörld", "start_time": 1.5, "page": 1},
+            {"text": "", "start_time": None, "page": 2, "tags": ["a"]},
+        ]
+        write_metadata(path, rows)
+
+        store = load_metadata(path)
+        assert len(store) == 2
+        assert store[0]["text"] == "héllo wörld"
+        assert store[0]["start_time"] == 1.5
+        assert store[0] == {"text": "héllo wörld", "start_time": 1.5, "page": 1}
+        assert store[1] == {"text": "", "start_time": None, "page": 2, "tags": ["a"]}
+
+    def test_int_columns_with_none_stay_int(self, tmp_path):
+        path = str(tmp_path / "f.meta")
+        rows = [
+            {"prev_chunk_id": None, "next_chunk_id": 1, "page": 1},
+            {"prev_chunk_id": 0, "next_chunk_id": None, "page": None, "start_time": 3.0},
+        ]
+        write_metadata(path, rows)
+
+        store = load_metadata(path)
+        assert list(store) == rows
+        assert type(store[0]["next_chunk_id"]) is int and type(store[0]["page"]) is int
+        np.testing.assert_array_equal(store.column("page"), [1.0, np.nan])
+        assert store.column("next_chunk_id").dtype == np.float64
+
+    def test_reads_without_mmap(self, tmp_path):
+        path = str(tmp_path / "f.meta")
+        write_metadata(path, [{"text": "a"}, {"text": "b"}])
+
+        store = load_metadata(path, mmap=False)
+        assert [row["text"] for row in store] == ["a", "b"]
+
+    def test_legacy_pickle_metadata(self, tmp_path):
+        path = str(tmp_path / "f.meta")
+        with open(path, "wb") as f:
+            pickle.dump([{"text": "legacy"}], f)
+
+        assert load_metadata(path) == [{"text": "legacy"}]
+
+
+class TestIndexFactory:
+    """Tests for index type selection and quantized index recall."""
+
+    def test_auto_uses_flat_for_small_files(self):
+        assert choose_index_type(10, "auto") == "flat"
+
+    def test_auto_switches_to_quantized_for_large_files(self):
+        with patch.object(settings, "FAISS_FLAT_MAX_VECTORS", 100), \
+             patch.object(settings, "FAISS_QUANTIZED_INDEX_TYPE", "fp16"):
+            assert choose_index_type(101, "auto") == "fp16"
+
+    def test_ivfpq_falls_back_without_enough_training_data(self):
+        assert choose_index_type(500, "ivfpq") == "sq8"
+
+    def test_unknown_index_type_raises(self):
+        with pytest.raises(ValueError):
+            choose_index_type(10, "hnsw")
+
+    def test_sq8_recall_against_flat_baseline(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((2000, 32)).astype(np.float32)
+        queries = vectors[:50]
+
+        index = build_index(vectors, "sq8")
+        assert recall_at_k(vectors, queries, index, k=5) >= 0.9
+
+    def test_quantized_index_round_trip(self, tmp_path):
+        store = FAISSIndex(index_dir=str(tmp_path), dimension=4)
+        embeddings = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]]
+        metadata = [{"text": "a"}, {"text": "b"}]
+
+        with patch.object(settings, "FAISS_INDEX_TYPE", "fp16"):
+            store.add_embeddings("f", embeddings, metadata)
+
+        results = store.search("f", [0.0, 1.0, 0.0, 0.0], top_k=1)
+        assert results[0]["text"] == "b"
+
+
+class TestUserShards:
+    """Tests for the per-user consolidated shard layout."""
+
+    @pytest.fixture(autouse=True)
+    def setup_shards(self, tmp_path):
+        self.index = FAISSIndex(index_dir=str(tmp_path), dimension=4)
+        self.owner = "test@example.com"
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            yield
+
+    def _add(self, file_id, vectors, texts):
+        self.index.add_embeddings(
+            file_id, vectors, [{"text": t} for t in texts], owner=self.owner
+        )
+
+    def test_lexical_search_reads_chunks_from_shard(self):
+        self._add("a", [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]], ["gasket", "XK-200 seal"])
+
+        results = self.index.search_lexical("a", "XK-200", owner=self.owner)
+
+        assert [(r["text"], r["file_id"], r["chunk_id"]) for r in results] == [("XK-200 seal", "a", 1)]
+        assert "label" not in results[0]
+
+    def test_files_share_one_shard(self, tmp_path):
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["a1"])
+        self._add("b", [[0.9, 0.1, 0.0, 0.0]], ["b1"])
+
+        assert not os.path.exists(tmp_path / "a.index")
+        suffixes = sorted(name.split(".", 1)[1] for name in os.listdir(tmp_path / "shards"))
+        assert suffixes == ["files.json", "index", "lock", "meta"]
+        assert self.index.index_exists("a", owner=self.owner)
+
+    def test_search_filters_by_file(self):
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["a1"])
+        self._add("b", [[0.9, 0.1, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]], ["b1", "b2"])
+
+        results = self.index.search("b", [1.0, 0.0, 0.0, 0.0], top_k=5, owner=self.owner)
+        assert [r["text"] for r in results] == ["b1", "b2"]
+        assert all(r["file_id"] == "b" for r in results)
+
+        merged = self.index.search_many(["a", "b"], [1.0, 0.0, 0.0, 0.0], top_k=2, owner=self.owner)
+        assert [r["text"] for r in merged] == ["a1", "b1"]
+
+    def test_reingest_replaces_file_vectors(self):
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["old"])
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["new"])
+
+        results = self.index.search("a", [1.0, 0.0, 0.0, 0.0], top_k=5, owner=self.owner)
+        assert [r["text"] for r in results] == ["new"]
+
+    def test_delete_tombstones_then_compacts(self):
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["a1"])
+        self._add("b", [[0.0, 1.0, 0.0, 0.0]], ["b1"])
+
+        self.index.delete_index("a", owner=self.owner)
+        assert not self.index.index_exists("a", owner=self.owner)
+        assert self.index.search_many(["a", "b"], [1.0, 0.0, 0.0, 0.0], owner=self.owner)[0]["text"] == "b1"
+        assert self.index.needs_compaction(self.owner)
+
+        assert self.index.compact(self.owner) == 1
+        assert not self.index.needs_compaction(self.owner)
+        assert self.index.search("b", [0.0, 1.0, 0.0, 0.0], owner=self.owner)[0]["text"] == "b1"
+
+    def test_append_and_remove_chunks_in_shard(self):
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["a1"])
+        ids = self.index.append_embeddings(
+            "a", [[0.0, 1.0, 0.0, 0.0]], [{"text": "a2"}], owner=self.owner
+        )
+        assert ids == [1]
+
+        assert self.index.remove_chunks("a", [0], owner=self.owner) == 1
+        results = self.index.search("a", [1.0, 0.0, 0.0, 0.0], top_k=5, owner=self.owner)
+        assert [r["text"] for r in results] == ["a2"]
+
+    def test_unmigrated_files_fall_back_to_per_file_index(self):
+        self.index.add_embeddings("legacy", [[1.0, 0.0, 0.0, 0.0]], [{"text": "old"}])
+
+        results = self.index.search("legacy", [1.0, 0.0, 0.0, 0.0], owner=self.owner)
+        assert results[0]["text"] == "old"
+
+        vectors, rows = self.index.export_file("legacy")
+        self.index.shards.add_file(self.owner, "legacy", vectors, rows)
+        self.index.delete_index("legacy")
+
+        results = self.index.search("legacy", [1.0, 0.0, 0.0, 0.0], owner=self.owner)
+        assert results[0]["text"] == "old"
+        assert self.index.shards.has_file(self.owner, "legacy")
+
+
+    def test_migrated_chunks_keep_ids_for_keyword_search(self):
+        """After a removal, migrated chunk IDs still match the file's BM25 postings."""
+        self.index.add_embeddings(
+            "old",
+            [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]],
+            [{"text": "intro"}, {"text": "warranty terms"}, {"text": "XK-200 pump seal"}],
+        )
+        self.index.remove_chunks("old", [0])
+
+        vectors, rows = self.index.export_file("old")
+        self.index.shards.add_file(
+            self.owner, "old", vectors, rows, chunk_ids=[row["chunk_id"] for row in rows]
+        )
+        self.index.delete_file_index("old")
+
+        hits = self.index.search_lexical("old", "XK-200", top_k=1, owner=self.owner)
+        assert [(hit["chunk_id"], hit["text"]) for hit in hits] == [(2, "XK-200 pump seal")]
+        new_ids = self.index.append_embeddings(
+            "old", [[0.0, 0.0, 0.0, 1.0]], [{"text": "appendix"}], owner=self.owner
+        )
+        assert new_ids == [3]
+
+    def test_shard_updates_wait_for_other_processes(self, tmp_path):
+        """A writer holding the shard's flock (e.g. the worker) blocks a delete until it is done."""
+        import fcntl
+        import threading
+
+        self._add("a", [[1.0, 0.0, 0.0, 0.0]], ["a1"])
+        lock_path = tmp_path / "shards" / f"{self.index.shards._shard_name(self.owner)}.lock"
+        # A separate open file description conflicts like another process would.
+        with open(lock_path, "a") as other_process:
+            fcntl.flock(other_process, fcntl.LOCK_EX)
+            deleter = threading.Thread(target=self.index.shards.delete_file, args=(self.owner, "a"))
+            deleter.start()
+            deleter.join(0.2)
+            assert deleter.is_alive()
+            assert self.index.shards.has_file(self.owner, "a")
+            fcntl.flock(other_process, fcntl.LOCK_UN)
+        deleter.join(5)
+
+        assert not deleter.is_alive()
+        assert not self.index.shards.has_file(self.owner, "a")
+
+    def test_shard_holds_one_embedding_model(self):
+        self.index.add_embeddings(
+            "a", [[1.0, 0.0, 0.0, 0.0]], [{"text": "a1"}], owner=self.owner, embedding_model="m:4"
+        )
+        assert self.index.embedding_model("a", owner=self.owner) == "m:4"
+
+        with pytest.raises(EmbeddingModelMismatch):
+            self.index.add_embeddings(
+                "b", [[1.0, 0.0]], [{"text": "b1"}], owner=self.owner, embedding_model="other:2"
+            )
+        # Re-indexing the shard's only file with a new model switches the shard over.
+        self.index.add_embeddings(
+            "a", [[1.0, 0.0]], [{"text": "a1"}], owner=self.owner, embedding_model="other:2"
+        )
+        assert self.index.embedding_model("a", owner=self.owner) == "other:2"
+        assert self.index.search("a", [1.0, 0.0], owner=self.owner)[0]["text"] == "a1"
+
+
+class TestVectorSearchSidecar:
+    """FAISSIndex as a thin client of the vector-search sidecar."""
+
+    @pytest.fixture(autouse=True)
+    def setup_sidecar(self, tmp_path):
+        from fastapi.testclient import TestClient
+        from vector_store import search_server
+
+        index_dir = str(tmp_path / "faiss_sidecar")
+        self.server_index = FAISSIndex(index_dir=index_dir, dimension=4, search_url="")
+        self.client_index = FAISSIndex(
+            index_dir=index_dir, dimension=4, search_url="http://vector-search"
+        )
+        self.client_index._remote._client = TestClient(search_server.app)
+        with patch.object(search_server, "index", self.server_index):
+            yield
+
+    def test_searches_are_served_by_sidecar(self):
+        """The client writes to disk; the sidecar loads and answers the search."""
+        self.client_index.add_embeddings(
+            "f1", [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]], [{"text": "a"}, {"text": "b"}]
+        )
+        self.client_index.add_embeddings("f2", [[0.0, 0.9, 0.1, 0.0]], [{"text": "c"}])
+
+        batch = self.client_index.search_batch("f1", [[0.0, 1.0, 0.0, 0.0]], top_k=1)
+        merged = self.client_index.search_many(["f1", "f2"], [0.0, 1.0, 0.0, 0.0], top_k=2)
+
+        assert batch == [
+            [{"text": "b", "chunk_id": 1, "prev_chunk_id": 0, "next_chunk_id": -1, "score": 0.0}]
+        ]
+        assert [r["text"] for r in merged] == ["b", "c"]
+        assert self.server_index.cache_stats()["misses"] == 2
+        assert self.client_index.cache_stats()["misses"] == 0
+
+    def test_searches_are_counted_once_by_the_process_that_runs_them(self):
+        """Only the sidecar records a forwarded search; the API saves no usage of its own."""
+        self.client_index.add_embeddings("f1", [[1.0, 0.0, 0.0, 0.0]], [{"text": "pump"}])
+
+        self.client_index.search("f1", [1.0, 0.0, 0.0, 0.0])
+        self.client_index.search_lexical("f1", "pump")
+
+        assert [f for f, _ in self.server_index.usage.hottest()] == ["f1"]
+        assert self.server_index.usage._pending["f1"]["score"] == pytest.approx(1.0)
+        assert self.client_index.usage.hottest() == []
+        self.client_index.usage.save()
+        assert not os.path.exists(self.client_index.usage.path)
+
+    def test_chunk_lookups_do_not_load_indices_in_the_client(self):
+        """Lexical search, neighbours and MMR vectors never load an index client-side."""
+        owner = "a@example.com"
+        self.client_index.add_embeddings(
+            "f1",
+            [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]],
+            [{"text": "pump seal"}, {"text": "valve"}, {"text": "motor"}],
+        )
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            self.client_index.add_embeddings(
+                "s1", [[0.0, 1.0, 0.0, 0.0]], [{"text": "shard pump"}], owner=owner
+            )
+
+        with patch.object(self.client_index, "_load", side_effect=AssertionError), \
+             patch.object(self.client_index.shards, "_load", side_effect=AssertionError), \
+             patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            lexical = self.client_index.search_lexical("f1", "pump", top_k=1)
+            spans = self.client_index.expand_neighbors("f1", lexical, 1)
+            vectors = self.client_index.get_vectors("f1", [1, 0])
+            shard_vectors = self.client_index.get_vectors("s1", [0], owner=owner)
+            shard_chunks = self.client_index.get_chunks("s1", [0], owner=owner)
+
+        assert lexical[0]["text"] == "pump seal"
+        assert spans[0]["chunk_ids"] == [0, 1]
+        np.testing.assert_allclose(vectors, [[0.0, 1.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]])
+        np.testing.assert_allclose(shard_vectors, [[0.0, 1.0, 0.0, 0.0]])
+        assert shard_chunks[0]["text"] == "shard pump"
+
+    def test_falls_back_in_process_when_sidecar_is_down(self):
+        index = FAISSIndex(
+            index_dir=self.server_index.index_dir,
+            dimension=4,
+            search_url="http://127.0.0.1:9",
+        )
+        index.add_embeddings("f1", [[1.0, 0.0, 0.0, 0.0]], [{"text": "a"}])
+
+        assert index.search("f1", [1.0, 0.0, 0.0, 0.0])[0]["text"] == "a"
+        assert not index._remote.available
+
+    def test_sidecar_errors_are_raised_without_fallback(self):
+        """A failing search is reported as is; the sidecar stays in use for other requests."""
+        import httpx
+        from fastapi.testclient import TestClient
+        from vector_store import search_server
+
+        self.client_index.add_embeddings("f1", [[1.0, 0.0, 0.0, 0.0]], [{"text": "a"}])
+        self.client_index._remote._client = TestClient(
+            search_server.app, raise_server_exceptions=False
+        )
+
+        with patch.object(self.server_index, "search_batch", side_effect=RuntimeError("bad index")), \
+             patch.object(self.client_index, "_load", side_effect=AssertionError):
+            with pytest.raises(httpx.HTTPStatusError):
+                self.client_index.search("f1", [1.0, 0.0, 0.0, 0.0])
+
+        assert self.client_index._remote.available
+        assert self.client_index.search("f1", [1.0, 0.0, 0.0, 0.0])[0]["text"] == "a"
+
+
+class _DirStorage:
+    """Object store double backed by a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.uploads = 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def upload_path(self, local_path, key):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        shutil.copyfile(local_path, self._path(key))
+        self.uploads += 1
+        return key
+
+    def download_to_path(self, key, local_path):
+        shutil.copyfile(self._path(key), local_path)
+
+    def get_object_info(self, key):
+        if not os.path.exists(self._path(key)):
+            return None
+        stat = os.stat(self._path(key))
+        return {"size": stat.st_size, "modified": float(int(stat.st_mtime))}
+
+    def delete_file(self, key):
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+
+class TestIndexStorageTier:
+    """Object storage as the source of truth, local index dir as a disk cache."""
+
+    @pytest.fixture(autouse=True)
+    def setup_nodes(self, tmp_path):
+        from vector_store.storage_tier import IndexStorageTier
+
+        self.storage = _DirStorage(str(tmp_path / "bucket"))
+
+        def node(name):
+            index = FAISSIndex(index_dir=str(tmp_path / name), dimension=4, search_url="")
+            index.tier = IndexStorageTier(index.index_dir, storage=self.storage, enabled=True)
+            index.shards._tier = index.tier
+            return index
+
+        self.node_a = node("node_a")
+        self.node_b = node("node_b")
+        with patch.object(settings, "FAISS_REMOTE_REVALIDATE_SECONDS", 0.0):
+            yield
+
+    def test_other_node_rehydrates_and_sees_updates(self):
+        self.node_a.add_embeddings("f1", [[1.0, 0.0, 0.0, 0.0]], [{"text": "v1"}])
+        assert self.node_b.search("f1", [1.0, 0.0, 0.0, 0.0])[0]["text"] == "v1"
+
+        self.node_a.append_embeddings("f1", [[0.0, 1.0, 0.0, 0.0]], [{"text": "v2"}])
+        assert self.node_b.search("f1", [0.0, 1.0, 0.0, 0.0])[0]["text"] == "v2"
+
+        self.node_b.delete_index("f1")
+        assert self.node_a.search("f1", [1.0, 0.0, 0.0, 0.0]) != []  # stale local copy
+        assert not self.node_b.index_exists("f1")
+
+    def test_cold_files_are_offloaded_and_rehydrated(self):
+        self.node_a.add_embeddings("cold", [[1.0, 0.0, 0.0, 0.0]], [{"text": "cold"}])
+        cold_bytes = sum(os.path.getsize(p) for p in self.node_a._paths("cold")[:2])
+
+        with patch.object(settings, "FAISS_LOCAL_DISK_MAX_BYTES", int(cold_bytes * 1.5)):
+            self.node_a.add_embeddings("hot", [[0.0, 1.0, 0.0, 0.0]], [{"text": "hot"}])
+            assert not os.path.exists(self.node_a._index_path("cold"))
+            assert os.path.exists(self.node_a._index_path("hot"))
+
+            results = self.node_a.search("cold", [1.0, 0.0, 0.0, 0.0])
+        assert results[0]["text"] == "cold"
+
+    def test_cold_download_does_not_block_other_files(self):
+        import threading
+
+        self.node_a.add_embeddings("slow", [[1.0, 0.0, 0.0, 0.0]], [{"text": "slow"}])
+        self.node_b.add_embeddings("warm", [[0.0, 1.0, 0.0, 0.0]], [{"text": "warm"}])
+        started, release = threading.Event(), threading.Event()
+        download = self.storage.download_to_path
+
+        def slow_download(key, local_path):
+            started.set()
+            release.wait(5)
+            download(key, local_path)
+
+        with patch.object(self.storage, "download_to_path", side_effect=slow_download):
+            tier = self.node_b.tier
+            cold = threading.Thread(target=tier.ensure_local, args=(self.node_b._paths("slow"),))
+            cold.start()
+            assert started.wait(5)
+            warm = threading.Thread(target=tier.ensure_local, args=(self.node_b._paths("warm"),))
+            warm.start()
+            warm.join(2)
+            assert not warm.is_alive()
+            release.set()
+            cold.join(5)
+        assert os.path.exists(self.node_b._index_path("slow"))
+
+    def test_writes_do_not_rescan_the_index_directory(self):
+        with patch("vector_store.storage_tier.os.walk", wraps=os.walk) as walk:
+            for n in range(3):
+                self.node_a.add_embeddings(f"f{n}", [[1.0, 0.0, 0.0, 0.0]], [{"text": "x"}])
+        assert walk.call_count == 1
+
+    def test_user_shards_are_published(self):
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"):
+            self.node_a.add_embeddings(
+                "f1", [[1.0, 0.0, 0.0, 0.0]], [{"text": "shard"}], owner="a@example.com"
+            )
+            results = self.node_b.search("f1", [1.0, 0.0, 0.0, 0.0], owner="a@example.com")
+        assert results[0]["text"] == "shard"
@@ -146,6 +146,36 @@ class TestFileRetrieval:
         assert data["fileType"] == "pdf"
         assert "fileUrl" in data
 
+    async def test_get_ready_file_warms_its_index(self, client, db_session, mock_storage):
+        """Opening a ready file loads its index in the background."""
+        import asyncio
+
+        from models.file import File as FileModel
+
+        mock_storage.get_presigned_url = MagicMock(return_value="https://minio/url")
+        file_id = uuid.uuid4()
+        db_session.add(
+            FileModel(
+                file_id=file_id,
+                file_name="doc.pdf",
+                file_type="pdf",
+                storage_key=f"pdf/{file_id}/doc.pdf",
+                created_by="test@example.com",
+                status="ready",
+            )
+        )
+        await db_session.commit()
+
+        with patch("vector_store.faiss_index.faiss_index.warm", return_value=0) as warm:
+            response = await client.get(f"/api/files/{file_id}")
+            for _ in range(50):
+                if warm.called:
+                    break
+                await asyncio.sleep(0.01)
+
+        assert response.status_code == 200
+        warm.assert_called_once_with(str(file_id), "test@example.com")
+
     async def test_list_files_empty(self, client):
         """Test listing files when none exist."""
         response = await client.get("/api/files")
@@ -196,6 +226,95 @@ class TestFileRetrieval:
 class TestFileDelete:
     """Tests for DELETE /api/files/{file_id}"""
 
+    async def test_replace_pdf_keeps_file_id_and_reprocesses(
+        self, client, mock_storage, mock_celery
+    ):
+        """A new version of a PDF is stored under the same file ID and re-ingested."""
+        upload_resp = await client.post(
+            "/api/files/upload",
+            files={"file": ("v1.pdf", b"%PDF-1.4 one", "application/pdf")},
+        )
+        file_id = upload_resp.json()["fileId"]
+
+        with patch("routers.files.process_pdf") as process_pdf:
+            response = await client.put(
+                f"/api/files/{file_id}",
+                files={"file": ("v2.pdf", b"%PDF-1.4 two", "application/pdf")},
+            )
+
+        assert response.status_code == 200
+        assert response.json()["fileName"] == "v2.pdf"
+        process_pdf.delay.assert_called_once_with(file_id, f"pdf/{file_id}/v2.pdf")
+        mock_storage.delete_file.assert_called_once_with(f"pdf/{file_id}/v1.pdf")
+        data = (await client.get(f"/api/files/{file_id}")).json()
+        assert (data["fileName"], data["status"]) == ("v2.pdf", "processing")
+
+    async def test_replace_rejects_non_pdfs(self, client, mock_storage, mock_celery):
+        """Only PDFs can be replaced."""
+        upload_resp = await client.post(
+            "/api/files/upload",
+            files={"file": ("a.mp3", b"ID3", "audio/mpeg")},
+        )
+        file_id = upload_resp.json()["fileId"]
+
+        response = await client.put(
+            f"/api/files/{file_id}",
+            files={"file": ("a.pdf", b"%PDF-1.4", "application/pdf")},
+        )
+        assert response.status_code == 400
+
+        missing = await client.put(
+            f"/api/files/{uuid.uuid4()}",
+            files={"file": ("a.pdf", b"%PDF-1.4", "application/pdf")},
+        )
+        assert missing.status_code == 404
+
+    async def test_replace_requires_owner(self, client, db_session, mock_storage, mock_celery):
+        """Another user's PDF cannot be replaced."""
+        from models.file import File as FileModel
+
+        file_id = uuid.uuid4()
+        db_session.add(
+            FileModel(
+                file_id=file_id,
+                file_name="theirs.pdf",
+                file_type="pdf",
+                storage_key=f"pdf/{file_id}/theirs.pdf",
+                created_by="other@example.com",
+                status="ready",
+            )
+        )
+        await db_session.commit()
+
+        response = await client.put(
+            f"/api/files/{file_id}",
+            files={"file": ("mine.pdf", b"%PDF-1.4", "application/pdf")},
+        )
+        assert response.status_code == 403
+        mock_storage.upload_file.assert_not_called()
+        mock_celery["pdf"].delay.assert_not_called()
+
+    async def test_replace_purges_cached_search_results(self, client, mock_storage, mock_celery):
+        """Search hits from the old version are dropped; other files keep theirs."""
+        from core.cache import cache_service
+
+        upload_resp = await client.post(
+            "/api/files/upload",
+            files={"file": ("v1.pdf", b"%PDF-1.4 one", "application/pdf")},
+        )
+        file_id = upload_resp.json()["fileId"]
+        other = str(uuid.uuid4())
+        for key in (f"search:{file_id}:5:hybrid:pump", f"search:{other}:5:hybrid:pump"):
+            await cache_service.set_json(key, [{"text": "old"}], ttl_seconds=60)
+
+        await client.put(
+            f"/api/files/{file_id}",
+            files={"file": ("v2.pdf", b"%PDF-1.4 two", "application/pdf")},
+        )
+
+        assert await cache_service.get_json(f"search:{file_id}:5:hybrid:pump") is None
+        assert await cache_service.get_json(f"search:{other}:5:hybrid:pump") is not None
+
     async def test_delete_file_not_found(self, client):
         """Test deleting a file that doesn't exist."""
         fake_id = str(uuid.uuid4())
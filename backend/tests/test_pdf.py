@@ -0,0 +1,440 @@
+"""Tests for PDF text extraction and chunking."""
+
+import io
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from services.pdf_service import PDFService
+from services.text_chunker import TextChunker
+from services.ingest_partitions import IngestProgress, PartitionStore, page_ranges, page_runs
+from services.text_store import TextStore, TextWriter, changed_pages, page_hash
+
+
+def _make_pdf(pages):
+    """A PDF with one page per string, each line drawn in Helvetica."""
+    writer = PdfWriter()
+    font = writer._add_object(
+        DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+    )
+    for text in pages:
+        page = writer.add_blank_page(width=612, height=792)
+        lines = "".join(f"({line}) Tj 0 -14 Td " for line in text.split("\n"))
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td {lines}ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class TestPDFService:
+    """Tests for page-by-page PDF extraction."""
+
+    def test_pages_are_read_from_bytes_or_stream(self):
+        pdf = _make_pdf(["Pump manual", "", "Warranty terms"])
+        service = PDFService()
+
+        pages = list(service.iter_pages(pdf))
+        assert [(number, text.strip()) for number, text in pages] == [
+            (1, "Pump manual"),
+            (2, ""),
+            (3, "Warranty terms"),
+        ]
+        assert list(service.iter_pages(io.BytesIO(pdf))) == pages
+        assert service.extract_full_text(pdf) == " ".join(text for _, text in pages)
+
+    def test_chunks_keep_page_and_offsets(self):
+        pdf = _make_pdf(["alpha beta gamma delta", "epsilon zeta"])
+        service = PDFService(chunk_size=12, chunk_overlap=0)
+
+        chunks = service.extract_chunks(io.BytesIO(pdf))
+
+        assert [(c["text"], c["page"], c["char_start"]) for c in chunks] == [
+            ("alpha beta", 1, 0),
+            ("gamma delta", 1, 11),
+            ("epsilon zeta", 2, 0),
+        ]
+        assert all(c["char_end"] == c["char_start"] + len(c["text"]) for c in chunks)
+        assert service.extract_and_chunk(pdf) == [c["text"] for c in chunks]
+
+    def test_native_chunker_is_opt_in(self):
+        assert not isinstance(PDFService().splitter, TextChunker)
+
+        service = PDFService(chunk_size=12, chunk_overlap=0, splitter="native")
+        assert isinstance(service.splitter, TextChunker)
+
+        chunks = service.split_pages([(1, "alpha beta gamma delta")])
+
+        assert [(c["text"], c["char_start"]) for c in chunks] == [
+            ("alpha beta", 0), ("gamma delta", 11)
+        ]
+
+
+class _WordEncoder:
+    """A tokenizer with one token per word (leading whitespace included), like BPE."""
+
+    def encode(self, text, disallowed_special=()):
+        import re
+
+        return [match.start() for match in re.finditer(r"\s*\S+", text)]
+
+    def decode_with_offsets(self, tokens):
+        return None, tokens
+
+
+def _prose(paragraphs=30, seed=0):
+    rng = np.random.default_rng(seed)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "elit", "sed", "do", "tempor"]
+    text = []
+    for _ in range(paragraphs):
+        sentences = [
+            " ".join(rng.choice(words, size=rng.integers(4, 16))).capitalize() + "."
+            for _ in range(rng.integers(1, 8))
+        ]
+        text.append(" ".join(sentences))
+    return "\n\n".join(text)
+
+
+class TestTextChunker:
+    """Tests for the native chunker."""
+
+    def test_chunks_fit_and_map_back_to_the_text(self):
+        text = "  " + _prose() + "\n"
+        chunker = TextChunker(chunk_size=200, chunk_overlap=40, unit="chars")
+
+        chunks = chunker.chunks(text)
+
+        assert len(chunks) > 10
+        for chunk in chunks:
+            assert text[chunk["char_start"]:chunk["char_end"]] == chunk["text"]
+            assert chunk["text"] == chunk["text"].strip()
+            assert len(chunk["text"]) <= 200
+        starts = [chunk["char_start"] for chunk in chunks]
+        assert starts == sorted(set(starts))
+        assert chunks[-1]["char_end"] == len(text) - 1
+
+    def test_cuts_at_the_coarsest_boundary_in_the_window(self):
+        chunker = TextChunker(chunk_size=30, chunk_overlap=0, unit="chars")
+
+        assert chunker.split_text("One two.\n\nThree four. Five six seven eight") == [
+            "One two.", "Three four.", "Five six seven eight"
+        ]
+        assert chunker.split_text("Aa bb. Cc\ndd ee ff gg hh ii jj kk") == [
+            "Aa bb. Cc", "dd ee ff gg hh ii jj kk"
+        ]
+        assert chunker.split_text("aa bb cc dd ee ff gg hh ii jj kk") == [
+            "aa bb cc dd ee ff gg hh ii jj", "kk"
+        ]
+
+    def test_overlap_repeats_words_but_not_partial_paragraphs(self):
+        chunker = TextChunker(chunk_size=10, chunk_overlap=5, unit="chars")
+
+        assert chunker.split_text("aa bb cc dd ee ff") == [
+            "aa bb cc", "bb cc dd", "cc dd ee", "dd ee ff"
+        ]
+        assert chunker.split_text("aaaa bbbb\n\ncc dd ee") == ["aaaa bbbb", "cc dd ee"]
+
+    def test_words_longer_than_a_chunk_are_cut(self):
+        chunker = TextChunker(chunk_size=4, chunk_overlap=0, unit="chars")
+
+        assert chunker.split_text("abcdefghij k") == ["abcd", "efgh", "ij k"]
+        assert chunker.split_text(" \n ") == []
+
+    def test_token_limits(self):
+        chunker = TextChunker(chunk_size=3, chunk_overlap=1, unit="tokens", encoder=_WordEncoder())
+
+        assert chunker.split_text("one two three four five six seven") == [
+            "one two three", "three four five", "five six seven"
+        ]
+
+    def test_rejects_overlap_not_smaller_than_size(self):
+        with pytest.raises(ValueError):
+            TextChunker(chunk_size=10, chunk_overlap=10, unit="chars")
+
+    def test_chunk_count_is_close_to_langchain(self):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        text = _prose(paragraphs=200, seed=1)
+        native = TextChunker(chunk_size=300, chunk_overlap=50, unit="chars").split_text(text)
+        langchain = RecursiveCharacterTextSplitter(
+            chunk_size=300, chunk_overlap=50
+        ).split_text(text)
+
+        assert abs(len(native) - len(langchain)) <= 0.1 * len(langchain)
+
+
+class _MemoryStorage:
+    """Just enough of StorageService for TextStore."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, data, key, content_type):
+        self.objects[key] = data
+        return key
+
+    def upload_stream(self, stream, key, content_type):
+        self.objects[key] = stream.read()
+        return key
+
+    def read_stream(self, key):
+        return io.BytesIO(self.objects[key]) if key in self.objects else None
+
+    def open_stream(self, key):
+        return io.BytesIO(self.objects[key])
+
+    def delete_file(self, key):
+        self.objects.pop(key, None)
+
+
+class TestTextStore:
+    """Tests for extracted text kept at ingest."""
+
+    def _store(self, pages):
+        store = TextStore(storage=_MemoryStorage(), prefix="text")
+        writer = TextWriter()
+        consumed = list(writer.pages(enumerate(pages, start=1)))
+        store.save("f1", writer)
+        return store, consumed
+
+    def test_text_round_trips_like_extract_full_text(self):
+        pages = ["first page", "", "third page é"]
+        store, consumed = self._store(pages)
+
+        assert consumed == list(enumerate(pages, start=1))
+        assert store.read_text("f1") == " ".join(pages)
+        assert store.read_text("f1", limit=5) == "first"
+        assert store.page_offsets("f1") == [0, 11, 12]
+        assert sorted(store.storage.objects) == ["text/f1.pages.json", "text/f1.txt.gz"]
+
+    def test_read_page(self):
+        store, _ = self._store(["one", "two two", "three"])
+
+        assert [store.read_page("f1", page) for page in (1, 2, 3)] == ["one", "two two", "three"]
+        assert store.read_page("f1", 4) is None
+
+    def test_missing_or_deleted_text_is_none(self):
+        store, _ = self._store(["page"])
+        store.delete("f1")
+
+        assert store.storage.objects == {}
+        assert store.read_text("f1") is None
+        assert store.read_page("f1", 1) is None
+
+
+class TestPartitionedIngest:
+    """Tests for fanning a large PDF out over page-range tasks."""
+
+    def test_page_ranges(self):
+        assert page_ranges(5, 2) == [(1, 2), (3, 4), (5, 5)]
+        assert page_ranges(4, 2) == [(1, 2), (3, 4)]
+        assert page_ranges(3, 0) == [(1, 3)]
+
+    def test_iter_pages_reads_a_range(self):
+        pdf = _make_pdf(["one", "two", "three", "four"])
+
+        pages = list(PDFService.iter_pages(pdf))
+
+        assert PDFService.page_count(pdf) == 4
+        assert [text.strip() for _, text in pages] == ["one", "two", "three", "four"]
+        assert list(PDFService.iter_pages(pdf, 2, 3)) == pages[1:3]
+        assert list(PDFService.iter_pages(pdf, 4, 9)) == pages[3:]
+
+    def test_partition_store_round_trip(self):
+        store = PartitionStore(storage=_MemoryStorage(), prefix="parts")
+        chunks = [{"text": "a", "page": 3, "char_start": 0, "char_end": 1}]
+
+        store.save("f1", 1, [(3, "a"), (4, "")], chunks, [[0.5, 0.25]])
+        pages, loaded, vectors = store.load("f1", 1)
+
+        assert pages == [(3, "a"), (4, "")]
+        assert loaded == chunks
+        assert vectors.dtype == np.float32 and vectors.tolist() == [[0.5, 0.25]]
+        store.delete("f1", 2)
+        assert store.storage.objects == {}
+        with pytest.raises(FileNotFoundError):
+            store.load("f1", 1)
+
+    def test_progress_is_reported_per_partition(self):
+        progress = IngestProgress(redis_url="")
+        progress.start("f1", [(1, 2), (3, 3)])
+        progress.update("f1", 0, 1, 2, "done", chunks=7)
+
+        report = progress.get("f1")
+        assert report["pages"] == 3
+        assert (report["partitionsDone"], report["partitionsTotal"]) == (1, 2)
+        assert report["partitions"][0] == {
+            "firstPage": 1, "lastPage": 2, "state": "done", "chunks": 7
+        }
+        assert report["partitions"][1]["state"] == "queued"
+        progress.clear("f1")
+        assert progress.get("f1") is None
+
+    @pytest.mark.asyncio
+    async def test_large_pdf_fans_out_and_fans_in_in_page_order(self):
+        from core.config import settings
+        from tasks import celery_worker
+
+        texts = [f"page {n} text" for n in range(1, 6)]
+        storage = _MemoryStorage()
+        storage.objects["pdf/f1.pdf"] = _make_pdf(texts)
+        embedding = MagicMock()
+        embedding.aembed_documents = AsyncMock(
+            side_effect=lambda chunk_texts: [[float(len(t)), 0.0] for t in chunk_texts]
+        )
+        progress = IngestProgress(redis_url="")
+
+        with patch("services.storage_service.storage_service", storage), \
+             patch("services.embedding_service.embedding_service", embedding), \
+             patch("services.ingest_partitions.ingest_progress", progress), \
+             patch.object(settings, "PDF_PARTITION_PAGES", 2), \
+             patch.object(celery_worker, "_get_file_owner", AsyncMock(return_value="owner")), \
+             patch.object(celery_worker, "_set_file_status", AsyncMock()) as set_status, \
+             patch("celery.chord") as chord:
+            await celery_worker._process_pdf_async("f1", "pdf/f1.pdf")
+
+            header = chord.call_args[0][0]
+            assert [sig.args[2:] for sig in header] == [(0, 1, 2), (1, 3, 4), (2, 5, 5)]
+            assert progress.get("f1")["partitionsDone"] == 0
+            embedding.aingest_document.assert_not_called()
+
+            # Partitions may finish in any order.
+            for sig in reversed(header):
+                await celery_worker._process_pdf_partition_async(*sig.args)
+            assert progress.get("f1")["partitionsDone"] == 3
+
+            await celery_worker._finish_pdf_async("f1", 3)
+
+        call = embedding.store_embeddings.call_args
+        assert call.args[1] == texts
+        assert [c["page"] for c in call.kwargs["positions"]] == [1, 2, 3, 4, 5]
+        assert call.args[2].tolist() == [[float(len(t)), 0.0] for t in texts]
+        assert call.kwargs["owner"] == "owner"
+        set_status.assert_awaited_once_with("f1", "ready")
+        assert progress.get("f1") is None
+        pdf_text = PDFService().extract_full_text(storage.objects["pdf/f1.pdf"])
+        assert TextStore(storage=storage).read_text("f1") == pdf_text
+        assert sorted(storage.objects) == [
+            "extracted-text/f1.pages.json", "extracted-text/f1.txt.gz", "pdf/f1.pdf"
+        ]
+
+    def test_failed_fan_out_clears_its_progress(self):
+        import asyncio
+
+        from tasks import celery_worker
+
+        progress = IngestProgress(redis_url="")
+        progress.start("f1", [(1, 2), (3, 3)])
+        partitions = MagicMock()
+        loop = asyncio.new_event_loop()
+        try:
+            with patch("services.ingest_partitions.ingest_progress", progress), \
+                 patch("services.ingest_partitions.partition_store", partitions), \
+                 patch.object(celery_worker, "_set_file_status", AsyncMock()) as set_status, \
+                 patch("asyncio.run", loop.run_until_complete):
+                celery_worker.fail_pdf(None, RuntimeError("boom"), None, "f1", 2)
+        finally:
+            loop.close()
+
+        partitions.delete.assert_called_once_with("f1", 2)
+        set_status.assert_awaited_once_with("f1", "failed")
+        assert progress.get("f1") is None
+
+
+class TestIncrementalReingest:
+    """Tests for re-ingesting only the changed pages of a new PDF version."""
+
+    def test_changed_pages(self):
+        assert page_hash("a  b\n") == page_hash(" a b")
+        assert changed_pages(["a", "b", "c"], ["a", "x", "c", "d"]) == {2, 4}
+        assert changed_pages(["a", "b", "c"], ["a"]) == {2, 3}
+
+    def test_page_runs(self):
+        assert page_runs([7, 2, 3, 4, 9, 10], 0) == [(2, 4), (7, 7), (9, 10)]
+        assert page_runs(range(1, 6), 2) == [(1, 2), (3, 4), (5, 5)]
+        assert page_runs([], 2) == []
+
+    @pytest.mark.asyncio
+    async def test_new_version_reembeds_only_changed_pages(self, tmp_path, monkeypatch):
+        from core.config import settings
+        from services.embedding_service import EmbeddingService
+        from tasks import celery_worker
+        from vector_store.faiss_index import FAISSIndex
+
+        monkeypatch.setattr(settings, "EMBEDDING_PROVIDER", "hashing")
+        monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 64)
+        monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", False)
+        index = FAISSIndex(index_dir=str(tmp_path), dimension=64, search_url="")
+        service = EmbeddingService()
+        embedded = []
+        real_embed = service.aembed_documents
+
+        async def recording_embed(texts):
+            embedded.append(list(texts))
+            return await real_embed(texts)
+
+        monkeypatch.setattr(service, "aembed_documents", recording_embed)
+        storage = _MemoryStorage()
+        from services.pdf_service import pdf_service
+
+        parsed = []
+
+        def recording_pages(source, first=1, last=None):
+            parsed.append((first, last))
+            return PDFService.iter_pages(source, first, last)
+
+        monkeypatch.setattr(pdf_service, "iter_pages", recording_pages)
+
+        async def ingest(pages):
+            storage.objects["pdf/f1.pdf"] = _make_pdf(pages)
+            embedded.clear()
+            parsed.clear()
+            with patch("services.storage_service.storage_service", storage), \
+                 patch("services.embedding_service.embedding_service", service), \
+                 patch("services.embedding_service.faiss_index", index), \
+                 patch("vector_store.faiss_index.faiss_index", index), \
+                 patch.object(celery_worker, "_get_file_owner", AsyncMock(return_value=None)), \
+                 patch.object(celery_worker, "_set_file_status", AsyncMock()):
+                await celery_worker._process_pdf_async("f1", "pdf/f1.pdf")
+            _, rows = index.export_file("f1")
+            by_id = {row["chunk_id"]: row for row in rows}
+            first = next(row for row in rows if row["prev_chunk_id"] == -1)
+            ordered = [first]
+            while ordered[-1]["next_chunk_id"] != -1:
+                ordered.append(by_id[ordered[-1]["next_chunk_id"]])
+            return [(row["page"], row["text"]) for row in ordered]
+
+        pages = [f"page {n} says something" for n in range(1, 6)]
+        assert await ingest(pages) == list(enumerate(pages, start=1))
+        assert len(embedded[0]) == 5
+
+        # Page 2 edited, page 5 dropped, whitespace-only change on page 3.
+        edited = [pages[0], "page 2 now says another thing", "page 3 says  something", pages[3]]
+        assert await ingest(edited) == [
+            (1, pages[0]), (2, edited[1]), (3, pages[2]), (4, pages[3])
+        ]
+        assert embedded == [[edited[1]]]
+        # One hashing pass over the whole file, then only page 2 is parsed again.
+        assert parsed == [(1, None), (2, 2)]
+        assert TextStore(storage=storage).page_hashes("f1") == [
+            page_hash(text) for text in edited
+        ]
+
+        # Most pages changed: the whole file is re-ingested.
+        rewritten = [f"all new text {n}" for n in range(1, 5)]
+        assert await ingest(rewritten) == list(enumerate(rewritten, start=1))
+        assert embedded == [rewritten]
+
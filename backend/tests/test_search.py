@@ -1,13 +1,15 @@
 """Tests for vector search endpoint."""
 
 import uuid
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import numpy as np
 import pytest
 
 from core.cache import cache_service
 from core.config import settings
 from core.rate_limit import rate_limiter
+from models.file import File as FileModel
 
 
 @pytest.mark.asyncio
@@ -30,9 +32,23 @@ class TestSearch:
         assert "text" in results[0]
         assert "score" in results[0]
 
+    async def test_search_file_indexed_with_another_model(self, client, mock_embedding_service):
+        """A file built with a different embedding model is a conflict, not a server error."""
+        from vector_store.index_factory import EmbeddingModelMismatch
+
+        file_id = str(uuid.uuid4())
+        mock_embedding_service.asearch_similar = AsyncMock(
+            side_effect=EmbeddingModelMismatch(file_id, "hashing-v1:768", "text-embedding-3:native")
+        )
+
+        response = await client.post("/api/search", json={"query": "pump", "file_id": file_id})
+
+        assert response.status_code == 409
+        assert "re-process" in response.json()["detail"]
+
     async def test_search_empty_query(self, client, mock_embedding_service):
         """Test search with empty query returns empty."""
-        mock_embedding_service.search_similar = MagicMock(return_value=[])
+        mock_embedding_service.asearch_similar = AsyncMock(return_value=[])
 
         response = await client.post(
             "/api/search",
@@ -47,7 +63,7 @@ class TestSearch:
         file_id = str(uuid.uuid4())
 
         with patch("routers.search.embedding_service") as mock:
-            mock.search_similar = MagicMock(
+            mock.asearch_similar = AsyncMock(
                 return_value=[
                     {
                         "text": "discussion about AI",
@@ -84,7 +100,7 @@ class TestSearch:
     async def test_search_no_results(self, client):
         """Test search returning no results."""
         with patch("routers.search.embedding_service") as mock:
-            mock.search_similar = MagicMock(return_value=[])
+            mock.asearch_similar = AsyncMock(return_value=[])
 
             response = await client.post(
                 "/api/search",
@@ -98,7 +114,7 @@ class TestSearch:
         file_id = str(uuid.uuid4())
 
         with patch("routers.search.embedding_service") as mock:
-            mock.search_similar = MagicMock(
+            mock.asearch_similar = AsyncMock(
                 return_value=[{"text": "cached result", "score": 0.9, "file_id": file_id}]
             )
 
@@ -114,7 +130,7 @@ class TestSearch:
         assert first.status_code == 200
         assert second.status_code == 200
         assert first.json() == second.json()
-        assert mock.search_similar.call_count == 1
+        assert mock.asearch_similar.call_count == 1
 
     async def test_search_rate_limited_after_limit(self, client):
         """Requests beyond configured limit should return 429."""
@@ -126,7 +142,7 @@ class TestSearch:
         await rate_limiter.clear()
 
         with patch("routers.search.embedding_service") as mock:
-            mock.search_similar = MagicMock(
+            mock.asearch_similar = AsyncMock(
                 return_value=[{"text": "result", "score": 0.8, "file_id": file_id}]
             )
 
@@ -143,3 +159,339 @@ class TestSearch:
 
         assert first.status_code == 200
         assert second.status_code == 429
+
+    async def test_library_search_all_owned_files(self, client, db_session):
+        """Library search without file_ids covers every file the caller owns."""
+        mine = uuid.uuid4()
+        theirs = uuid.uuid4()
+        for file_id, owner in ((mine, "test@example.com"), (theirs, "other@example.com")):
+            db_session.add(
+                FileModel(
+                    file_id=file_id,
+                    file_name="doc.pdf",
+                    file_type="pdf",
+                    storage_key=f"pdf/{file_id}/doc.pdf",
+                    created_by=owner,
+                    status="ready",
+                )
+            )
+        await db_session.commit()
+
+        with patch("routers.search.embedding_service") as mock:
+            mock.asearch_library = AsyncMock(
+                return_value=[{"text": "hit", "score": 0.1, "file_id": str(mine)}]
+            )
+            response = await client.post(
+                "/api/search/library", json={"query": "anything", "top_k": 3}
+            )
+
+        assert response.status_code == 200
+        assert response.json()[0]["fileId"] == str(mine)
+        assert mock.asearch_library.call_args.kwargs["file_ids"] == [str(mine)]
+
+    async def test_library_search_ignores_foreign_file_ids(self, client):
+        """Requested files the caller does not own are not searched."""
+        with patch("routers.search.embedding_service") as mock:
+            response = await client.post(
+                "/api/search/library",
+                json={"query": "anything", "file_ids": [str(uuid.uuid4())]},
+            )
+
+        assert response.status_code == 200
+        assert response.json() == []
+        mock.asearch_library.assert_not_called()
+
+    async def test_library_search_invalid_file_id(self, client):
+        response = await client.post(
+            "/api/search/library", json={"query": "anything", "file_ids": ["nope"]}
+        )
+        assert response.status_code == 400
+
+    async def test_search_passes_time_window(self, client):
+        """A time window is forwarded to retrieval and kept apart in the cache."""
+        file_id = str(uuid.uuid4())
+        with patch("routers.search.embedding_service") as mock:
+            mock.asearch_similar = AsyncMock(return_value=[{"text": "late", "score": 0.1}])
+            response = await client.post(
+                "/api/search",
+                json={"query": "summary", "file_id": file_id, "start_time": 600, "end_time": 1200},
+            )
+
+        assert response.status_code == 200
+        kwargs = mock.asearch_similar.call_args.kwargs
+        assert (kwargs["start_time"], kwargs["end_time"]) == (600, 1200)
+        assert await cache_service.get_json(f"search:{file_id}:5:hybrid:summary") is None
+
+    async def test_search_expands_neighbors(self, client):
+        file_id = str(uuid.uuid4())
+        with patch("routers.search.embedding_service") as mock:
+            mock.asearch_similar = AsyncMock(
+                return_value=[{"text": "a b c", "score": 0.1, "page": 2, "chunk_ids": [3, 4, 5]}]
+            )
+            response = await client.post(
+                "/api/search", json={"query": "pump", "file_id": file_id, "neighbors": 1}
+            )
+            too_wide = await client.post(
+                "/api/search",
+                json={"query": "x", "file_id": file_id, "neighbors": settings.SEARCH_MAX_NEIGHBORS + 1},
+            )
+
+        assert response.json()[0]["page"] == 2
+        assert mock.asearch_similar.call_args.kwargs["neighbors"] == 1
+        assert too_wide.status_code == 400
+
+    async def test_batch_search_embeds_uncached_queries_once(self, client):
+        """Batch search embeds only cache misses, in one call, preserving order."""
+        file_id = str(uuid.uuid4())
+        await cache_service.set_json(
+            f"search:{file_id}:5:vector:cached", [{"text": "from cache"}], ttl_seconds=60
+        )
+
+        with patch("routers.search.embedding_service") as mock:
+            mock.asearch_batch = AsyncMock(
+                return_value=[
+                    [{"text": "first", "score": 0.1, "file_id": file_id}],
+                    [{"text": "second", "score": 0.2, "file_id": file_id}],
+                ]
+            )
+            response = await client.post(
+                "/api/search/batch",
+                json={"queries": ["one", "cached", "", "two", "ONE"], "file_id": file_id},
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [r[0]["text"] if r else None for r in data] == [
+            "first", "from cache", None, "second", "first"
+        ]
+        assert mock.asearch_batch.await_count == 1
+        assert mock.asearch_batch.call_args.kwargs["queries"] == ["one", "two"]
+
+    async def test_single_and_batch_search_do_not_share_cache(self, client):
+        """Hybrid single-search results are never served to batch search, or back."""
+        file_id = str(uuid.uuid4())
+        with patch.object(settings, "SEARCH_HYBRID", True), \
+             patch("routers.search.embedding_service") as mock:
+            mock.asearch_similar = AsyncMock(return_value=[{"text": "hybrid", "score": 0.03}])
+            mock.asearch_batch = AsyncMock(return_value=[[{"text": "vector", "score": 0.8}]])
+            single = await client.post("/api/search", json={"query": "pump", "file_id": file_id})
+            batch = await client.post(
+                "/api/search/batch", json={"queries": ["pump"], "file_id": file_id}
+            )
+            again = await client.post("/api/search", json={"query": "pump", "file_id": file_id})
+
+        assert single.json()[0]["text"] == "hybrid"
+        assert batch.json()[0][0]["text"] == "vector"
+        assert again.json()[0]["text"] == "hybrid"
+        assert mock.asearch_similar.await_count == 1
+        assert mock.asearch_batch.await_count == 1
+
+    async def test_batch_search_rejects_oversized_batch(self, client):
+        response = await client.post(
+            "/api/search/batch",
+            json={
+                "queries": ["q"] * (settings.SEARCH_BATCH_MAX_QUERIES + 1),
+                "file_id": str(uuid.uuid4()),
+            },
+        )
+        assert response.status_code == 400
+
+    async def test_api_key_caller_searches_the_owners_shard(self, client, db_session):
+        """The shard is found by the file's created_by, not the caller's (empty) email."""
+        from core.security import get_current_user
+        from main import app
+        from services.embedding_service import embedding_service
+        from vector_store.faiss_index import faiss_index
+
+        file_id = uuid.uuid4()
+        db_session.add(
+            FileModel(
+                file_id=file_id,
+                file_name="manual.pdf",
+                file_type="pdf",
+                storage_key=f"pdf/{file_id}/manual.pdf",
+                created_by="owner@example.com",
+                status="ready",
+            )
+        )
+        await db_session.commit()
+        app.dependency_overrides[get_current_user] = lambda: {
+            "sub": "api_key:abc", "email": "", "auth_type": "api_key"
+        }
+        model = MagicMock()
+        model.aembed_query = AsyncMock(return_value=[1.0, 0.0, 0.0, 0.0])
+
+        with patch.object(settings, "FAISS_LAYOUT", "user_shard"), \
+             patch.object(settings, "SEARCH_HYBRID", False), \
+             patch.object(embedding_service, "embeddings_model", model):
+            faiss_index.add_embeddings(
+                str(file_id), [[1.0, 0.0, 0.0, 0.0]], [{"text": "pump torque"}],
+                owner="owner@example.com", embedding_model=embedding_service.model_id,
+            )
+            assert not faiss_index.index_exists(str(file_id))
+            response = await client.post(
+                "/api/search", json={"query": "sharded torque", "file_id": str(file_id)}
+            )
+            model.aembed_documents = AsyncMock(return_value=[[1.0, 0.0, 0.0, 0.0]])
+            batch = await client.post(
+                "/api/search/batch",
+                json={"queries": ["sharded torque"], "file_id": str(file_id)},
+            )
+
+        assert response.status_code == 200
+        assert [r["text"] for r in response.json()] == ["pump torque"]
+        assert batch.status_code == 200
+        assert [[r["text"] for r in results] for results in batch.json()] == [["pump torque"]]
+
+
+@pytest.mark.asyncio
+class TestAsyncRetrieval:
+    """Tests for the non-blocking retrieval path in EmbeddingService."""
+
+    async def test_faiss_search_runs_off_event_loop(self):
+        import threading
+
+        from services.embedding_service import EmbeddingService
+
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.aembed_query = AsyncMock(return_value=[0.1, 0.2])
+        threads = []
+
+        def fake_search(file_id, query_embedding, top_k, owner=None, **window):
+            threads.append(threading.current_thread().name)
+            return [{"text": "hit", "score": 0.1}]
+
+        with patch("services.embedding_service.faiss_index") as mock_index, \
+             patch.object(settings, "SEARCH_HYBRID", False):
+            mock_index.embedding_model.return_value = None
+            mock_index.search = fake_search
+            results = await service.asearch_similar("file", "question", top_k=1)
+
+        assert results == [{"text": "hit", "score": 0.1}]
+        assert threads[0].startswith("retrieval")
+        service.embeddings_model.aembed_query.assert_awaited_once_with("question")
+
+    async def test_hybrid_search_fuses_keyword_and_vector_results(self):
+        from services.embedding_service import EmbeddingService
+
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.aembed_query = AsyncMock(return_value=[0.1, 0.2])
+
+        with patch("services.embedding_service.faiss_index") as mock_index:
+            mock_index.embedding_model.return_value = None
+            mock_index.search = MagicMock(
+                return_value=[
+                    {"text": "semantic", "chunk_id": 1, "score": 0.2},
+                    {"text": "both", "chunk_id": 2, "score": 0.3},
+                ]
+            )
+            mock_index.search_lexical = MagicMock(
+                return_value=[{"text": "both", "chunk_id": 2, "score": 7.5}]
+            )
+            with patch.object(settings, "SEARCH_HYBRID", True):
+                results = await service.asearch_similar("file", "XK-200 pump", top_k=2)
+
+        assert [r["text"] for r in results] == ["both", "semantic"]
+        assert results[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+
+    async def test_hybrid_search_serves_keywords_when_embedding_fails(self):
+        from services.embedding_service import EmbeddingService
+
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.aembed_query = AsyncMock(side_effect=TimeoutError("slow"))
+
+        with patch("services.embedding_service.faiss_index") as mock_index:
+            mock_index.embedding_model.return_value = None
+            mock_index.search_lexical = MagicMock(
+                return_value=[{"text": "XK-200 spec", "chunk_id": 4, "score": 3.0}]
+            )
+            with patch.object(settings, "SEARCH_HYBRID", True):
+                results = await service.asearch_similar("file", "XK-200", top_k=3)
+
+        assert [r["text"] for r in results] == ["XK-200 spec"]
+        mock_index.search.assert_not_called()
+
+    async def test_diversify_drops_near_duplicate_chunks(self):
+        from services.embedding_service import EmbeddingService
+
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.aembed_query = AsyncMock(return_value=[1.0, 0.0, 0.0])
+        hits = [
+            {"text": "pump spec", "chunk_id": 0, "score": 0.1},
+            {"text": "pump spec (repeated)", "chunk_id": 1, "score": 0.11},
+            {"text": "pump warranty", "chunk_id": 2, "score": 0.5},
+        ]
+        vectors = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7]], dtype=np.float32)
+
+        with patch("services.embedding_service.faiss_index") as mock_index, \
+             patch.object(settings, "SEARCH_HYBRID", False):
+            mock_index.embedding_model.return_value = None
+            mock_index.search = MagicMock(return_value=hits)
+            mock_index.get_vectors = MagicMock(return_value=vectors)
+            plain = await service.asearch_similar("file", "pump", top_k=2)
+            diverse = await service.asearch_similar("file", "pump", top_k=2, diversify=True)
+
+        assert [r["chunk_id"] for r in plain] == [0, 1]
+        assert [r["chunk_id"] for r in diverse] == [0, 2]
+        assert mock_index.search.call_args.args[2] == 2 * settings.SEARCH_MMR_OVERSAMPLE
+        mock_index.get_vectors.assert_called_once_with("file", [0, 1, 2], owner=None)
+
+    async def test_sync_and_async_search_rank_alike(self):
+        """Both paths share one ranking function (hybrid fusion, MMR, keyword fallback)."""
+        from services.embedding_service import EmbeddingService
+
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.embed_query = MagicMock(return_value=[1.0, 0.0, 0.0])
+        service.embeddings_model.aembed_query = AsyncMock(return_value=[1.0, 0.0, 0.0])
+        vector_hits = [
+            {"text": "pump spec", "chunk_id": 0, "score": 0.1},
+            {"text": "pump spec (repeated)", "chunk_id": 1, "score": 0.11},
+            {"text": "pump warranty", "chunk_id": 2, "score": 0.5},
+        ]
+        keyword_hits = [{"text": "pump warranty", "chunk_id": 2, "score": 4.0}]
+        vectors = np.array([[1.0, 0.0, 0.7], [1.0, 0.1, 0.0], [1.0, 0.11, 0.0]], dtype=np.float32)
+
+        with patch("services.embedding_service.faiss_index") as mock_index, \
+             patch.object(settings, "SEARCH_HYBRID", True):
+            mock_index.embedding_model.return_value = None
+            mock_index.search = MagicMock(return_value=vector_hits)
+            mock_index.search_lexical = MagicMock(return_value=keyword_hits)
+            mock_index.get_vectors = MagicMock(return_value=vectors)
+            for diversify in (False, True):
+                sync = service.search_similar("file", "pump", top_k=2, diversify=diversify)
+                async_ = await service.asearch_similar("file", "pump", top_k=2, diversify=diversify)
+                assert sync == async_
+
+            service.embeddings_model.embed_query.side_effect = RuntimeError("down")
+            service.embeddings_model.aembed_query.side_effect = RuntimeError("down")
+            assert service.search_similar("file", "pump seal") == \
+                await service.asearch_similar("file", "pump seal") == \
+                [{**keyword_hits[0], "score": pytest.approx(1 / 61)}]
+
+    async def test_search_refuses_file_indexed_with_another_model(self):
+        from services.embedding_service import EmbeddingService
+        from vector_store.index_factory import EmbeddingModelMismatch
+
+        service = EmbeddingService()
+        service.embeddings_model = MagicMock()
+        service.embeddings_model.dimensions = None
+        service.embeddings_model.aembed_query = AsyncMock(return_value=[0.1, 0.2])
+
+        with patch("services.embedding_service.faiss_index") as mock_index:
+            mock_index.embedding_model.return_value = "hashing-v1:768"
+            with pytest.raises(EmbeddingModelMismatch):
+                await service.asearch_similar("file", "question")
+            mock_index.search.assert_not_called()
+
+            mock_index.embedding_model.side_effect = lambda file_id, owner=None: (
+                "hashing-v1:768" if file_id == "old" else service.model_id
+            )
+            mock_index.search_many = MagicMock(return_value=[])
+            await service.asearch_library(["old", "new"], "question")
+        assert mock_index.search_many.call_args.args[0] == ["new"]
+        service.embeddings_model.aembed_query.assert_awaited_once_with("question")
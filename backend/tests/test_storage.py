@@ -5,6 +5,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 from botocore.exceptions import ClientError
 
+from core.config import settings
 from services.storage_service import StorageService
 
 
@@ -67,6 +68,22 @@ class TestStorageService:
 
         assert data == b"file content"
 
+    @patch("boto3.client")
+    def test_open_stream_spills_large_objects_to_disk(self, mock_boto):
+        """Test streaming a download into a spooled, rewound buffer."""
+        mock_client = MagicMock()
+        mock_boto.return_value = mock_client
+        mock_client.head_bucket.return_value = True
+        mock_client.download_fileobj.side_effect = lambda bucket, key, f: f.write(b"x" * 64)
+
+        service = StorageService()
+        with patch.object(settings, "STORAGE_SPOOL_MAX_BYTES", 16):
+            with service.open_stream("test/key.pdf") as stream:
+                assert stream._rolled
+                assert stream.read() == b"x" * 64
+        with service.open_stream("test/key.pdf") as stream:
+            assert not stream._rolled
+
     @patch("boto3.client")
     def test_delete_file(self, mock_boto):
         """Test deleting a file."""
@@ -117,3 +134,23 @@ class TestStorageService:
 
         call_kwargs = mock_client.generate_presigned_url.call_args
         assert call_kwargs.kwargs.get("ExpiresIn", call_kwargs[1].get("ExpiresIn")) == 7200
+
+    @patch("boto3.client")
+    def test_get_object_info(self, mock_boto):
+        """Test object size/mtime lookup, and None for a missing object."""
+        from datetime import datetime, timezone
+
+        mock_client = MagicMock()
+        mock_boto.return_value = mock_client
+        mock_client.head_bucket.return_value = True
+        modified = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        mock_client.head_object.return_value = {"ContentLength": 42, "LastModified": modified}
+
+        service = StorageService()
+        assert service.get_object_info("faiss-indices/a.index") == {
+            "size": 42,
+            "modified": modified.timestamp(),
+        }
+
+        mock_client.head_object.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        assert service.get_object_info("missing") is None
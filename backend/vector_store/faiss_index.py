@@ -1,25 +1,113 @@
 """FAISS vector store — stores and searches document/transcript embeddings."""
 
+import heapq
+import logging
 import os
-import pickle
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
 
 import faiss
 import numpy as np
 
 from core.config import settings
+from vector_store.index_cache import IndexCache
+from vector_store.lexical_index import LexicalIndex
+from vector_store.index_factory import (
+    EmbeddingModelMismatch,
+    build_index,
+    export_vectors,
+    read_index,
+    read_vectors,
+    search_parameters,
+    truncate_vectors,
+    write_index,
+    write_vectors,
+)
+from vector_store.metadata_store import (
+    MetadataStore,
+    load_metadata,
+    read_attrs,
+    write_metadata,
+)
+from vector_store.neighbors import expand_hits, link_chunks
+from vector_store.search_client import SidecarUnavailable, VectorSearchClient
+from vector_store.storage_tier import IndexStorageTier
+from vector_store.time_index import TimeIndex, read_time_index, write_time_index
+from vector_store.usage_log import UsageLog
+from vector_store.user_shards import UserShardStore
+
+logger = logging.getLogger(__name__)
 
 
 class FAISSIndex:
     """
     Manages per-file FAISS indices for similarity search.
     Each file gets its own index stored on disk.
+
+    With FAISS_LAYOUT="user_shard", calls that pass the file's ``owner`` are
+    routed to one consolidated shard per user instead (see UserShardStore).
+    Files not yet migrated to a shard are still served from their per-file index.
+
+    When VECTOR_SEARCH_URL is set, searches are forwarded to the node's
+    vector-search sidecar (one warm copy of the indices per node) and fall
+    back to in-process search if it is unreachable. Writes always happen here.
+
+    With FAISS_REMOTE_TIER enabled, index files are kept in object storage and
+    the index directory only caches recently used ones (see IndexStorageTier).
+
+    With FAISS_FIRST_STAGE_DIM set, per-file indices hold only a renormalized
+    prefix of each embedding; the full vectors go to a ``.vec`` side file that
+    is memory-mapped to rerank the oversampled candidates exactly.
+
+    Every file also gets a BM25 inverted index over its chunk texts (see
+    LexicalIndex) for keyword search via ``search_lexical``. Transcripts keep
+    a ``.times`` file of sorted chunk start/end times so searches can be
+    restricted to a time window (see TimeIndex).
+
+    Writes may be tagged with the embedding model that produced the vectors
+    (in the ``.meta`` header, or the shard manifest); ``embedding_model``
+    reads the tag back so callers can refuse to search across vector spaces.
     """
 
-    def __init__(self, index_dir: str = None, dimension: int = 3072):
+    def __init__(
+        self,
+        index_dir: str = None,
+        dimension: int = 3072,
+        search_url: Optional[str] = None,
+    ):
         self.index_dir = index_dir or settings.FAISS_INDEX_PATH
         self.dimension = dimension
         os.makedirs(self.index_dir, exist_ok=True)
+        self._cache = IndexCache(
+            max_bytes=settings.FAISS_CACHE_MAX_BYTES,
+            max_entries=settings.FAISS_CACHE_MAX_ENTRIES,
+        )
+        self._write_lock = threading.RLock()
+        self._search_pool: Optional[ThreadPoolExecutor] = None
+        self.tier = IndexStorageTier(self.index_dir)
+
+        search_url = settings.VECTOR_SEARCH_URL if search_url is None else search_url
+        self._remote: Optional[VectorSearchClient] = None
+        if search_url:
+            self._remote = VectorSearchClient(
+                search_url, timeout=settings.VECTOR_SEARCH_TIMEOUT_SECONDS
+            )
+
+        # With a sidecar, chunk lookups read only the metadata side files here
+        # and never load the FAISS indices the sidecar already holds.
+        self.shards = UserShardStore(
+            os.path.join(self.index_dir, "shards"),
+            self._cache,
+            tier=self.tier,
+            rows_only=self._remote is not None,
+        )
+        self.lexical = LexicalIndex(self.index_dir, self._cache, tier=self.tier)
+        self.usage = UsageLog(os.path.join(self.index_dir, "usage.json"))
+
+    def _use_shards(self, owner: Optional[str]) -> bool:
+        return settings.FAISS_LAYOUT == "user_shard" and bool(owner)
 
     def _index_path(self, file_id: str) -> str:
         return os.path.join(self.index_dir, f"{file_id}.index")
@@ -27,80 +115,841 @@ class FAISSIndex:
     def _meta_path(self, file_id: str) -> str:
         return os.path.join(self.index_dir, f"{file_id}.meta")
 
+    def _vectors_path(self, file_id: str) -> str:
+        return os.path.join(self.index_dir, f"{file_id}.vec")
+
+    def _times_path(self, file_id: str) -> str:
+        return os.path.join(self.index_dir, f"{file_id}.times")
+
+    def _paths(self, file_id: str) -> Tuple[str, ...]:
+        return (
+            self._index_path(file_id),
+            self._meta_path(file_id),
+            self._vectors_path(file_id),
+            self._times_path(file_id),
+        )
+
+    def _signature(self, file_id: str) -> Optional[tuple]:
+        """
+        Return (mtime, size) of the index, metadata and (two-stage only) full
+        vector files, or None if the index or metadata is missing.
+        """
+        try:
+            index_stat = os.stat(self._index_path(file_id))
+            meta_stat = os.stat(self._meta_path(file_id))
+        except FileNotFoundError:
+            return None
+        signature = (
+            index_stat.st_mtime_ns,
+            index_stat.st_size,
+            meta_stat.st_mtime_ns,
+            meta_stat.st_size,
+        )
+        try:
+            vectors_stat = os.stat(self._vectors_path(file_id))
+        except FileNotFoundError:
+            return signature
+        return signature + (vectors_stat.st_mtime_ns, vectors_stat.st_size)
+
+    def _load(
+        self, file_id: str
+    ) -> Optional[Tuple[Any, Sequence[Dict[str, Any]], Optional[np.ndarray]]]:
+        """
+        Load (index, metadata, full vectors) for a file, served from the LRU
+        cache when fresh. Full vectors are None for single-stage indices.
+        """
+        self.tier.ensure_local(self._paths(file_id))
+        signature = self._signature(file_id)
+        if signature is None:
+            self._cache.invalidate(file_id)
+            return None
+
+        cached = self._cache.get(file_id, signature)
+        if cached is not None:
+            return cached
+
+        index = read_index(self._index_path(file_id), mmap=settings.FAISS_MMAP)
+        metadata = load_metadata(self._meta_path(file_id), mmap=settings.FAISS_MMAP)
+        full_vectors = None
+        if len(signature) > 4:
+            full_vectors = read_vectors(self._vectors_path(file_id), mmap=settings.FAISS_MMAP)
+
+        loaded = (index, metadata, full_vectors)
+        self._cache.put(file_id, signature, loaded, nbytes=sum(signature[1::2]))
+        return loaded
+
+    def _load_rows(
+        self, file_id: str
+    ) -> Optional[Tuple[Sequence[Dict[str, Any]], Optional[np.ndarray]]]:
+        """
+        Load (metadata, full vectors) for a file. Without a sidecar they come
+        with the cached index, which searches load here anyway; with one only
+        the ``.meta``/``.vec`` side files are opened (cached on their own), so
+        chunk lookups do not pull a second copy of the index into this process.
+        """
+        if self._remote is None:
+            loaded = self._load(file_id)
+            return None if loaded is None else loaded[1:]
+
+        meta_path, vectors_path = self._meta_path(file_id), self._vectors_path(file_id)
+        self.tier.ensure_local([meta_path, vectors_path])
+        signature = []
+        for path in (meta_path, vectors_path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if path == meta_path:
+                    self._cache.invalidate(f"rows:{file_id}")
+                    return None
+                continue
+            signature.extend((stat.st_mtime_ns, stat.st_size))
+        signature = tuple(signature)
+
+        key = f"rows:{file_id}"
+        cached = self._cache.get(key, signature)
+        if cached is not None:
+            return cached
+
+        metadata = load_metadata(meta_path, mmap=settings.FAISS_MMAP)
+        full_vectors = None
+        if len(signature) > 2:
+            full_vectors = read_vectors(vectors_path, mmap=settings.FAISS_MMAP)
+        loaded = (metadata, full_vectors)
+        self._cache.put(key, signature, loaded, nbytes=sum(signature[1::2]))
+        return loaded
+
+    @staticmethod
+    def _chunk_ids(metadata: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Stable chunk IDs of the stored rows (row positions for legacy indices)."""
+        if isinstance(metadata, MetadataStore):
+            ids = metadata.column("chunk_id")
+            if ids is not None:
+                return ids
+        return np.arange(len(metadata), dtype=np.int64)
+
+    def _rows_for_ids(self, metadata: Sequence[Dict[str, Any]], ids: np.ndarray) -> np.ndarray:
+        """Map FAISS labels to metadata row positions (-1 when unknown)."""
+        if isinstance(metadata, MetadataStore):
+            # Rows are kept in ascending chunk_id order, so a binary search suffices.
+            rows = metadata.find_rows("chunk_id", ids)
+            if rows is not None:
+                return rows
+        return np.where((ids >= 0) & (ids < len(metadata)), ids, -1)
+
+    def _load_for_update(
+        self, file_id: str
+    ) -> Tuple[Any, List[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Read a writable (non-mmapped) index, its rows and (for two-stage
+        indices) its full vectors for in-place updates.
+
+        Indices written before chunk IDs existed are rebuilt into an ID-mapped
+        index with IDs equal to their row positions.
+        """
+        index = read_index(self._index_path(file_id))
+        metadata = load_metadata(self._meta_path(file_id), mmap=False)
+        chunk_ids = self._chunk_ids(metadata)
+        rows = [dict(row, chunk_id=int(chunk_id)) for row, chunk_id in zip(metadata, chunk_ids)]
+
+        if not isinstance(index, faiss.IndexIDMap2):
+            vectors, _ = export_vectors(index)
+            index = build_index(vectors, ids=chunk_ids)
+
+        full_vectors = None
+        if os.path.exists(self._vectors_path(file_id)):
+            full_vectors = read_vectors(self._vectors_path(file_id))
+        return index, rows, full_vectors
+
+    def _save(
+        self,
+        file_id: str,
+        index,
+        rows: List[Dict[str, Any]],
+        full_vectors: Optional[np.ndarray] = None,
+        attrs: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Write a file's index, metadata (with ``attrs``) and (two-stage only) full vectors."""
+        vectors_path = self._vectors_path(file_id)
+        if full_vectors is not None:
+            write_vectors(full_vectors, vectors_path)
+        elif os.path.exists(vectors_path):
+            os.remove(vectors_path)
+            self.tier.delete([vectors_path])
+
+        times_path = self._times_path(file_id)
+        time_index = TimeIndex.from_rows(rows)
+        if time_index is not None:
+            write_time_index(time_index, times_path)
+        elif os.path.exists(times_path):
+            os.remove(times_path)
+            self.tier.delete([times_path])
+        write_index(index, self._index_path(file_id))
+        write_metadata(self._meta_path(file_id), link_chunks(rows), attrs)
+        self._cache.invalidate(file_id)
+        self.tier.publish([path for path in self._paths(file_id) if os.path.exists(path)])
+
+    def _time_index(
+        self, file_id: str, metadata: Sequence[Dict[str, Any]]
+    ) -> Optional[TimeIndex]:
+        """
+        Load a file's time index via the cache. Files indexed before time
+        indices existed get one derived from their metadata instead.
+        """
+        key = f"times:{file_id}"
+        try:
+            stat = os.stat(self._times_path(file_id))
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stat = None
+            signature = ("derived",) + (self._signature(file_id) or ())
+
+        cached = self._cache.get(key, signature)
+        if cached is not None:
+            return cached
+        if stat is not None:
+            time_index = read_time_index(self._times_path(file_id))
+        else:
+            time_index = TimeIndex.from_rows(
+                dict(row, chunk_id=int(chunk_id))
+                for row, chunk_id in zip(metadata, self._chunk_ids(metadata))
+            )
+        if time_index is not None:
+            self._cache.put(key, signature, time_index, nbytes=time_index.nbytes)
+        return time_index
+
+    def embedding_model(self, file_id: str, owner: Optional[str] = None) -> Optional[str]:
+        """
+        The embedding model a file's vectors were built with, or None if the
+        file is not indexed or was indexed before tagging existed. Only the
+        metadata header is read, and the answer is cached.
+        """
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            return self.shards.embedding_model(owner)
+
+        meta_path = self._meta_path(file_id)
+        self.tier.ensure_local([meta_path])
+        try:
+            stat = os.stat(meta_path)
+        except FileNotFoundError:
+            return None
+        key, signature = f"attrs:{file_id}", (stat.st_mtime_ns, stat.st_size)
+        attrs = self._cache.get(key, signature)
+        if attrs is None:
+            attrs = read_attrs(meta_path)
+            self._cache.put(key, signature, attrs, nbytes=len(str(attrs)))
+        return attrs.get("embedding_model")
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters and current size of the index cache."""
+        return self._cache.stats()
+
     def add_embeddings(
         self,
         file_id: str,
         embeddings: List[List[float]],
         metadata: List[Dict[str, Any]],
-    ) -> None:
+        owner: Optional[str] = None,
+        embedding_model: Optional[str] = None,
+    ) -> List[int]:
         """
-        Store embeddings with metadata for a given file.
+        Store embeddings with metadata for a given file, replacing any existing index.
 
         Args:
             file_id: UUID of the file
             embeddings: list of embedding vectors
             metadata: list of dicts (one per embedding), e.g. {"text": "...", "start_time": 0.0}
+            owner: file owner; selects the user's shard in the user_shard layout
+            embedding_model: tag of the model that produced the embeddings
+
+        Returns the assigned chunk IDs (0..n-1).
         """
-        if not embeddings:
-            return
+        if len(embeddings) == 0:
+            return []
+
+        texts = [meta.get("text", "") for meta in metadata]
+        if self._use_shards(owner):
+            chunk_ids = self.shards.add_file(
+                owner, file_id, embeddings, metadata, embedding_model=embedding_model
+            )
+            self.delete_file_index(file_id)
+            self.lexical.build(file_id, texts, chunk_ids)
+            return chunk_ids
 
         vectors = np.array(embeddings, dtype=np.float32)
-        dim = vectors.shape[1]
+        chunk_ids = np.arange(len(vectors), dtype=np.int64)
+        full_vectors = None
+        if 0 < settings.FAISS_FIRST_STAGE_DIM < vectors.shape[1]:
+            full_vectors = vectors
+            vectors = truncate_vectors(vectors, settings.FAISS_FIRST_STAGE_DIM)
+        index = build_index(vectors, ids=chunk_ids)
 
-        index = faiss.IndexFlatL2(dim)
-        index.add(vectors)
+        rows = [dict(meta, chunk_id=int(chunk_id)) for meta, chunk_id in zip(metadata, chunk_ids)]
+        attrs = {"embedding_model": embedding_model} if embedding_model else None
+        with self._write_lock:
+            self._save(file_id, index, rows, full_vectors, attrs)
+        self.lexical.build(file_id, texts, chunk_ids)
+        return chunk_ids.tolist()
 
-        # Save FAISS index
-        faiss.write_index(index, self._index_path(file_id))
+    def append_embeddings(
+        self,
+        file_id: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, Any]],
+        owner: Optional[str] = None,
+        embedding_model: Optional[str] = None,
+    ) -> List[int]:
+        """
+        Append chunks to an existing index without rebuilding it.
+
+        New chunks get IDs after the current maximum; the index and the
+        metadata store are rewritten together. Returns the new chunk IDs.
+        Raises EmbeddingModelMismatch if the index was built with another
+        ``embedding_model``.
+        """
+        if len(embeddings) == 0:
+            return []
+
+        texts = [meta.get("text", "") for meta in metadata]
+        if self._use_shards(owner) and not self.index_exists(file_id):
+            chunk_ids = self.shards.append_chunks(
+                owner, file_id, embeddings, metadata, embedding_model=embedding_model
+            )
+            if chunk_ids and chunk_ids[0] == 0:
+                # The file was not in the shard yet, so this append created it.
+                self.lexical.build(file_id, texts, chunk_ids)
+            else:
+                self.lexical.append(file_id, texts, chunk_ids)
+            return chunk_ids
 
-        # Save metadata
-        with open(self._meta_path(file_id), "wb") as f:
-            pickle.dump(metadata, f)
+        with self._write_lock:
+            if not self.index_exists(file_id):
+                return self.add_embeddings(
+                    file_id, embeddings, metadata, embedding_model=embedding_model
+                )
+
+            attrs = read_attrs(self._meta_path(file_id))
+            indexed = attrs.get("embedding_model")
+            if embedding_model and indexed and indexed != embedding_model:
+                raise EmbeddingModelMismatch(file_id, indexed, embedding_model)
+            if embedding_model:
+                attrs["embedding_model"] = embedding_model
+
+            index, rows, full_vectors = self._load_for_update(file_id)
+            next_id = rows[-1]["chunk_id"] + 1 if rows else 0
+            chunk_ids = np.arange(next_id, next_id + len(embeddings), dtype=np.int64)
+
+            vectors = np.array(embeddings, dtype=np.float32)
+            if full_vectors is not None:
+                full_vectors = np.concatenate([full_vectors, vectors])
+                vectors = truncate_vectors(vectors, index.d)
+            index.add_with_ids(vectors, chunk_ids)
+            rows.extend(
+                dict(meta, chunk_id=int(chunk_id)) for meta, chunk_id in zip(metadata, chunk_ids)
+            )
+            self._save(file_id, index, rows, full_vectors, attrs)
+            self.lexical.append(file_id, texts, chunk_ids)
+        return chunk_ids.tolist()
+
+    def remove_chunks(
+        self, file_id: str, chunk_ids: List[int], owner: Optional[str] = None
+    ) -> int:
+        """Remove chunks by ID from a file's index and metadata. Returns the count removed."""
+        if not chunk_ids:
+            return 0
+
+        if self._use_shards(owner) and not self.index_exists(file_id):
+            removed = self.shards.remove_chunks(owner, file_id, chunk_ids)
+            if removed:
+                self.lexical.remove(file_id, chunk_ids)
+            return removed
+
+        with self._write_lock:
+            if not self.index_exists(file_id):
+                return 0
+
+            index, rows, full_vectors = self._load_for_update(file_id)
+            doomed = set(int(chunk_id) for chunk_id in chunk_ids)
+            removed = index.remove_ids(np.array(sorted(doomed), dtype=np.int64))
+            if removed:
+                keep = np.array([row["chunk_id"] not in doomed for row in rows], dtype=bool)
+                rows = [row for row, kept in zip(rows, keep) if kept]
+                if full_vectors is not None:
+                    full_vectors = full_vectors[keep]
+                self._save(file_id, index, rows, full_vectors, read_attrs(self._meta_path(file_id)))
+                self.lexical.remove(file_id, chunk_ids)
+        return int(removed)
 
     def search(
         self,
         file_id: str,
         query_embedding: List[float],
         top_k: int = 5,
+        owner: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
     ) -> List[Dict[str, Any]]:
         """
         Search for the most similar chunks to a query embedding.
 
+        ``start_time``/``end_time`` (seconds) restrict a transcript search to
+        chunks overlapping that window.
+
         Returns list of metadata dicts with an added 'score' field.
         """
-        index_path = self._index_path(file_id)
-        meta_path = self._meta_path(file_id)
+        return self.search_batch(
+            file_id,
+            [query_embedding],
+            top_k,
+            owner=owner,
+            start_time=start_time,
+            end_time=end_time,
+        )[0]
 
-        if not os.path.exists(index_path) or not os.path.exists(meta_path):
+    def search_batch(
+        self,
+        file_id: str,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        owner: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search many queries against one file with a single vectorized
+        index.search over the (n_queries, dim) matrix.
+
+        With a time window, the matching chunk IDs are looked up in the
+        file's time index and passed to FAISS as an ID selector, so only
+        that slice is scanned.
+
+        Returns one result list per query, in query order.
+        """
+        if len(query_embeddings) == 0:
+            return []
+        windowed = start_time is not None or end_time is not None
+        if self._remote is not None:
+            try:
+                return self._remote.search_batch(
+                    file_id,
+                    query_embeddings,
+                    top_k,
+                    owner=owner,
+                    start_time=start_time,
+                    end_time=end_time,
+                )
+            except SidecarUnavailable:
+                pass
+
+        # Counted only where the index is searched (the sidecar counts its own),
+        # so each search is recorded once.
+        self.usage.record(file_id, owner)
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            return self.shards.search_batch(
+                owner,
+                query_embeddings,
+                top_k,
+                file_ids=[file_id],
+                start_time=start_time,
+                end_time=end_time,
+            )
+
+        empty = [[] for _ in query_embeddings]
+        loaded = self._load(file_id)
+        if loaded is None:
+            return empty
+        index, metadata, full_vectors = loaded
+        if index.ntotal == 0:
+            return empty
+
+        params, candidates = None, index.ntotal
+        if windowed:
+            time_index = self._time_index(file_id, metadata)
+            if time_index is None:
+                return empty
+            ids = time_index.ids_in_window(start_time, end_time)
+            if len(ids) == 0:
+                return empty
+            # IDSelectorBatch copies the IDs, so the array need not outlive the call.
+            selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+            params, candidates = search_parameters(index, selector), len(ids)
+
+        query_vectors = np.array(query_embeddings, dtype=np.float32)
+        first_stage = query_vectors
+        if index.d < query_vectors.shape[1]:
+            first_stage = truncate_vectors(query_vectors, index.d)
+        rerank = full_vectors is not None and index.d < full_vectors.shape[1]
+        k = top_k * settings.FAISS_RERANK_OVERSAMPLE if rerank else top_k
+        distances, indices = index.search(first_stage, min(k, candidates), params=params)
+
+        batch = []
+        for query, query_distances, query_indices in zip(query_vectors, distances, indices):
+            rows = self._rows_for_ids(metadata, query_indices)
+            query_distances, rows = query_distances[rows >= 0], rows[rows >= 0]
+            if rerank:
+                # Exact squared L2 on the full vectors, as IndexFlatL2 would report.
+                query_distances = ((full_vectors[rows] - query) ** 2).sum(axis=1)
+                order = np.argsort(query_distances, kind="stable")[:top_k]
+                query_distances, rows = query_distances[order], rows[order]
+            batch.append(
+                [
+                    {**metadata[int(row)], "score": float(dist)}
+                    for dist, row in zip(query_distances, rows)
+                ]
+            )
+        return batch
+
+    def get_chunks(
+        self, file_id: str, chunk_ids: List[int], owner: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Metadata rows of a file's chunks, in the given order (unknown IDs skipped)."""
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            return self.shards.get_chunks(owner, file_id, chunk_ids)
+
+        loaded = self._load_rows(file_id)
+        if loaded is None or not chunk_ids:
+            return []
+        metadata = loaded[0]
+        rows = self._rows_for_ids(metadata, np.asarray(chunk_ids, dtype=np.int64))
+        return [dict(metadata[int(row)]) for row in rows if row >= 0]
+
+    def get_vectors(
+        self, file_id: str, chunk_ids: List[int], owner: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Stored vectors of a file's chunks, in the given order, without any
+        embedding call. Two-stage files return their full vectors; quantized
+        indices return decoded approximations. None if any chunk is unknown
+        or the index cannot reconstruct vectors.
+
+        With a sidecar, two-stage files are read from their ``.vec`` side file
+        here; vectors that need the index are reconstructed by the sidecar.
+        """
+        ids = np.asarray(chunk_ids, dtype=np.int64)
+        sharded = self._use_shards(owner) and self.shards.has_file(owner, file_id)
+        if not sharded:
+            loaded = self._load_rows(file_id)
+            if loaded is None:
+                return None
+            metadata, full_vectors = loaded
+            if full_vectors is not None:
+                rows = self._rows_for_ids(metadata, ids)
+                return None if (rows < 0).any() else np.asarray(full_vectors[rows])
+
+        if self._remote is not None:
+            try:
+                return self._remote.get_vectors(file_id, chunk_ids, owner=owner)
+            except SidecarUnavailable:
+                pass
+
+        if sharded:
+            return self.shards.get_vectors(owner, file_id, chunk_ids)
+        loaded = self._load(file_id)
+        if loaded is None:
+            return None
+        index = loaded[0]
+        try:
+            return np.vstack([index.reconstruct(int(chunk_id)) for chunk_id in ids])
+        except RuntimeError:
+            # Unknown ID, or an IVF index without a direct map.
+            return None
+
+    def expand_neighbors(
+        self,
+        file_id: str,
+        hits: List[Dict[str, Any]],
+        window: int,
+        owner: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Widen each hit to its ±``window`` neighbouring chunks by following the
+        adjacency links in the metadata store (no further vector search), and
+        merge touching spans. See vector_store/neighbors.py.
+        """
+        return expand_hits(
+            hits, window, lambda chunk_ids: self.get_chunks(file_id, chunk_ids, owner=owner)
+        )
+
+    def chunk_ids_in_window(
+        self,
+        file_id: str,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+        owner: Optional[str] = None,
+    ) -> np.ndarray:
+        """Sorted IDs of a file's chunks overlapping the time window."""
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            return self.shards.chunk_ids_in_window(owner, file_id, start_time, end_time)
+
+        loaded = self._load_rows(file_id)
+        time_index = self._time_index(file_id, loaded[0]) if loaded is not None else None
+        if time_index is None:
+            return np.zeros(0, dtype=np.int64)
+        return time_index.ids_in_window(start_time, end_time)
+
+    def chunk_ids_on_pages(
+        self, file_id: str, pages: Iterable[int], owner: Optional[str] = None
+    ) -> List[int]:
+        """IDs of a file's chunks that were cut from any of ``pages`` (1-based)."""
+        pages = np.asarray(sorted(set(pages)), dtype=np.int64)
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            return self.shards.chunk_ids_on_pages(owner, file_id, pages)
+
+        loaded = self._load_rows(file_id)
+        if loaded is None or len(pages) == 0:
+            return []
+        metadata = loaded[0]
+        if isinstance(metadata, MetadataStore):
+            page_column = metadata.column("page")
+            if page_column is None:
+                return []
+            mask = np.isin(page_column, pages)
+            chunk_ids = metadata.column("chunk_id")
+            ids = chunk_ids[mask] if chunk_ids is not None else np.flatnonzero(mask)
+            return [int(chunk_id) for chunk_id in ids]
+        wanted = set(pages.tolist())
+        return [
+            row.get("chunk_id", position)
+            for position, row in enumerate(metadata)
+            if row.get("page") in wanted
+        ]
+
+    def search_lexical(
+        self,
+        file_id: str,
+        query: str,
+        top_k: int = 5,
+        owner: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        BM25 keyword search over a file's chunks (no embedding needed),
+        optionally restricted to a time window.
+
+        Returns metadata dicts with the BM25 score (higher is better) as 'score'.
+        Not recorded in the usage log: it loads no FAISS index, and a hybrid
+        search's vector half already counts the use.
+        """
+        allowed = None
+        if start_time is not None or end_time is not None:
+            allowed = self.chunk_ids_in_window(file_id, start_time, end_time, owner=owner)
+            if len(allowed) == 0:
+                return []
+        hits = self.lexical.search(file_id, query, top_k, chunk_ids=allowed)
+        if not hits:
             return []
+        scores = dict(hits)
+        chunks = self.get_chunks(file_id, [chunk_id for chunk_id, _ in hits], owner=owner)
+        return [{**chunk, "score": scores[chunk["chunk_id"]]} for chunk in chunks]
 
-        index = faiss.read_index(index_path)
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._search_pool is None:
+            self._search_pool = ThreadPoolExecutor(
+                max_workers=settings.FAISS_SEARCH_WORKERS,
+                thread_name_prefix="faiss-search",
+            )
+        return self._search_pool
 
-        with open(meta_path, "rb") as f:
-            metadata = pickle.load(f)
+    def search_many(
+        self,
+        file_ids: List[str],
+        query_embedding: List[float],
+        top_k: int = 5,
+        timeout: Optional[float] = None,
+        owner: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search several files' indices in parallel and merge into a global top-k.
+
+        Each file is searched on the shared thread pool; files whose search has
+        not finished within ``timeout`` seconds (FAISS_SHARD_TIMEOUT_SECONDS by
+        default) are left out of the result rather than delaying it. In the
+        user_shard layout, files in the owner's shard are searched with a
+        single filtered query under the same deadline.
 
-        query_vector = np.array([query_embedding], dtype=np.float32)
-        distances, indices = index.search(query_vector, min(top_k, index.ntotal))
+        Searches still queued at the deadline are cancelled. A FAISS search
+        that has already started cannot be interrupted, so it runs to
+        completion and its result is discarded; such orphaned searches can
+        never hold more than the FAISS_SEARCH_WORKERS pool threads.
+        """
+        if not file_ids:
+            return []
 
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < 0 or idx >= len(metadata):
+        file_ids = list(dict.fromkeys(file_ids))
+        if self._remote is not None:
+            try:
+                return self._remote.search_many(
+                    file_ids, query_embedding, top_k, timeout=timeout, owner=owner
+                )
+            except SidecarUnavailable:
+                pass
+
+        executor = self._executor()
+        futures = {}
+        if self._use_shards(owner):
+            in_shard = [f for f in file_ids if self.shards.has_file(owner, f)]
+            if in_shard:
+                # Keyed by None: shard results already carry their file_id.
+                futures[
+                    executor.submit(
+                        self.shards.search, owner, query_embedding, top_k, file_ids=in_shard
+                    )
+                ] = None
+                sharded = set(in_shard)
+                file_ids = [f for f in file_ids if f not in sharded]
+
+        timeout = settings.FAISS_SHARD_TIMEOUT_SECONDS if timeout is None else timeout
+        for file_id in file_ids:
+            futures[executor.submit(self.search, file_id, query_embedding, top_k)] = file_id
+        done, not_done = wait(futures, timeout=timeout) if futures else (set(), set())
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            logger.warning(
+                "Library search skipped %d of %d searches after %.1fs",
+                len(not_done), len(futures), timeout,
+            )
+
+        partials = []
+        for future in done:
+            if future.exception() is not None:
                 continue
-            result = {**metadata[idx], "score": float(dist)}
-            results.append(result)
+            file_id = futures[future]
+            partial = future.result()
+            if file_id is not None:
+                for result in partial:
+                    result.setdefault("file_id", file_id)
+            partials.append(partial)
+
+        # Each partial result list is already sorted by ascending distance.
+        merged = heapq.merge(*partials, key=lambda result: result["score"])
+        return list(islice(merged, top_k))
 
-        return results
+    def delete_index(self, file_id: str, owner: Optional[str] = None) -> None:
+        """Delete a file's FAISS index and metadata (tombstoning it in its owner's shard)."""
+        if self._use_shards(owner):
+            self.shards.delete_file(owner, file_id)
+        self.delete_file_index(file_id)
+        self.lexical.delete(file_id)
+        self.usage.forget(file_id)
 
-    def delete_index(self, file_id: str) -> None:
-        """Delete a file's FAISS index and metadata."""
-        for path in [self._index_path(file_id), self._meta_path(file_id)]:
+    def delete_file_index(self, file_id: str) -> None:
+        """Remove only the per-file vector index (e.g. once the file lives in a shard)."""
+        self._cache.invalidate(file_id)
+        self.tier.delete(self._paths(file_id))
+        for path in self._paths(file_id):
             if os.path.exists(path):
                 os.remove(path)
 
-    def index_exists(self, file_id: str) -> bool:
+    def needs_compaction(self, owner: Optional[str]) -> bool:
+        """Whether the owner's shard has enough deleted files to be worth compacting."""
+        return self._use_shards(owner) and self.shards.needs_compaction(owner)
+
+    def compact(self, owner: str) -> int:
+        """Drop deleted files' vectors from the owner's shard. Returns vectors removed."""
+        return self.shards.compact(owner)
+
+    def warm(self, file_id: str, owner: Optional[str] = None) -> int:
+        """
+        Load a file's index, metadata, keyword and time indices into the cache
+        and ask the OS to read ahead the memory-mapped files, so the next
+        search does not pay for a cold load. With a sidecar configured, the
+        sidecar's cache is warmed instead. Returns the bytes warmed (0 if the
+        file is not indexed).
+        """
+        if self._remote is not None:
+            try:
+                return self._remote.warm(file_id, owner=owner)
+            except SidecarUnavailable:
+                pass
+
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            paths = list(self.shards.warm(owner))
+        else:
+            loaded = self._load(file_id)
+            if loaded is None:
+                return 0
+            self._time_index(file_id, loaded[1])
+            paths = list(self._paths(file_id))
+        self.lexical.warm(file_id)
+        paths.append(self.lexical.path(file_id))
+        return sum(_read_ahead(path) for path in paths)
+
+    def prewarm(self, max_bytes: Optional[int] = None) -> List[str]:
+        """
+        Warm the most frequently and recently searched files (see UsageLog)
+        until ``max_bytes`` (FAISS_PREWARM_MAX_BYTES) is reached. Without any
+        recorded usage, the most recently written indices are warmed instead.
+        Returns the warmed file IDs.
+        """
+        budget = settings.FAISS_PREWARM_MAX_BYTES if max_bytes is None else max_bytes
+        budget = min(budget, settings.FAISS_CACHE_MAX_BYTES)
+        candidates = self.usage.hottest() or self._recent_files()
+
+        warmed, total = [], 0
+        for file_id, owner in candidates:
+            if total >= budget:
+                break
+            try:
+                nbytes = self.warm(file_id, owner=owner)
+            except Exception as exc:
+                logger.warning("Could not prewarm index %s: %s", file_id, exc)
+                continue
+            if nbytes:
+                warmed.append(file_id)
+                total += nbytes
+        logger.info("Prewarmed %d indices (%d bytes)", len(warmed), total)
+        return warmed
+
+    def _recent_files(self) -> List[Tuple[str, Optional[str]]]:
+        """Per-file indices on local disk, most recently written first."""
+        try:
+            entries = [entry for entry in os.scandir(self.index_dir) if entry.name.endswith(".index")]
+        except FileNotFoundError:
+            return []
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        return [(entry.name[: -len(".index")], None) for entry in entries]
+
+    def index_exists(self, file_id: str, owner: Optional[str] = None) -> bool:
         """Check if a FAISS index exists for a file."""
+        if self._use_shards(owner) and self.shards.has_file(owner, file_id):
+            return True
+        self.tier.ensure_local(self._paths(file_id))
         return os.path.exists(self._index_path(file_id))
 
+    def export_file(self, file_id: str) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """
+        Return a per-file index's vectors and metadata rows, in matching order.
+        Every row carries its chunk_id (row positions for legacy indices).
+        """
+        self.tier.ensure_local(self._paths(file_id))
+        index = read_index(self._index_path(file_id))
+        metadata = load_metadata(self._meta_path(file_id), mmap=False)
+        vectors, ids = export_vectors(index)
+        rows = self._rows_for_ids(metadata, ids)
+        keep = rows >= 0
+        if os.path.exists(self._vectors_path(file_id)):
+            # Two-stage index: export the full vectors, not the truncated ones.
+            vectors = read_vectors(self._vectors_path(file_id))[rows]
+        return vectors[keep], [
+            dict(metadata[row], chunk_id=int(chunk_id))
+            for row, chunk_id in zip(rows[keep], ids[keep])
+        ]
+
+
+def _read_ahead(path: str) -> int:
+    """Hint the OS to page a file in (where supported). Returns its size, or 0 if missing."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return 0
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
 
 # Singleton
 faiss_index = FAISSIndex()
@@ -0,0 +1,88 @@
+"""In-process LRU cache for loaded FAISS indices and their metadata."""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class IndexCache:
+    """
+    Bounded LRU cache keyed by file_id.
+
+    Each entry carries a signature (file mtimes/sizes on disk) and an
+    approximate size in bytes. A lookup whose signature no longer matches is
+    treated as a miss, so indices rewritten by another process (e.g. the
+    Celery worker) are reloaded instead of served stale.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Hashable, Any, int]]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_entries > 0
+
+    def get(self, key: str, signature: Hashable) -> Optional[Any]:
+        """Return the cached value if present and its signature still matches."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, signature: Hashable, value: Any, nbytes: int) -> None:
+        """Insert a value, evicting least-recently-used entries to stay in budget."""
+        if not self.enabled or nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (signature, value, nbytes)
+            self._current_bytes += nbytes
+
+            while (
+                self._current_bytes > self.max_bytes
+                or len(self._entries) > self.max_entries
+            ):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, key: str) -> None:
+        _, _, nbytes = self._entries.pop(key)
+        self._current_bytes -= nbytes
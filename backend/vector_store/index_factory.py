@@ -0,0 +1,203 @@
+"""FAISS index construction — picks exact or quantized storage by corpus size."""
+
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from core.config import settings
+
+INDEX_TYPES = ("flat", "fp16", "sq8", "ivfpq")
+
+
+class EmbeddingModelMismatch(ValueError):
+    """A file's vectors were produced by a different embedding model than the one in use."""
+
+    def __init__(self, file_id: str, indexed: str, current: str):
+        super().__init__(
+            f"File {file_id} was indexed with embedding model {indexed!r}, not {current!r}; "
+            "re-process it to search it with the current model"
+        )
+        self.file_id = file_id
+        self.indexed = indexed
+        self.current = current
+
+
+def choose_index_type(num_vectors: int, index_type: Optional[str] = None) -> str:
+    """
+    Resolve the configured index type for a corpus of ``num_vectors``.
+
+    "auto" keeps small files on an exact flat index and switches to
+    FAISS_QUANTIZED_INDEX_TYPE once a file exceeds FAISS_FLAT_MAX_VECTORS.
+    IVF-PQ falls back to SQ8 when there are too few vectors to train it.
+    """
+    index_type = (index_type or settings.FAISS_INDEX_TYPE).lower()
+    if index_type == "auto":
+        if num_vectors <= settings.FAISS_FLAT_MAX_VECTORS:
+            return "flat"
+        index_type = settings.FAISS_QUANTIZED_INDEX_TYPE.lower()
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+    if index_type == "ivfpq" and num_vectors < _min_ivfpq_training_size(num_vectors):
+        return "sq8"
+    return index_type
+
+
+def _ivf_nlist(num_vectors: int) -> int:
+    return max(1, min(4096, int(4 * math.sqrt(num_vectors))))
+
+
+def _min_ivfpq_training_size(num_vectors: int) -> int:
+    # Each PQ sub-quantizer has 256 centroids; FAISS wants ~39 points per centroid.
+    return max(_ivf_nlist(num_vectors), 256) * 39
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest divisor of ``dim`` not above FAISS_PQ_M."""
+    m = min(settings.FAISS_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: Optional[str] = None,
+    ids: Optional[np.ndarray] = None,
+) -> faiss.Index:
+    """
+    Build, train (if needed) and populate an index over ``vectors``.
+
+    When ``ids`` is given the index is wrapped in an IndexIDMap2 so vectors
+    keep stable chunk IDs across appends and removals.
+    """
+    num_vectors, dim = vectors.shape
+    resolved = choose_index_type(num_vectors, index_type)
+
+    if resolved == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif resolved == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif resolved == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(
+            quantizer, dim, _ivf_nlist(num_vectors), _pq_subquantizers(dim), 8
+        )
+
+    if not index.is_trained:
+        index.train(vectors)
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(vectors)
+    configure_for_search(index)
+    return index
+
+
+def configure_for_search(index: faiss.Index) -> None:
+    """Apply query-time parameters (nprobe) to IVF indices."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(settings.FAISS_IVF_NPROBE, ivf.nlist)
+
+
+def recall_at_k(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    index: faiss.Index,
+    k: int = 10,
+) -> float:
+    """
+    Fraction of the exact (flat) top-k neighbours that ``index`` also returns.
+
+    Used to check how much recall a quantized index type gives up.
+    """
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    k = min(k, baseline.ntotal)
+
+    _, expected = baseline.search(queries, k)
+    _, actual = index.search(queries, k)
+
+    hits = sum(
+        len(set(exp.tolist()) & set(act.tolist())) for exp, act in zip(expected, actual)
+    )
+    return hits / float(expected.size)
+
+
+def search_parameters(index: faiss.Index, selector=None):
+    """SearchParameters carrying an ID selector, keeping IVF's nprobe."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """Read an index from disk, memory-mapping its codes read-only if requested."""
+    if mmap:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+    else:
+        index = faiss.read_index(path)
+    configure_for_search(index)
+    return index
+
+
+def write_index(index: faiss.Index, path: str) -> None:
+    """Write an index via a temp file so readers never see (or map) a partial file."""
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def export_vectors(index: faiss.Index) -> tuple:
+    """
+    Return (vectors, ids) for everything stored in ``index``.
+
+    Quantized indices yield their decoded (approximate) vectors. Indices
+    without an ID map report storage positions as IDs.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        inner = index.index
+    else:
+        ids = np.arange(index.ntotal, dtype=np.int64)
+        inner = index
+
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return inner.reconstruct_n(0, inner.ntotal), ids
+
+
+def truncate_vectors(vectors: np.ndarray, dim: int) -> np.ndarray:
+    """
+    Keep the first ``dim`` components of each vector and rescale to unit length.
+
+    text-embedding-3 models are trained so that such prefixes (Matryoshka
+    embeddings) remain usable embeddings on their own.
+    """
+    prefix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32)[:, :dim])
+    norms = np.linalg.norm(prefix, axis=1, keepdims=True)
+    return prefix / np.maximum(norms, np.float32(1e-12))
+
+
+def write_vectors(vectors: np.ndarray, path: str) -> None:
+    """Write full-precision vectors as a .npy side file (atomically)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def read_vectors(path: str, mmap: bool = False) -> np.ndarray:
+    """Read a vector side file, memory-mapped read-only if requested."""
+    return np.load(path, mmap_mode="r" if mmap else None)
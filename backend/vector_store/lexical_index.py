@@ -0,0 +1,293 @@
+"""Per-file BM25 inverted index, fused with vector results by reciprocal rank fusion.
+
+Each file's chunks get a ``{file_id}.bm25`` file next to its FAISS index,
+holding plain numpy arrays:
+
+* ``terms`` — sorted vocabulary;
+* ``term_offsets`` — where each term's postings start in ``postings``/``tfs``;
+* ``postings`` / ``tfs`` — chunk rows containing the term and its frequency;
+* ``doc_lens`` / ``chunk_ids`` — token count and chunk ID of every row.
+
+Lexical search needs no embedding call, so it also serves as a fallback when
+the embedding endpoint is slow or unavailable.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import settings
+from vector_store.index_cache import IndexCache
+from vector_store.storage_tier import IndexStorageTier
+
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT_RE = re.compile(r"[-./]")
+_MAX_TOKEN_LEN = 40
+
+# Standard BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens. Compound tokens such as part numbers ("ab-1234",
+    "v2.1") are kept whole and also split into their parts.
+    """
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        tokens.append(match[:_MAX_TOKEN_LEN])
+        if not match.isalnum():
+            tokens.extend(part[:_MAX_TOKEN_LEN] for part in _SPLIT_RE.split(match) if part)
+    return tokens
+
+
+class Postings:
+    """In-memory form of one file's inverted index."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.terms = arrays["terms"]
+        self.term_offsets = arrays["term_offsets"]
+        self.postings = arrays["postings"]
+        self.tfs = arrays["tfs"]
+        self.doc_lens = arrays["doc_lens"]
+        self.chunk_ids = arrays["chunk_ids"]
+        self.avg_doc_len = float(self.doc_lens.mean()) if len(self.doc_lens) else 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.terms, self.term_offsets, self.postings, self.tfs, self.doc_lens, self.chunk_ids
+            )
+        )
+
+    @classmethod
+    def from_triplets(
+        cls,
+        terms: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        doc_lens: np.ndarray,
+        chunk_ids: np.ndarray,
+    ) -> "Postings":
+        """Build from one (term, row, tf) triplet per posting."""
+        order = np.lexsort((rows, terms))
+        terms = terms[order]
+        vocabulary, starts = np.unique(terms, return_index=True)
+        return cls(
+            {
+                "terms": vocabulary,
+                "term_offsets": np.append(starts, len(terms)).astype(np.int64),
+                "postings": rows[order].astype(np.int32),
+                "tfs": tfs[order].astype(np.int32),
+                "doc_lens": np.asarray(doc_lens, dtype=np.int32),
+                "chunk_ids": np.asarray(chunk_ids, dtype=np.int64),
+            }
+        )
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str], chunk_ids: Sequence[int]) -> "Postings":
+        return cls.from_triplets(*_triplets(texts, row_offset=0), chunk_ids=chunk_ids)
+
+    def to_triplets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        counts = np.diff(self.term_offsets)
+        return np.repeat(self.terms, counts), self.postings, self.tfs
+
+    def search(
+        self, query: str, top_k: int, chunk_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k (chunk_id, BM25 score) pairs for ``query``, optionally only
+        among ``chunk_ids``. Chunks sharing no term with the query are left out.
+        """
+        num_docs = len(self.doc_lens)
+        if num_docs == 0 or len(self.terms) == 0:
+            return []
+
+        scores = np.zeros(num_docs, dtype=np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens / max(self.avg_doc_len, 1e-9))
+        for term in set(tokenize(query)):
+            position = int(np.searchsorted(self.terms, term))
+            if position >= len(self.terms) or self.terms[position] != term:
+                continue
+            start, end = self.term_offsets[position], self.term_offsets[position + 1]
+            rows, tfs = self.postings[start:end], self.tfs[start:end]
+            df = end - start
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + length_norm[rows])
+
+        if chunk_ids is not None:
+            scores[~np.isin(self.chunk_ids, chunk_ids)] = 0
+        hits = np.flatnonzero(scores)
+        top = hits[np.argsort(-scores[hits], kind="stable")[:top_k]]
+        return [(int(self.chunk_ids[row]), float(scores[row])) for row in top]
+
+
+def _triplets(texts: Sequence[str], row_offset: int):
+    terms: List[str] = []
+    rows: List[int] = []
+    tfs: List[int] = []
+    doc_lens: List[int] = []
+    for row, text in enumerate(texts, start=row_offset):
+        tokens = tokenize(text or "")
+        doc_lens.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            terms.append(term)
+            rows.append(row)
+            tfs.append(tf)
+    return (
+        np.array(terms, dtype=str),
+        np.array(rows, dtype=np.int32),
+        np.array(tfs, dtype=np.int32),
+        np.array(doc_lens, dtype=np.int32),
+    )
+
+
+class LexicalIndex:
+    """Builds, updates and searches the per-file ``.bm25`` inverted indices."""
+
+    def __init__(self, index_dir: str, cache: IndexCache, tier: Optional[IndexStorageTier] = None):
+        self.index_dir = index_dir
+        self._cache = cache
+        self._tier = tier or IndexStorageTier(index_dir, enabled=False)
+        self._write_lock = threading.RLock()
+
+    def path(self, file_id: str) -> str:
+        return os.path.join(self.index_dir, f"{file_id}.bm25")
+
+    def _cache_key(self, file_id: str) -> str:
+        return f"bm25:{file_id}"
+
+    def exists(self, file_id: str) -> bool:
+        self._tier.ensure_local([self.path(file_id)])
+        return os.path.exists(self.path(file_id))
+
+    def _read(self, file_id: str) -> Postings:
+        with np.load(self.path(file_id)) as data:
+            return Postings({key: data[key] for key in data.files})
+
+    def _load(self, file_id: str) -> Optional[Postings]:
+        path = self.path(file_id)
+        self._tier.ensure_local([path])
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._cache.invalidate(self._cache_key(file_id))
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self._cache.get(self._cache_key(file_id), signature)
+        if cached is not None:
+            return cached
+        postings = self._read(file_id)
+        self._cache.put(self._cache_key(file_id), signature, postings, nbytes=postings.nbytes)
+        return postings
+
+    def _save(self, file_id: str, postings: Postings) -> None:
+        path = self.path(file_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=postings.terms,
+                term_offsets=postings.term_offsets,
+                postings=postings.postings,
+                tfs=postings.tfs,
+                doc_lens=postings.doc_lens,
+                chunk_ids=postings.chunk_ids,
+            )
+        os.replace(tmp_path, path)
+        self._cache.invalidate(self._cache_key(file_id))
+        self._tier.publish([path])
+
+    def build(self, file_id: str, texts: Sequence[str], chunk_ids: Sequence[int]) -> None:
+        """(Re)build a file's inverted index from its chunk texts."""
+        with self._write_lock:
+            self._save(file_id, Postings.from_texts(texts, chunk_ids))
+
+    def append(self, file_id: str, texts: Sequence[str], chunk_ids: Sequence[int]) -> None:
+        """Add chunks to an existing inverted index (no-op for files indexed without one)."""
+        with self._write_lock:
+            if not self.exists(file_id):
+                return
+            current = self._read(file_id)
+            terms, rows, tfs = current.to_triplets()
+            new_terms, new_rows, new_tfs, new_lens = _triplets(texts, row_offset=len(current.doc_lens))
+            self._save(
+                file_id,
+                Postings.from_triplets(
+                    np.concatenate([terms, new_terms]),
+                    np.concatenate([rows, new_rows]),
+                    np.concatenate([tfs, new_tfs]),
+                    np.concatenate([current.doc_lens, new_lens]),
+                    np.concatenate([current.chunk_ids, np.asarray(chunk_ids, dtype=np.int64)]),
+                ),
+            )
+
+    def remove(self, file_id: str, chunk_ids: Sequence[int]) -> None:
+        """Drop chunks from a file's inverted index."""
+        with self._write_lock:
+            if not self.exists(file_id):
+                return
+            current = self._read(file_id)
+            keep = ~np.isin(current.chunk_ids, np.asarray(chunk_ids, dtype=np.int64))
+            new_rows = np.cumsum(keep) - 1
+            terms, rows, tfs = current.to_triplets()
+            kept = keep[rows]
+            self._save(
+                file_id,
+                Postings.from_triplets(
+                    terms[kept],
+                    new_rows[rows[kept]],
+                    tfs[kept],
+                    current.doc_lens[keep],
+                    current.chunk_ids[keep],
+                ),
+            )
+
+    def delete(self, file_id: str) -> None:
+        self._cache.invalidate(self._cache_key(file_id))
+        self._tier.delete([self.path(file_id)])
+        if os.path.exists(self.path(file_id)):
+            os.remove(self.path(file_id))
+
+    def warm(self, file_id: str) -> None:
+        """Load a file's postings into the cache ahead of its first search."""
+        self._load(file_id)
+
+    def search(
+        self, file_id: str, query: str, top_k: int, chunk_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        postings = self._load(file_id)
+        if postings is None:
+            return []
+        return postings.search(query, top_k, chunk_ids=chunk_ids)
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[List[Dict[str, Any]]], top_k: int, k: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by reciprocal rank fusion.
+
+    A chunk's fused score is the sum of ``1 / (k + rank)`` over the lists it
+    appears in (higher is better); it replaces the per-list ``score``.
+    """
+    k = settings.SEARCH_RRF_K if k is None else k
+    fused: Dict[Any, Dict[str, Any]] = {}
+    scores: Dict[Any, float] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            key = (result.get("file_id"), result.get("chunk_id", result.get("text")))
+            fused.setdefault(key, result)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+
+    ordered = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**fused[key], "score": scores[key]} for key in ordered]
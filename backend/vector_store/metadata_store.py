@@ -0,0 +1,268 @@
+"""Columnar, memory-mappable metadata store for FAISS index entries.
+
+Layout of a ``.meta`` file::
+
+    MAGIC (8 bytes) | header length (uint64) | JSON header | aligned column data
+
+Every metadata key becomes a column. String columns are stored as an int64
+offsets array plus one contiguous UTF-8 blob, numeric columns as plain
+numpy arrays (NaN marks a missing float; int and string columns carry a
+``missing`` mask for None). Rows that never had a key are marked in the
+column's ``absent`` mask and come back without it. Columns are opened with
+``np.memmap`` so reading a row only touches the pages holding that row.
+
+The header can also carry file-level ``attrs`` (e.g. the embedding model
+that produced the index), readable without opening any column.
+"""
+
+import json
+import os
+import pickle
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+MAGIC = b"KGZMETA1"
+_ALIGN = 64
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def _column_kind(values: Sequence[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, str) for v in present):
+        return "str"
+    if present and all(_is_number(v) for v in present):
+        if all(isinstance(v, (int, np.integer)) for v in present):
+            return "int"
+        return "float"
+    return "json"
+
+
+def _encode_strings(values: Sequence[Optional[str]]) -> tuple:
+    """Encode strings as (offsets, missing mask, blob)."""
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    missing = np.zeros(len(values), dtype=np.bool_)
+    parts = []
+    position = 0
+    for i, value in enumerate(values):
+        if value is None:
+            missing[i] = True
+            encoded = b""
+        else:
+            encoded = value.encode("utf-8")
+        parts.append(encoded)
+        position += len(encoded)
+        offsets[i + 1] = position
+    return offsets, missing, b"".join(parts)
+
+
+def write_metadata(
+    path: str, metadata: List[Dict[str, Any]], attrs: Optional[Dict[str, Any]] = None
+) -> None:
+    """Write metadata rows and file-level ``attrs`` to ``path`` in the columnar layout."""
+    keys: List[str] = []
+    for row in metadata:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+
+    blocks: List[bytes] = []
+    columns: Dict[str, Dict[str, Any]] = {}
+
+    def add_block(data: bytes) -> List[int]:
+        blocks.append(data)
+        return [len(blocks) - 1, len(data)]
+
+    for key in keys:
+        values = [row.get(key) for row in metadata]
+        kind = _column_kind(values)
+        column: Dict[str, Any] = {"kind": kind}
+        absent = np.array([key not in row for row in metadata], dtype=np.bool_)
+        if absent.any():
+            column["absent"] = add_block(absent.tobytes())
+
+        if kind == "int":
+            missing = np.array([v is None for v in values], dtype=np.bool_)
+            array = np.array([0 if v is None else v for v in values], dtype=np.int64)
+            column["data"] = add_block(array.tobytes())
+            if missing.any():
+                column["missing"] = add_block(missing.tobytes())
+        elif kind == "float":
+            array = np.array(
+                [np.nan if v is None else float(v) for v in values], dtype=np.float64
+            )
+            column["data"] = add_block(array.tobytes())
+        else:
+            if kind == "json":
+                values = [None if v is None else json.dumps(v) for v in values]
+            offsets, missing, blob = _encode_strings(values)
+            column["offsets"] = add_block(offsets.tobytes())
+            column["data"] = add_block(blob)
+            if missing.any():
+                column["missing"] = add_block(missing.tobytes())
+        columns[key] = column
+
+    # Resolve block positions relative to the start of the data section.
+    position = 0
+    placements = []
+    for data in blocks:
+        placements.append(position)
+        position += len(data)
+        position += (-position) % _ALIGN
+
+    for column in columns.values():
+        for field in ("data", "offsets", "missing", "absent"):
+            if field in column:
+                block_id, nbytes = column[field]
+                column[field] = [placements[block_id], nbytes]
+
+    header = {"count": len(metadata), "columns": columns}
+    if attrs:
+        header["attrs"] = attrs
+    header = json.dumps(header).encode("utf-8")
+    prefix_len = len(MAGIC) + 8 + len(header)
+    padding = (-prefix_len) % _ALIGN
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header) + padding))
+        f.write(header)
+        f.write(b" " * padding)
+        written = 0
+        for placement, data in zip(placements, blocks):
+            f.write(b"\0" * (placement - written))
+            f.write(data)
+            written = placement + len(data)
+    os.replace(tmp_path, path)
+
+
+def _read_header(path: str) -> tuple:
+    with open(path, "rb") as f:
+        f.read(len(MAGIC))
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(header_len).decode("utf-8").rstrip()), header_len
+
+
+class MetadataStore:
+    """Read-only, lazily decoded view over a columnar ``.meta`` file."""
+
+    def __init__(self, path: str, mmap: bool = True):
+        header, header_len = _read_header(path)
+        self._count = header["count"]
+        self.attrs: Dict[str, Any] = header.get("attrs", {})
+        base = len(MAGIC) + 8 + header_len
+        self._columns: Dict[str, Dict[str, Any]] = {}
+
+        for key, spec in header["columns"].items():
+            column = {"kind": spec["kind"]}
+            for field, dtype in (
+                ("data", None),
+                ("offsets", np.int64),
+                ("missing", np.bool_),
+                ("absent", np.bool_),
+            ):
+                if field not in spec:
+                    continue
+                start, nbytes = spec[field]
+                if field == "data":
+                    dtype = {"int": np.int64, "float": np.float64}.get(spec["kind"], np.uint8)
+                column[field] = self._open(path, base + start, nbytes, dtype, mmap)
+            self._columns[key] = column
+
+    @staticmethod
+    def _open(path: str, offset: int, nbytes: int, dtype, mmap: bool) -> np.ndarray:
+        count = nbytes // np.dtype(dtype).itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return np.frombuffer(f.read(nbytes), dtype=dtype)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self._count):
+            yield self[i]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0 or i >= self._count:
+            raise IndexError(i)
+        return {
+            key: self._value(column, i)
+            for key, column in self._columns.items()
+            if "absent" not in column or not column["absent"][i]
+        }
+
+    def column(self, key: str) -> Optional[np.ndarray]:
+        """
+        Return a numeric column as an array (None for string or absent columns).
+        An int column with missing values is returned as float64 with NaN there.
+        """
+        column = self._columns.get(key)
+        if column is None or column["kind"] not in ("int", "float"):
+            return None
+        missing = column.get("missing")
+        if column["kind"] == "int" and missing is not None:
+            return np.where(missing, np.nan, column["data"])
+        return column["data"]
+
+    def find_rows(self, key: str, values: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Row positions of ``values`` in the ascending integer column ``key``
+        (-1 where absent), or None if the column does not exist.
+        """
+        column = self.column(key)
+        if column is None:
+            return None
+        values = np.asarray(values, dtype=np.int64)
+        if len(column) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(column, values), len(column) - 1)
+        return np.where(column[rows] == values, rows, -1)
+
+    @staticmethod
+    def _value(column: Dict[str, Any], i: int) -> Any:
+        kind = column["kind"]
+        if kind == "float":
+            value = float(column["data"][i])
+            return None if np.isnan(value) else value
+
+        missing = column.get("missing")
+        if missing is not None and missing[i]:
+            return None
+        if kind == "int":
+            return int(column["data"][i])
+        start, end = column["offsets"][i], column["offsets"][i + 1]
+        text = bytes(column["data"][start:end]).decode("utf-8")
+        return json.loads(text) if kind == "json" else text
+
+
+def load_metadata(path: str, mmap: bool = True):
+    """
+    Open a metadata file.
+
+    Returns a MetadataStore for the columnar layout, or the plain list for
+    legacy pickled metadata written by older versions.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            f.seek(0)
+            return pickle.load(f)
+    return MetadataStore(path, mmap=mmap)
+
+
+def read_attrs(path: str) -> Dict[str, Any]:
+    """File-level attributes of a metadata file ({} for legacy pickled metadata)."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return {}
+    return _read_header(path)[0].get("attrs", {})
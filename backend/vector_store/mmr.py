@@ -0,0 +1,48 @@
+"""Maximal marginal relevance (MMR) selection over candidate vectors."""
+
+from typing import List
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.float32(1e-12))
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Greedily pick ``k`` candidate positions that balance relevance to the
+    query against similarity to what has already been picked.
+
+    ``lambda_mult`` = 1 ranks by relevance alone; lower values favour
+    diversity. Cosine similarities are computed once as matrix products and
+    each step only updates a running max, so selection is O(k * n).
+    """
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    if len(vectors) == 0 or k <= 0:
+        return []
+    # A truncated first-stage index stores only a prefix of each vector.
+    query = _normalize(np.asarray(query, dtype=np.float32)[: vectors.shape[1]])
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    available = np.ones(len(vectors), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
@@ -0,0 +1,168 @@
+"""Chunk adjacency: neighbour links recorded at ingest and window expansion at query time.
+
+Every metadata row carries ``prev_chunk_id`` / ``next_chunk_id`` (-1 at the
+ends of a file, like a missing FAISS label), so a hit can be widened to the chunks around it by ID
+lookups in the metadata store — no extra vector search. Expanded windows that
+touch or overlap are merged into one span, and the overlap that the splitter
+repeats between consecutive chunks is dropped using their character offsets.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+Row = Dict[str, Any]
+
+
+def _reading_order(rows: List[Row]) -> List[Row]:
+    """
+    Rows of each file ordered by page and offset in the page, where known.
+    Chunks re-ingested for an edited page get IDs after all others, so ID
+    order is not always reading order; rows without a page keep their order.
+    """
+    def key(position: int):
+        row = rows[position]
+        page = row.get("page")
+        start = row.get("char_start")
+        return (
+            row.get("file_id") or "",
+            -1 if page is None else page,
+            -1 if start is None else start,
+            position,
+        )
+
+    keys = [key(position) for position in range(len(rows))]
+    if all(left <= right for left, right in zip(keys, keys[1:])):
+        return rows
+    return [rows[position] for position in sorted(range(len(rows)), key=keys.__getitem__)]
+
+
+def link_chunks(rows: List[Row]) -> List[Row]:
+    """
+    Set prev/next chunk IDs on rows in reading order. Consecutive rows are
+    linked only while they belong to the same file, so shard rows (several
+    files, ordered by label) can be linked in one pass.
+    """
+    for row in rows:
+        row["prev_chunk_id"] = row["next_chunk_id"] = -1
+    ordered = _reading_order(rows)
+    for left, right in zip(ordered, ordered[1:]):
+        if left.get("file_id") == right.get("file_id"):
+            left["next_chunk_id"] = right["chunk_id"]
+            right["prev_chunk_id"] = left["chunk_id"]
+    return rows
+
+
+def _step(row: Row, key: str, fallback: int) -> Optional[int]:
+    """Neighbour ID from the recorded link; files indexed before links existed use chunk_id ± 1."""
+    if key in row:
+        return row[key] if row[key] >= 0 else None
+    return row["chunk_id"] + fallback if row["chunk_id"] + fallback >= 0 else None
+
+
+def _join(left: Row, right: Row) -> str:
+    """Append ``right`` to ``left``'s text, skipping text both chunks contain."""
+    text = right.get("text", "")
+    same_page = left.get("page") is not None and left.get("page") == right.get("page")
+    if same_page and None not in (left.get("char_end"), right.get("char_start")):
+        overlap = left["char_end"] - right["char_start"]
+        return text[overlap:] if overlap >= 0 else " " + text
+    return "\n" + text
+
+
+def expand_hits(
+    hits: List[Row],
+    window: int,
+    fetch: Callable[[List[int]], List[Row]],
+) -> List[Row]:
+    """
+    Widen each hit to up to ``window`` chunks on either side and merge spans.
+
+    ``fetch`` maps chunk IDs to metadata rows (unknown IDs skipped); it is
+    called once per step outwards, with every ID needed at that step.
+    Each returned span keeps the fields and score of its best-ranked hit,
+    with the merged ``text``, the span's ``chunk_ids``, and the start/end
+    of the span (``page``, ``char_start``/``char_end``, ``start_time``/
+    ``end_time``; ``end_page`` when it crosses pages). Spans are
+    ordered by their best hit. Hits without a chunk_id are passed through.
+    """
+    if window <= 0 or not hits:
+        return hits
+
+    known: Dict[int, Row] = {}
+    for hit in hits:
+        if hit.get("chunk_id") is not None:
+            known.setdefault(hit["chunk_id"], hit)
+    frontier = {chunk_id: (row, row) for chunk_id, row in known.items()}
+
+    for _ in range(window):
+        wanted = set()
+        for before, after in frontier.values():
+            for chunk_id in (_step(before, "prev_chunk_id", -1), _step(after, "next_chunk_id", 1)):
+                if chunk_id is not None and chunk_id not in known:
+                    wanted.add(chunk_id)
+        fetched = {row["chunk_id"]: row for row in fetch(sorted(wanted))} if wanted else {}
+        known.update(fetched)
+
+        def advance(row: Row, key: str, fallback: int) -> Row:
+            chunk_id = _step(row, key, fallback)
+            return known.get(chunk_id, row) if chunk_id is not None else row
+
+        frontier = {
+            chunk_id: (advance(before, "prev_chunk_id", -1), advance(after, "next_chunk_id", 1))
+            for chunk_id, (before, after) in frontier.items()
+        }
+
+    # Follow the links from the first chunk of each run (chunk IDs need not be in reading order).
+    spans: List[List[Row]] = []
+    placed = set()
+    for chunk_id in sorted(known):
+        if chunk_id in placed or _step(known[chunk_id], "prev_chunk_id", -1) in known:
+            continue
+        span = [known[chunk_id]]
+        placed.add(chunk_id)
+        following = _step(span[-1], "next_chunk_id", 1)
+        while following in known and following not in placed:
+            span.append(known[following])
+            placed.add(following)
+            following = _step(span[-1], "next_chunk_id", 1)
+        spans.append(span)
+    for chunk_id in sorted(set(known) - placed):
+        spans.append([known[chunk_id]])
+
+    span_of = {row["chunk_id"]: position for position, span in enumerate(spans) for row in span}
+    merged: List[Row] = []
+    emitted = set()
+    for hit in hits:
+        if hit.get("chunk_id") is None:
+            merged.append(hit)
+            continue
+        position = span_of[hit["chunk_id"]]
+        if position in emitted:
+            continue
+        emitted.add(position)
+        merged.append(_merge_span(hit, spans[position]))
+    return merged
+
+
+def _merge_span(hit: Row, span: List[Row]) -> Row:
+    text = span[0].get("text", "")
+    for left, right in zip(span, span[1:]):
+        text += _join(left, right)
+
+    result = {
+        **hit,
+        "text": text,
+        "chunk_ids": [row["chunk_id"] for row in span],
+    }
+    first, last = span[0], span[-1]
+    for key, source in (
+        ("page", first), ("char_start", first), ("start_time", first),
+        ("char_end", last), ("end_time", last),
+    ):
+        if source.get(key) is not None:
+            result[key] = source[key]
+    if last.get("page") != first.get("page"):
+        # char_end is then relative to the last page.
+        result["end_page"] = last.get("page")
+    for key in ("prev_chunk_id", "next_chunk_id"):
+        result.pop(key, None)
+    return result
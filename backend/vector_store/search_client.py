@@ -0,0 +1,121 @@
+"""HTTP client for the vector-search sidecar (see vector_store/search_server.py)."""
+
+import base64
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# After a failed call, stay in-process for this long before trying the sidecar again.
+RETRY_AFTER_SECONDS = 30.0
+
+
+class SidecarUnavailable(Exception):
+    """The sidecar could not be reached; the caller should search in-process."""
+
+
+def encode_vectors(vectors) -> str:
+    array = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    return base64.b64encode(array.tobytes()).decode("ascii")
+
+
+class VectorSearchClient:
+    """
+    Forwards searches to the sidecar over localhost HTTP or a Unix socket.
+
+    ``url`` is either ``http://host:port`` or ``unix:///path/to/socket``.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        if url.startswith("unix://"):
+            transport = httpx.HTTPTransport(uds=url[len("unix://"):])
+            base_url = "http://vector-search"
+        else:
+            transport = None
+            base_url = url.rstrip("/")
+        self._client = httpx.Client(base_url=base_url, transport=transport, timeout=timeout)
+        self._retry_at = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Any:
+        if not self.available:
+            raise SidecarUnavailable(path)
+        try:
+            response = self._client.post(path, json=payload)
+        except httpx.TransportError as exc:
+            # Connect failures, timeouts and dropped connections only. An error
+            # status (e.g. a corrupt index file) would fail in-process as well,
+            # so it is raised below and does not take the sidecar out of use.
+            logger.warning("Vector-search sidecar unavailable (%s); searching in-process", exc)
+            self._retry_at = time.monotonic() + RETRY_AFTER_SECONDS
+            raise SidecarUnavailable(path) from exc
+        response.raise_for_status()
+        return response.json()
+
+    def search_batch(
+        self,
+        file_id: str,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        owner: Optional[str] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        return self._post(
+            "/search_batch",
+            {
+                "file_id": file_id,
+                "queries": encode_vectors(queries),
+                "dim": int(queries.shape[1]),
+                "top_k": top_k,
+                "owner": owner,
+                "start_time": start_time,
+                "end_time": end_time,
+            },
+        )
+
+    def search_many(
+        self,
+        file_ids: List[str],
+        query_embedding: List[float],
+        top_k: int,
+        timeout: Optional[float] = None,
+        owner: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return self._post(
+            "/search_many",
+            {
+                "file_ids": file_ids,
+                "query": encode_vectors(query_embedding),
+                "top_k": top_k,
+                "timeout": timeout,
+                "owner": owner,
+            },
+        )
+
+    def get_vectors(
+        self, file_id: str, chunk_ids: List[int], owner: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        found = self._post(
+            "/vectors",
+            {
+                "file_id": file_id,
+                "chunk_ids": [int(chunk_id) for chunk_id in chunk_ids],
+                "owner": owner,
+            },
+        )
+        if found["vectors"] is None:
+            return None
+        data = base64.b64decode(found["vectors"])
+        return np.frombuffer(data, dtype=np.float32).reshape(-1, found["dim"])
+
+    def warm(self, file_id: str, owner: Optional[str] = None) -> int:
+        return self._post("/warm", {"file_id": file_id, "owner": owner})["bytes"]
@@ -0,0 +1,139 @@
+"""
+Vector-search sidecar — one process per node that owns the loaded FAISS indices.
+
+API processes and Celery workers point VECTOR_SEARCH_URL at this service so
+searches hit a single warm index cache instead of one copy per process.
+Writes still go straight to disk from the callers; the sidecar notices them
+through the cache's mtime/size signatures.
+
+Run from backend/:
+    python -m vector_store.search_server                      # 127.0.0.1:8765
+    python -m vector_store.search_server --uds /tmp/vector-search.sock
+"""
+
+import argparse
+import asyncio
+import base64
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import numpy as np
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from core.config import settings
+from vector_store.faiss_index import FAISSIndex
+from vector_store.search_client import encode_vectors
+
+# Local-only instance: never forwards to another sidecar.
+index = FAISSIndex(search_url="")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prewarm = None
+    if settings.FAISS_PREWARM_ON_STARTUP:
+        prewarm = asyncio.create_task(asyncio.to_thread(index.prewarm))
+    yield
+    if prewarm is not None:
+        prewarm.cancel()
+    index.usage.save()
+
+
+app = FastAPI(title="DocWise vector search", docs_url=None, redoc_url=None, lifespan=lifespan)
+
+
+class SearchBatchRequest(BaseModel):
+    file_id: str
+    queries: str  # base64 float32 matrix, row-major
+    dim: int
+    top_k: int = 5
+    owner: Optional[str] = None
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+
+
+class WarmRequest(BaseModel):
+    file_id: str
+    owner: Optional[str] = None
+
+
+class SearchManyRequest(BaseModel):
+    file_ids: List[str]
+    query: str  # base64 float32 vector
+    top_k: int = 5
+    timeout: Optional[float] = None
+    owner: Optional[str] = None
+
+
+class VectorsRequest(BaseModel):
+    file_id: str
+    chunk_ids: List[int]
+    owner: Optional[str] = None
+
+
+def decode_vectors(data: str, dim: int) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dim)
+
+
+@app.post("/search_batch")
+async def search_batch(body: SearchBatchRequest):
+    queries = decode_vectors(body.queries, body.dim)
+    return await asyncio.to_thread(
+        index.search_batch,
+        body.file_id,
+        queries,
+        body.top_k,
+        owner=body.owner,
+        start_time=body.start_time,
+        end_time=body.end_time,
+    )
+
+
+@app.post("/search_many")
+async def search_many(body: SearchManyRequest):
+    query = np.frombuffer(base64.b64decode(body.query), dtype=np.float32)
+    return await asyncio.to_thread(
+        index.search_many,
+        body.file_ids,
+        query,
+        body.top_k,
+        timeout=body.timeout,
+        owner=body.owner,
+    )
+
+
+@app.post("/vectors")
+async def vectors(body: VectorsRequest):
+    found = await asyncio.to_thread(
+        index.get_vectors, body.file_id, body.chunk_ids, owner=body.owner
+    )
+    if found is None:
+        return {"vectors": None, "dim": 0}
+    return {"vectors": encode_vectors(found), "dim": int(found.shape[1])}
+
+
+@app.post("/warm")
+async def warm(body: WarmRequest):
+    return {"bytes": await asyncio.to_thread(index.warm, body.file_id, owner=body.owner)}
+
+
+@app.get("/stats")
+async def stats():
+    return index.cache_stats()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "service": "vector-search"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the vector-search sidecar.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--uds", default=None, help="Serve on a Unix socket instead of TCP")
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, uds=args.uds)
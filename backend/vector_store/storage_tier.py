@@ -0,0 +1,266 @@
+"""Object-storage tier for FAISS artifacts, with the index directory as a local disk cache.
+
+When FAISS_REMOTE_TIER is enabled, MinIO is the source of truth for every
+``.index`` / ``.meta`` / ``.vec`` / ``.bm25`` / ``.times`` / ``.files.json``
+file. Each node keeps only what it has recently used under FAISS_INDEX_PATH:
+
+* writes are published to MinIO right after they land on local disk;
+* reads rehydrate missing or outdated files from MinIO (checked at most every
+  FAISS_REMOTE_REVALIDATE_SECONDS per file);
+* once local files exceed FAISS_LOCAL_DISK_MAX_BYTES the least recently used
+  ones are offloaded (uploaded if needed, then removed locally).
+
+A local copy is current when its mtime and size equal the object's
+LastModified and ContentLength; downloaded and published files are stamped
+with the object's LastModified so the check survives restarts.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_SUFFIXES = (".files.json", ".index", ".meta", ".vec", ".bm25", ".times")
+
+# Offload down to this fraction of the limit so eviction does not run on every write.
+_LOW_WATERMARK = 0.9
+
+
+def _artifact_stem(path: str) -> Optional[str]:
+    for suffix in ARTIFACT_SUFFIXES:
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return None
+
+
+class IndexStorageTier:
+    """Keeps FAISS artifacts in object storage and a bounded local disk cache."""
+
+    def __init__(self, root_dir: str, storage=None, enabled: Optional[bool] = None):
+        self.root_dir = root_dir
+        self._storage = storage
+        self._enabled = settings.FAISS_REMOTE_TIER if enabled is None else enabled
+        # Guards the bookkeeping below; never held across object-storage calls,
+        # which take the per-path lock of the file they touch instead.
+        self._lock = threading.Lock()
+        self._path_locks: Dict[str, threading.Lock] = {}
+        self._evict_lock = threading.Lock()
+        self._checked: Dict[str, float] = {}
+        # Local artifact sizes, from one directory scan and then kept up to
+        # date by downloads, publishes and deletes (None until the first scan).
+        self._sizes: Optional[Dict[str, int]] = None
+        self._local_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from services.storage_service import storage_service
+
+            self._storage = storage_service
+        return self._storage
+
+    def _key(self, path: str) -> str:
+        relative = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+        return f"{settings.FAISS_REMOTE_PREFIX.rstrip('/')}/{relative}"
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.Lock()
+            return lock
+
+    def _track(self, path: str, size: Optional[int]) -> None:
+        """Record a local artifact's new size (None once it is removed)."""
+        with self._lock:
+            if self._sizes is None:
+                return
+            self._local_bytes -= self._sizes.pop(path, 0)
+            if size is not None:
+                self._sizes[path] = size
+                self._local_bytes += size
+
+    @staticmethod
+    def _stamp(path: str, modified: float) -> None:
+        """Set a file's mtime to the object's LastModified (atime = now, for LRU)."""
+        os.utime(path, ns=(time.time_ns(), int(modified * 1e9)))
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+
+    def _is_current(self, path: str, info: Dict[str, float]) -> bool:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return stat.st_size == info["size"] and int(stat.st_mtime) == int(info["modified"])
+
+    def ensure_local(self, paths: Sequence[str]) -> None:
+        """
+        Make sure ``paths`` are present and current locally, downloading them
+        from object storage when missing or outdated. Files unknown to the
+        object store (never published) are left as they are.
+
+        Only callers needing the same file wait for its download; searches of
+        other, already local indices go ahead.
+        """
+        if not self._enabled:
+            return
+
+        downloaded = False
+        for path in paths:
+            with self._path_lock(path):
+                now = time.monotonic()
+                with self._lock:
+                    age = now - self._checked.get(path, float("-inf"))
+                if age < settings.FAISS_REMOTE_REVALIDATE_SECONDS and os.path.exists(path):
+                    self._touch(path)
+                    continue
+                try:
+                    info = self.storage.get_object_info(self._key(path))
+                    if info is not None and not self._is_current(path, info):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        tmp_path = f"{path}.download"
+                        self.storage.download_to_path(self._key(path), tmp_path)
+                        self._stamp(tmp_path, info["modified"])
+                        os.replace(tmp_path, path)
+                        self._track(path, os.path.getsize(path))
+                        downloaded = True
+                    else:
+                        self._touch(path)
+                except Exception as exc:
+                    logger.warning("Could not rehydrate %s from object storage: %s", path, exc)
+                    continue
+                with self._lock:
+                    self._checked[path] = now
+
+        if downloaded and self._over_limit():
+            self.evict_cold_files()
+
+    def publish(self, paths: Sequence[str]) -> None:
+        """Upload freshly written local files to object storage."""
+        if not self._enabled:
+            return
+
+        for path in paths:
+            with self._path_lock(path):
+                try:
+                    self._upload(path)
+                except Exception as exc:
+                    # The local copy stays authoritative; offloading retries the upload.
+                    logger.error("Could not publish %s to object storage: %s", path, exc)
+                    with self._lock:
+                        self._checked.pop(path, None)
+        if self._over_limit():
+            self.evict_cold_files()
+
+    def _upload(self, path: str) -> None:
+        key = self._key(path)
+        self.storage.upload_path(path, key)
+        info = self.storage.get_object_info(key)
+        if info is not None:
+            self._stamp(path, info["modified"])
+        self._track(path, os.path.getsize(path))
+        with self._lock:
+            self._checked[path] = time.monotonic()
+
+    def delete(self, paths: Sequence[str]) -> None:
+        """Remove artifacts from object storage (local files are the caller's job)."""
+        if not self._enabled:
+            return
+
+        for path in paths:
+            with self._lock:
+                self._checked.pop(path, None)
+            self._track(path, None)
+            try:
+                self.storage.delete_file(self._key(path))
+            except Exception as exc:
+                logger.error("Could not delete %s from object storage: %s", path, exc)
+
+    def _local_groups(self) -> Dict[str, List[os.stat_result]]:
+        """Local artifacts grouped by index, re-counting local disk use."""
+        groups: Dict[str, List] = {}
+        sizes: Dict[str, int] = {}
+        for directory, _, names in os.walk(self.root_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                stem = _artifact_stem(path)
+                if stem is None:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                groups.setdefault(stem, []).append((path, stat))
+                sizes[path] = stat.st_size
+        with self._lock:
+            self._sizes = sizes
+            self._local_bytes = sum(sizes.values())
+        return groups
+
+    def _over_limit(self) -> bool:
+        """Whether local artifacts exceed FAISS_LOCAL_DISK_MAX_BYTES (scans the directory once)."""
+        with self._lock:
+            counted = self._sizes is not None
+        if not counted:
+            self._local_groups()
+        with self._lock:
+            return self._local_bytes > settings.FAISS_LOCAL_DISK_MAX_BYTES
+
+    def evict_cold_files(self) -> int:
+        """
+        Offload least recently used artifacts once local disk use passes
+        FAISS_LOCAL_DISK_MAX_BYTES. All files of one index (vectors, metadata,
+        postings, manifest, ...) are offloaded together. Returns the number of
+        bytes freed.
+
+        Writes and downloads only call this when the running size count says
+        the limit is passed; the directory is then scanned to pick the files.
+        """
+        if not self._enabled:
+            return 0
+
+        with self._evict_lock:
+            groups = self._local_groups()
+            total = sum(stat.st_size for files in groups.values() for _, stat in files)
+            if total <= settings.FAISS_LOCAL_DISK_MAX_BYTES:
+                return 0
+
+            target = settings.FAISS_LOCAL_DISK_MAX_BYTES * _LOW_WATERMARK
+            by_last_use = sorted(
+                groups.values(), key=lambda files: max(stat.st_atime for _, stat in files)
+            )
+            freed = 0
+            for files in by_last_use:
+                if total - freed <= target:
+                    break
+                try:
+                    for path, stat in files:
+                        with self._path_lock(path):
+                            info = self.storage.get_object_info(self._key(path))
+                            if info is None or not self._is_current(path, info):
+                                self._upload(path)
+                    for path, stat in files:
+                        with self._path_lock(path):
+                            os.remove(path)
+                            self._track(path, None)
+                            with self._lock:
+                                self._checked.pop(path, None)
+                        freed += stat.st_size
+                except Exception as exc:
+                    logger.warning("Could not offload %s: %s", files[0][0], exc)
+            return freed
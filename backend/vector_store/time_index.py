@@ -0,0 +1,84 @@
+"""Sorted start/end time arrays for media chunks, used to search a time window.
+
+Stored next to a transcript's FAISS index as ``{file_id}.times``. A chunk
+overlaps the window [start, end] when it starts no later than ``end`` and
+ends no earlier than ``start``; both halves are binary searches over the
+sorted arrays, and their intersection is the chunk-ID subset handed to FAISS
+as an ID selector.
+"""
+
+import os
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+
+class TimeIndex:
+    """Chunk IDs ordered by start time and by end time."""
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        start_ids: np.ndarray,
+        ends: np.ndarray,
+        end_ids: np.ndarray,
+    ):
+        self.starts = starts
+        self.start_ids = start_ids
+        self.ends = ends
+        self.end_ids = end_ids
+
+    @property
+    def nbytes(self) -> int:
+        return self.starts.nbytes + self.start_ids.nbytes + self.ends.nbytes + self.end_ids.nbytes
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> Optional["TimeIndex"]:
+        """Build from metadata rows; None if no row carries a start_time."""
+        starts, ends, ids = [], [], []
+        for position, row in enumerate(rows):
+            start = row.get("start_time")
+            if start is None:
+                continue
+            end = row.get("end_time")
+            starts.append(start)
+            ends.append(start if end is None else end)
+            ids.append(row.get("chunk_id", position))
+        if not ids:
+            return None
+
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        ids = np.asarray(ids, dtype=np.int64)
+        by_start = np.argsort(starts, kind="stable")
+        by_end = np.argsort(ends, kind="stable")
+        return cls(starts[by_start], ids[by_start], ends[by_end], ids[by_end])
+
+    def ids_in_window(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """Sorted IDs of chunks overlapping [start, end] (either bound may be open)."""
+        candidates = self.start_ids
+        if end is not None:
+            candidates = self.start_ids[: np.searchsorted(self.starts, end, side="right")]
+        if start is not None:
+            ending_after = self.end_ids[np.searchsorted(self.ends, start, side="left"):]
+            return np.intersect1d(candidates, ending_after)
+        return np.sort(candidates)
+
+
+def write_time_index(time_index: TimeIndex, path: str) -> None:
+    """Write a time index (atomically)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            starts=time_index.starts,
+            start_ids=time_index.start_ids,
+            ends=time_index.ends,
+            end_ids=time_index.end_ids,
+        )
+    os.replace(tmp_path, path)
+
+
+def read_time_index(path: str) -> TimeIndex:
+    with np.load(path) as data:
+        return TimeIndex(data["starts"], data["start_ids"], data["ends"], data["end_ids"])
@@ -0,0 +1,94 @@
+"""Which files get searched, kept across restarts so a new process can prewarm them.
+
+Every search adds 1 to its file's score, and scores halve every
+USAGE_HALF_LIFE_SECONDS, so ranking by score favours files that are used
+often *and* recently. Each process only keeps its own uses since the last
+``save()``; saving merges them into ``usage.json`` in the index directory,
+so several API processes sharing the directory all contribute.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+USAGE_HALF_LIFE_SECONDS = 24 * 3600.0
+# Entries that have decayed below this are dropped when saving.
+_MIN_SCORE = 0.01
+
+
+def _decayed(score: float, at: float, now: float) -> float:
+    return score * 0.5 ** (max(now - at, 0.0) / USAGE_HALF_LIFE_SECONDS)
+
+
+class UsageLog:
+    """Decaying per-file use counts ("frecency"), persisted to a JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict] = {}
+        self._forgotten: set = set()
+
+    def record(self, file_id: str, owner: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            entry = self._pending.get(file_id)
+            score = _decayed(entry["score"], entry["at"], now) if entry else 0.0
+            self._pending[file_id] = {"owner": owner, "score": score + 1.0, "at": now}
+            self._forgotten.discard(file_id)
+
+    def forget(self, file_id: str) -> None:
+        with self._lock:
+            self._pending.pop(file_id, None)
+            self._forgotten.add(file_id)
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _merged(self, now: float) -> Dict[str, Dict]:
+        entries = {}
+        for source in (self._read(), self._pending):
+            for file_id, entry in source.items():
+                if file_id in self._forgotten:
+                    continue
+                score = _decayed(entry["score"], entry["at"], now)
+                previous = entries.get(file_id)
+                if previous is not None:
+                    score += previous["score"]
+                entries[file_id] = {"owner": entry.get("owner"), "score": score, "at": now}
+        return entries
+
+    def hottest(self, limit: Optional[int] = None) -> List[Tuple[str, Optional[str]]]:
+        """(file_id, owner) pairs, highest score first."""
+        with self._lock:
+            entries = self._merged(time.time())
+        ranked = sorted(entries.items(), key=lambda item: item[1]["score"], reverse=True)
+        return [(file_id, entry["owner"]) for file_id, entry in ranked[:limit]]
+
+    def save(self) -> None:
+        """
+        Merge this process's uses into the file on disk (atomically). Processes
+        with nothing to add leave the file alone, and concurrent savers take
+        turns on an flock so neither drops the other's uses.
+        """
+        with self._lock:
+            if not self._pending and not self._forgotten:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                entries = self._merged(time.time())
+                entries = {k: v for k, v in entries.items() if v["score"] >= _MIN_SCORE}
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            self._pending.clear()
+            self._forgotten.clear()
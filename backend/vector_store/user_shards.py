@@ -0,0 +1,561 @@
+"""Per-user consolidated FAISS shards.
+
+Instead of one index/meta pair per upload, every file owned by a user lives
+in a single shard. Each vector's FAISS label packs the file's slot in the
+shard with the chunk's ID inside that file (``slot << 32 | chunk_id``), so a
+file's vectors form one contiguous label range that can be searched or
+removed with an ID selector.
+
+Deleting a file only tombstones its slot; the vectors are dropped later by
+``compact()`` (run in the background once enough of the shard is dead).
+
+API deletes, worker ingests and compaction run in different processes, so
+every read-modify-write of a shard holds an exclusive ``flock`` on the
+shard's ``.lock`` file next to it.
+
+A shard holds vectors of a single embedding model, recorded in its manifest.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from core.config import settings
+from vector_store.index_cache import IndexCache
+from vector_store.index_factory import (
+    EmbeddingModelMismatch,
+    build_index,
+    read_index,
+    search_parameters,
+    write_index,
+)
+from vector_store.metadata_store import load_metadata, write_metadata
+from vector_store.neighbors import link_chunks
+from vector_store.storage_tier import IndexStorageTier
+
+SLOT_SHIFT = 32
+
+
+def _label_range(slot: int) -> Tuple[int, int]:
+    return slot << SLOT_SHIFT, (slot + 1) << SLOT_SHIFT
+
+
+def _empty_manifest() -> Dict[str, Any]:
+    return {"next_slot": 0, "files": {}, "tombstones": {}}
+
+
+class UserShardStore:
+    """Stores all of a user's file vectors in one FAISS index per user."""
+
+    def __init__(
+        self,
+        shard_dir: str,
+        cache: IndexCache,
+        tier: Optional[IndexStorageTier] = None,
+        rows_only: bool = False,
+    ):
+        self.shard_dir = shard_dir
+        self._cache = cache
+        self._tier = tier or IndexStorageTier(shard_dir, enabled=False)
+        # Set where a sidecar searches the shards: lookups that need only
+        # metadata and the manifest then leave the shard index unloaded.
+        self._rows_only = rows_only
+        self._write_lock = threading.RLock()
+        self._held: Dict[str, int] = {}  # shard name -> nesting depth of _locked()
+
+    def _shard_name(self, owner: str) -> str:
+        return hashlib.sha1(owner.strip().lower().encode("utf-8")).hexdigest()[:20]
+
+    def _paths(self, owner: str) -> Tuple[str, str, str]:
+        base = os.path.join(self.shard_dir, self._shard_name(owner))
+        return f"{base}.index", f"{base}.meta", f"{base}.files.json"
+
+    def _cache_key(self, owner: str) -> str:
+        return f"shard:{self._shard_name(owner)}"
+
+    def _signature(self, owner: str) -> Optional[tuple]:
+        signature = []
+        for path in self._paths(owner):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            signature.extend((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    @contextmanager
+    def _locked(self, owner: str):
+        """Hold the shard exclusively, against other threads and other processes."""
+        with self._write_lock:
+            name = self._shard_name(owner)
+            if self._held.get(name):
+                # Re-entered (append_chunks -> add_file): the flock is already ours.
+                self._held[name] += 1
+                try:
+                    yield
+                finally:
+                    self._held[name] -= 1
+                return
+
+            os.makedirs(self.shard_dir, exist_ok=True)
+            with open(os.path.join(self.shard_dir, f"{name}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._held[name] = 1
+                try:
+                    yield
+                finally:
+                    del self._held[name]
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self, owner: str) -> Dict[str, Any]:
+        path = self._paths(owner)[2]
+        self._tier.ensure_local([path])
+        if not os.path.exists(path):
+            return _empty_manifest()
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, owner: str, manifest: Dict[str, Any]) -> None:
+        path = self._paths(owner)[2]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+        self._tier.publish([path])
+
+    def _load(self, owner: str):
+        """Load (index, metadata, manifest) for an owner's shard, via the LRU cache."""
+        key = self._cache_key(owner)
+        self._tier.ensure_local(self._paths(owner))
+        signature = self._signature(owner)
+        if signature is None:
+            self._cache.invalidate(key)
+            return None
+
+        cached = self._cache.get(key, signature)
+        if cached is not None:
+            return cached
+
+        index_path, meta_path, _ = self._paths(owner)
+        loaded = (
+            read_index(index_path, mmap=settings.FAISS_MMAP),
+            load_metadata(meta_path, mmap=settings.FAISS_MMAP),
+            self._read_manifest(owner),
+        )
+        self._cache.put(key, signature, loaded, nbytes=signature[1] + signature[3])
+        return loaded
+
+    def _load_rows(self, owner: str):
+        """Load (metadata, manifest) for an owner's shard; see ``rows_only``."""
+        if not self._rows_only:
+            loaded = self._load(owner)
+            return None if loaded is None else loaded[1:]
+
+        key = f"shard-rows:{self._shard_name(owner)}"
+        _, meta_path, manifest_path = self._paths(owner)
+        self._tier.ensure_local([meta_path, manifest_path])
+        signature = []
+        for path in (meta_path, manifest_path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._cache.invalidate(key)
+                return None
+            signature.extend((stat.st_mtime_ns, stat.st_size))
+        signature = tuple(signature)
+
+        cached = self._cache.get(key, signature)
+        if cached is not None:
+            return cached
+        loaded = (
+            load_metadata(meta_path, mmap=settings.FAISS_MMAP),
+            self._read_manifest(owner),
+        )
+        self._cache.put(key, signature, loaded, nbytes=signature[1] + signature[3])
+        return loaded
+
+    def _load_for_update(self, owner: str):
+        index_path, meta_path, _ = self._paths(owner)
+        self._tier.ensure_local(self._paths(owner))
+        if not os.path.exists(index_path):
+            return None, [], _empty_manifest()
+        index = read_index(index_path)
+        rows = list(load_metadata(meta_path, mmap=False))
+        return index, rows, self._read_manifest(owner)
+
+    def _save(self, owner: str, index, rows: List[Dict[str, Any]], manifest: Dict[str, Any]) -> None:
+        os.makedirs(self.shard_dir, exist_ok=True)
+        index_path, meta_path, _ = self._paths(owner)
+        rows.sort(key=lambda row: row["label"])
+        write_index(index, index_path)
+        write_metadata(meta_path, link_chunks(rows))
+        self._tier.publish([index_path, meta_path])
+        self._write_manifest(owner, manifest)
+        self._cache.invalidate(self._cache_key(owner))
+
+    @staticmethod
+    def _remove_slot(index, rows: List[Dict[str, Any]], slot: int) -> List[Dict[str, Any]]:
+        low, high = _label_range(slot)
+        index.remove_ids(faiss.IDSelectorRange(low, high))
+        return [row for row in rows if not low <= row["label"] < high]
+
+    def warm(self, owner: str) -> Tuple[str, str, str]:
+        """Load an owner's shard into the cache. Returns the shard's file paths."""
+        self._load(owner)
+        return self._paths(owner)
+
+    def has_file(self, owner: str, file_id: str) -> bool:
+        loaded = self._load_rows(owner)
+        return loaded is not None and file_id in loaded[1]["files"]
+
+    def embedding_model(self, owner: str) -> Optional[str]:
+        """The embedding model the shard's vectors came from (None if untagged)."""
+        loaded = self._load_rows(owner)
+        return loaded[1].get("embedding_model") if loaded is not None else None
+
+    @staticmethod
+    def _tag_model(
+        manifest: Dict[str, Any],
+        file_id: str,
+        embedding_model: Optional[str],
+        replacing: bool = False,
+    ) -> None:
+        """
+        Record the writer's embedding model, refusing to mix models among the
+        shard's live files (tombstoned vectors are never searched). When
+        ``replacing`` the file, its own old vectors do not count.
+        """
+        if not embedding_model:
+            return
+        indexed = manifest.get("embedding_model")
+        live = [other for other in manifest["files"] if not (replacing and other == file_id)]
+        if indexed and indexed != embedding_model and live:
+            raise EmbeddingModelMismatch(file_id, indexed, embedding_model)
+        manifest["embedding_model"] = embedding_model
+
+    def add_file(
+        self,
+        owner: str,
+        file_id: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, Any]],
+        embedding_model: Optional[str] = None,
+        chunk_ids: Optional[List[int]] = None,
+    ) -> List[int]:
+        """
+        Store (or replace) a file's chunks in its owner's shard. Returns chunk IDs.
+
+        Chunks are numbered 0..n-1 unless ``chunk_ids`` are given (e.g. when a
+        per-file index is migrated, so its keyword postings stay valid).
+        """
+        if len(embeddings) == 0:
+            return []
+
+        with self._locked(owner):
+            index, rows, manifest = self._load_for_update(owner)
+            self._tag_model(manifest, file_id, embedding_model, replacing=True)
+            stale = manifest["tombstones"].pop(file_id, None)
+            if stale is not None and index is not None:
+                rows = self._remove_slot(index, rows, stale["slot"])
+
+            entry = manifest["files"].get(file_id)
+            if entry is not None and index is not None:
+                rows = self._remove_slot(index, rows, entry["slot"])
+                slot = entry["slot"]
+            else:
+                slot = manifest["next_slot"]
+                manifest["next_slot"] += 1
+
+            if chunk_ids is None:
+                chunk_ids = np.arange(len(embeddings), dtype=np.int64)
+            else:
+                chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+            labels = (slot << SLOT_SHIFT) | chunk_ids
+            vectors = np.array(embeddings, dtype=np.float32)
+            if index is not None and index.d != vectors.shape[1]:
+                if set(manifest["files"]) - {file_id}:
+                    raise ValueError("Embedding dimension does not match the shard's index")
+                # Only dead vectors of another model are left; start the shard afresh.
+                index, rows, manifest["tombstones"] = None, [], {}
+            if index is None:
+                index = build_index(vectors, ids=labels)
+            else:
+                index.add_with_ids(vectors, labels)
+
+            rows.extend(
+                dict(meta, file_id=file_id, chunk_id=int(chunk_id), label=int(label))
+                for meta, chunk_id, label in zip(metadata, chunk_ids, labels)
+            )
+            manifest["files"][file_id] = {
+                "slot": slot,
+                "count": len(embeddings),
+                "next_chunk": int(chunk_ids.max()) + 1,
+            }
+            self._save(owner, index, rows, manifest)
+        return chunk_ids.tolist()
+
+    def append_chunks(
+        self,
+        owner: str,
+        file_id: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, Any]],
+        embedding_model: Optional[str] = None,
+    ) -> List[int]:
+        """Append chunks to a file already in the shard. Returns the new chunk IDs."""
+        if len(embeddings) == 0:
+            return []
+
+        with self._locked(owner):
+            index, rows, manifest = self._load_for_update(owner)
+            entry = manifest["files"].get(file_id)
+            if entry is None or index is None:
+                return self.add_file(owner, file_id, embeddings, metadata, embedding_model)
+            self._tag_model(manifest, file_id, embedding_model)
+
+            start = entry["next_chunk"]
+            chunk_ids = np.arange(start, start + len(embeddings), dtype=np.int64)
+            labels = (entry["slot"] << SLOT_SHIFT) | chunk_ids
+            index.add_with_ids(np.array(embeddings, dtype=np.float32), labels)
+
+            rows.extend(
+                dict(meta, file_id=file_id, chunk_id=int(chunk_id), label=int(label))
+                for meta, chunk_id, label in zip(metadata, chunk_ids, labels)
+            )
+            entry["count"] += len(embeddings)
+            entry["next_chunk"] += len(embeddings)
+            self._save(owner, index, rows, manifest)
+        return chunk_ids.tolist()
+
+    def remove_chunks(self, owner: str, file_id: str, chunk_ids: List[int]) -> int:
+        """Remove chunks of one file by chunk ID. Returns the count removed."""
+        with self._locked(owner):
+            index, rows, manifest = self._load_for_update(owner)
+            entry = manifest["files"].get(file_id)
+            if entry is None or index is None or not chunk_ids:
+                return 0
+
+            labels = {(entry["slot"] << SLOT_SHIFT) | int(chunk_id) for chunk_id in chunk_ids}
+            removed = int(index.remove_ids(np.array(sorted(labels), dtype=np.int64)))
+            if removed:
+                rows = [row for row in rows if row["label"] not in labels]
+                entry["count"] -= removed
+                self._save(owner, index, rows, manifest)
+        return removed
+
+    def delete_file(self, owner: str, file_id: str) -> None:
+        """Tombstone a file; its vectors are dropped on the next compaction."""
+        with self._locked(owner):
+            manifest = self._read_manifest(owner)
+            entry = manifest["files"].pop(file_id, None)
+            if entry is None:
+                return
+            manifest["tombstones"][file_id] = entry
+            self._write_manifest(owner, manifest)
+            self._cache.invalidate(self._cache_key(owner))
+
+    def needs_compaction(self, owner: str) -> bool:
+        """True once tombstoned vectors make up FAISS_SHARD_COMPACT_RATIO of the shard."""
+        manifest = self._read_manifest(owner)
+        dead = sum(entry["count"] for entry in manifest["tombstones"].values())
+        live = sum(entry["count"] for entry in manifest["files"].values())
+        if dead == 0:
+            return False
+        return dead / float(dead + live) >= settings.FAISS_SHARD_COMPACT_RATIO
+
+    def compact(self, owner: str) -> int:
+        """Physically remove tombstoned files from the shard. Returns vectors removed."""
+        with self._locked(owner):
+            index, rows, manifest = self._load_for_update(owner)
+            if index is None or not manifest["tombstones"]:
+                return 0
+
+            before = index.ntotal
+            for entry in manifest["tombstones"].values():
+                rows = self._remove_slot(index, rows, entry["slot"])
+            manifest["tombstones"] = {}
+            self._save(owner, index, rows, manifest)
+            return before - index.ntotal
+
+    def get_chunks(self, owner: str, file_id: str, chunk_ids: List[int]) -> List[Dict[str, Any]]:
+        """Metadata rows of a file's chunks, in the given order (unknown IDs skipped)."""
+        loaded = self._load_rows(owner)
+        if loaded is None:
+            return []
+        metadata, manifest = loaded
+        entry = manifest["files"].get(file_id)
+        if entry is None:
+            return []
+
+        labels = (entry["slot"] << SLOT_SHIFT) | np.asarray(chunk_ids, dtype=np.int64)
+        chunks = []
+        for row in metadata.find_rows("label", labels):
+            if row >= 0:
+                chunk = dict(metadata[int(row)])
+                chunk.pop("label", None)
+                chunks.append(chunk)
+        return chunks
+
+    def search(
+        self,
+        owner: str,
+        query_embedding: List[float],
+        top_k: int = 5,
+        file_ids: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search an owner's shard, optionally restricted to some of their files.
+        Tombstoned files are always excluded.
+        """
+        return self.search_batch(owner, [query_embedding], top_k, file_ids=file_ids)[0]
+
+    def get_vectors(self, owner: str, file_id: str, chunk_ids: List[int]) -> Optional[np.ndarray]:
+        """Stored vectors of a file's chunks, in the given order (None if any is unknown)."""
+        loaded = self._load(owner)
+        if loaded is None or file_id not in loaded[2]["files"]:
+            return None
+        index, slot = loaded[0], loaded[2]["files"][file_id]["slot"]
+        try:
+            return np.vstack(
+                [index.reconstruct((slot << SLOT_SHIFT) | int(chunk_id)) for chunk_id in chunk_ids]
+            )
+        except RuntimeError:
+            return None
+
+    def window_labels(
+        self,
+        metadata,
+        slot: int,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> np.ndarray:
+        """Labels of one file's chunks overlapping [start_time, end_time]."""
+        labels = metadata.column("label")
+        starts = metadata.column("start_time")
+        if starts is None:
+            return np.zeros(0, dtype=np.int64)
+
+        # Rows are sorted by label, so a file's rows form one contiguous run.
+        low, high = np.searchsorted(labels, _label_range(slot))
+        starts = np.asarray(starts[low:high], dtype=np.float64)
+        ends = metadata.column("end_time")
+        ends = starts if ends is None else np.asarray(ends[low:high], dtype=np.float64)
+        ends = np.where(np.isnan(ends), starts, ends)
+
+        mask = ~np.isnan(starts)
+        if end_time is not None:
+            mask &= starts <= end_time
+        if start_time is not None:
+            mask &= ends >= start_time
+        return np.ascontiguousarray(labels[low:high][mask], dtype=np.int64)
+
+    def chunk_ids_in_window(
+        self,
+        owner: str,
+        file_id: str,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> np.ndarray:
+        """Chunk IDs of a file's chunks overlapping [start_time, end_time]."""
+        loaded = self._load_rows(owner)
+        if loaded is None or file_id not in loaded[1]["files"]:
+            return np.zeros(0, dtype=np.int64)
+        slot = loaded[1]["files"][file_id]["slot"]
+        labels = self.window_labels(loaded[0], slot, start_time, end_time)
+        return labels & ((1 << SLOT_SHIFT) - 1)
+
+    def chunk_ids_on_pages(self, owner: str, file_id: str, pages: np.ndarray) -> List[int]:
+        """Chunk IDs of a file's chunks cut from any of ``pages``."""
+        loaded = self._load_rows(owner)
+        if loaded is None or file_id not in loaded[1]["files"]:
+            return []
+        metadata, manifest = loaded
+        page_column = metadata.column("page")
+        if page_column is None:
+            return []
+        labels = metadata.column("label")
+        low, high = np.searchsorted(labels, _label_range(manifest["files"][file_id]["slot"]))
+        mask = np.isin(page_column[low:high], pages)
+        return [int(label) & ((1 << SLOT_SHIFT) - 1) for label in labels[low:high][mask]]
+
+    def search_batch(
+        self,
+        owner: str,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        file_ids: Optional[List[str]] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Batched form of search(): one result list per query. A time window
+        restricts the search to chunks overlapping it.
+        """
+        empty = [[] for _ in query_embeddings]
+        loaded = self._load(owner)
+        if loaded is None:
+            return empty
+        index, metadata, manifest = loaded
+
+        live = manifest["files"]
+        targets = list(live) if file_ids is None else [f for f in file_ids if f in live]
+        if not targets or index.ntotal == 0:
+            return empty
+
+        selector, candidates = None, index.ntotal
+        if start_time is not None or end_time is not None:
+            allowed = np.concatenate(
+                [
+                    self.window_labels(metadata, live[file_id]["slot"], start_time, end_time)
+                    for file_id in targets
+                ]
+            )
+            if len(allowed) == 0:
+                return empty
+            selector = faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(allowed))
+            candidates = len(allowed)
+        elif file_ids is not None or manifest["tombstones"]:
+            slots = [live[file_id]["slot"] for file_id in targets]
+            selector = self._selector(slots, metadata.column("label"))
+
+        query_vectors = np.array(query_embeddings, dtype=np.float32)
+        distances, labels = index.search(
+            query_vectors,
+            min(top_k, candidates),
+            params=search_parameters(index, selector),
+        )
+
+        batch = []
+        for query_distances, query_labels in zip(distances, labels):
+            rows = metadata.find_rows("label", query_labels)
+            results = []
+            for dist, row in zip(query_distances, rows):
+                if row < 0:
+                    continue
+                result = {**metadata[row], "score": float(dist)}
+                result.pop("label", None)
+                results.append(result)
+            batch.append(results)
+        return batch
+
+    @staticmethod
+    def _selector(slots: List[int], labels: np.ndarray):
+        """ID selector admitting only the given file slots."""
+        if len(slots) <= 8:
+            # IDSelectorOr keeps Python references to its children, so chaining is safe.
+            selector = faiss.IDSelectorRange(*_label_range(slots[0]))
+            for slot in slots[1:]:
+                selector = faiss.IDSelectorOr(
+                    selector, faiss.IDSelectorRange(*_label_range(slot))
+                )
+            return selector
+
+        allowed = np.ascontiguousarray(labels[np.isin(labels >> SLOT_SHIFT, slots)])
+        return faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(allowed))